@@ -0,0 +1,165 @@
+# app/async_db.py
+
+"""
+Async SQLAlchemy sessions for the async views and the chat WebSockets.
+
+Flask runs every async view on an event loop of its own, and asyncpg
+connections are bound to the loop that opened them, so the engine does
+not pool: each session opens a connection and closes it at the end.
+At most ASYNC_DB_MAX_CONNECTIONS sessions per process (per engine) are
+open at a time, whichever loop they run on; the rest wait for a slot.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator
+
+from flask import Flask, current_app
+from sqlalchemy.engine import make_url
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+# Sync driver -> async driver used by the async views
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(sync_url: str) -> str:
+    """
+    Derive the async driver URL from SQLALCHEMY_DATABASE_URI.
+    """
+    url = make_url(sync_url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise RuntimeError(f"No async driver configured for {url.drivername}")
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def _grant(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Slots:
+    """
+    A counting semaphore shared by every event loop and thread of the
+    process (asyncio.Semaphore belongs to a single loop).
+    """
+
+    def __init__(self, size: int):
+        self._free = size
+        self._lock = threading.Lock()
+        self._waiters: deque = deque()  # (loop, future)
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = (loop, waiter) in self._waiters
+                if queued:
+                    self._waiters.remove((loop, waiter))
+            if not queued:
+                # Handed a slot as we were cancelled: pass it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._free += 1
+                    return
+                loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(_grant, waiter)
+                return
+            except RuntimeError:
+                # Its loop is closed, so nobody is waiting there any more
+                continue
+
+
+def init_async_db(app: Flask) -> None:
+    """
+    Register the async engine config on the app.
+    The engine itself is created on first use.
+    """
+    app.config.setdefault(
+        "ASYNC_DATABASE_URL",
+        async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]),
+    )
+    app.extensions["async_db"] = None
+    app.extensions["async_db_slots"] = Slots(app.config["ASYNC_DB_MAX_CONNECTIONS"])
+
+    if app.config.get("DATABASE_REPLICA_URL"):
+        app.config.setdefault(
+            "ASYNC_REPLICA_URL",
+            async_database_url(app.config["DATABASE_REPLICA_URL"]),
+        )
+        app.extensions["async_db_replica"] = None
+        app.extensions["async_db_replica_slots"] = Slots(app.config["ASYNC_DB_MAX_CONNECTIONS"])
+
+
+def _session_factory(replica: bool = False) -> async_sessionmaker[AsyncSession]:
+    if replica:
+        key, url_key = "async_db_replica", "ASYNC_REPLICA_URL"
+    else:
+        key, url_key = "async_db", "ASYNC_DATABASE_URL"
+    factory = current_app.extensions.get(key)
+    if factory is None:
+        # Imported here: sqlalchemy.ext.asyncio pulls in greenlet and the
+        # async driver, which sync-only workers never need.
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from sqlalchemy.pool import NullPool
+
+        # NullPool: Flask runs every async view on its own event loop,
+        # and pooled asyncpg connections are bound to the loop that opened them.
+        engine = create_async_engine(
+            current_app.config[url_key],
+            poolclass=NullPool,
+        )
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        current_app.extensions[key] = factory
+    return factory
+
+
+@asynccontextmanager
+async def async_session(read_only: bool = False) -> AsyncIterator[AsyncSession]:
+    """
+    Usage:
+        async with async_session() as session:
+            user = await session.get(User, user_id)
+
+    An AsyncSession runs one statement at a time; open one session per
+    concurrent branch when fanning out with asyncio.gather.
+
+    read_only=True sessions use the read replica when app/db_routing.py
+    allows it for this request. Never write through them.
+
+    Each session holds one of ASYNC_DB_MAX_CONNECTIONS slots until it
+    closes, so do not open a second session while holding one.
+    """
+    from app.db_routing import can_read_replica
+
+    replica = read_only and can_read_replica()
+    slots = current_app.extensions["async_db_replica_slots" if replica else "async_db_slots"]
+    await slots.acquire()
+    try:
+        async with _session_factory(replica=replica)() as session:
+            yield session
+    finally:
+        slots.release()
@@ -0,0 +1,233 @@
+# app/cli.py
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import click
+from flask.cli import with_appcontext
+
+# Runs in a fresh interpreter so nothing is already imported
+_STARTUP_PROBE = (
+    "import time\n"
+    "t0 = time.perf_counter()\n"
+    "from app import create_app\n"
+    "t1 = time.perf_counter()\n"
+    "create_app()\n"
+    "t2 = time.perf_counter()\n"
+    "print('STARTUP', t1 - t0, t2 - t1)\n"
+)
+
+# "import time:       412 |        913 |     flask.json"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """
+    Parse `python -X importtime` output into
+    [{ module, self_us, cumulative_us, depth }, ...].
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        rows.append(
+            {
+                "module": module,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                # importtime indents nested imports by two spaces
+                "depth": max(len(indent) - 1, 0) // 2,
+            }
+        )
+    return rows
+
+
+def summarize_importtime(rows: list[dict], top: int) -> dict:
+    by_package: dict[str, int] = defaultdict(int)
+    for row in rows:
+        by_package[row["module"].split(".")[0]] += row["self_us"]
+
+    return {
+        "total_import_us": sum(r["self_us"] for r in rows),
+        "modules": len(rows),
+        "top_packages": sorted(
+            ({"package": k, "self_us": v} for k, v in by_package.items()),
+            key=lambda r: r["self_us"],
+            reverse=True,
+        )[:top],
+        "top_modules": sorted(rows, key=lambda r: r["self_us"], reverse=True)[:top],
+    }
+
+
+@click.command("startup-report")
+@click.option("--top", default=20, show_default=True, help="Rows per table.")
+@click.option("--json", "as_json", is_flag=True, help="Machine-readable output.")
+def startup_report(top: int, as_json: bool) -> None:
+    """
+    Cold-start breakdown of `from app import create_app; create_app()`.
+
+    Spawns `python -X importtime` in a clean interpreter (same env, so
+    ENABLE_AI_ROUTES etc. apply) and reports where the time went.
+    """
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _STARTUP_PROBE],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise click.ClickException(proc.stderr.strip().splitlines()[-1])
+
+    import_s, create_app_s = (
+        float(v) for v in proc.stdout.split("STARTUP", 1)[1].split()
+    )
+    report = {
+        "import_app_ms": round(import_s * 1000, 2),
+        "create_app_ms": round(create_app_s * 1000, 2),
+        **summarize_importtime(parse_importtime(proc.stderr), top),
+    }
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(f"import app:   {report['import_app_ms']:9.2f} ms")
+    click.echo(f"create_app(): {report['create_app_ms']:9.2f} ms")
+    click.echo(
+        f"imports:      {report['total_import_us'] / 1000:9.2f} ms "
+        f"across {report['modules']} modules"
+    )
+    click.echo("\nTop packages (self time):")
+    for row in report["top_packages"]:
+        click.echo(f"  {row['self_us'] / 1000:9.2f} ms  {row['package']}")
+    click.echo("\nTop modules (self time):")
+    for row in report["top_modules"]:
+        click.echo(
+            f"  {row['self_us'] / 1000:9.2f} ms  "
+            f"(cumulative {row['cumulative_us'] / 1000:8.2f} ms)  {row['module']}"
+        )
+
+
+@click.command("bulk-import")
+@click.argument("kind", type=click.Choice(["medications", "appointments"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--doctor", "doctor_email", required=True,
+              help="Email of the prescribing / booking doctor.")
+@click.option("--dry-run", is_flag=True, help="Validate only; write nothing.")
+@click.option("--json", "as_json", is_flag=True, help="Machine-readable output.")
+@with_appcontext
+def bulk_import_command(kind: str, path: str, doctor_email: str, dry_run: bool,
+                        as_json: bool) -> None:
+    """
+    Import medications or appointments from a CSV or JSON file, the same
+    way POST /medications/bulk and /appointments/bulk do.
+    """
+    from app import db
+    from app.services import bulk_import
+    from app.sql_models import Doctor, User
+
+    doctor = (
+        db.session.query(Doctor)
+        .join(User, User.id == Doctor.id)
+        .filter(User.email == doctor_email.strip().lower())
+        .first()
+    )
+    if doctor is None:
+        raise click.ClickException(f"No doctor with email {doctor_email}")
+
+    try:
+        rows = bulk_import.read_file_rows(path)
+    except (ValueError, json.JSONDecodeError) as e:
+        raise click.ClickException(str(e))
+
+    started = time.perf_counter()
+    importer = (
+        bulk_import.import_medications if kind == "medications"
+        else bulk_import.import_appointments
+    )
+    result = importer(rows, doctor.id, dry_run=dry_run)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    report = {**result.to_dict(), "seconds": round(time.perf_counter() - started, 3)}
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(
+        f"{report['inserted']} of {report['received']} rows imported "
+        f"in {report['seconds']} s ({report['error_count']} errors)"
+    )
+    for error in report["errors"]:
+        click.echo(f"  row {error['row']}: {error['error']}")
+
+
+@click.command("make-admin")
+@click.argument("email")
+@with_appcontext
+def make_admin(email: str) -> None:
+    """
+    Give an existing account the admin role (e.g. exports of all patients).
+    Admins cannot sign up through /auth/register.
+    """
+    from app import db
+    from app.sql_models import User
+
+    user = User.query.filter_by(email=email.strip().lower()).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    user.role = "admin"
+    db.session.commit()
+    click.echo(f"{user.email} is now an admin")
+
+
+@click.command("maintain-partitions")
+@click.option("--skip-retention", is_flag=True, help="Only create upcoming partitions.")
+@with_appcontext
+def maintain_partitions(skip_retention: bool) -> None:
+    """
+    Create upcoming monthly partitions of medication_events and
+    chat_messages, then archive and drop the ones past retention, prune
+    change_log entries past CHANGE_LOG_RETENTION_DAYS and delete expired
+    exports. Meant to run daily from cron.
+    """
+    from flask import current_app
+
+    from app.services import change_log, exports, partitions
+
+    for name in partitions.ensure_partitions(current_app):
+        click.echo(f"created {name}")
+    if skip_retention:
+        return
+    for path in partitions.apply_retention(current_app):
+        click.echo(f"archived {path}")
+    pruned = change_log.prune(current_app)
+    if pruned:
+        click.echo(f"pruned {pruned} change_log entries")
+    expired = exports.prune(current_app)
+    if expired:
+        click.echo(f"deleted {expired} expired exports")
+
+
+@click.command("build-lexicon")
+@click.option("--dir", "directory", default=None, help="Output directory (default: LEXICON_DIR).")
+def build_lexicon(directory) -> None:
+    """
+    Compile the symptom lexicon used by health_insights. Run on deploy so
+    the first request does not pay for it.
+    """
+    from app.services import lexicon
+
+    click.echo(lexicon.build(directory))
@@ -0,0 +1,248 @@
+# app/db_routing.py
+
+"""
+Read-replica routing for db.session (DATABASE_REPLICA_URL).
+
+GET and HEAD requests read from the replica. Everything else uses the
+primary:
+
+- requests with any other method;
+- the rest of a request once it has flushed a write;
+- GETs from a user who wrote within READ_YOUR_WRITES_SECONDS, so people
+  see their own changes immediately;
+- views marked @primary_only;
+- all reads while the replica is more than REPLICA_MAX_LAG_SECONDS
+  behind or unreachable. Lag is measured at most every
+  REPLICA_LAG_CHECK_SECONDS and exported as viora_db_replica_lag_seconds.
+
+Code outside a request (background jobs, CLI) uses the primary unless it
+opts in with `with replica_reads():`.
+
+The read-your-writes window is kept per worker process. A user whose
+next GET lands on another worker within the window can still read from
+a replica that is up to REPLICA_MAX_LAG_SECONDS behind.
+"""
+
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator, Optional
+
+import jwt
+from flask import Flask, current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = "replica"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_LAG_QUERY = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    " END"
+)
+
+# Replica health, shared by the threads of this process
+_health_lock = threading.Lock()
+_checked_at: Optional[float] = None
+_healthy = False
+
+# user id -> monotonic deadline of their read-your-writes window
+_recent_writers: dict[str, float] = {}
+_writers_lock = threading.Lock()
+_MAX_TRACKED_WRITERS = 50_000
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to the replica bind while the current request (or a
+    replica_reads() block) allows it.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get("_db_route") == "replica":
+            if self._flushing or isinstance(clause, UpdateBase):
+                # First write: stay on the primary for the rest of the request
+                g._db_route = "primary"
+                g._db_wrote = True
+            else:
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    return engine
+        elif has_app_context() and (self._flushing or isinstance(clause, UpdateBase)):
+            g._db_wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def primary_only(view):
+    """
+    Mark a GET view that must read from the primary (e.g. sync cursors).
+    """
+    view._db_primary_only = True
+    return view
+
+
+def _user_key() -> Optional[str]:
+    from app.routes.routes_auth import JWT_ALG, JWT_SECRET
+
+    token = request.headers.get("Authorization", "").replace("Bearer ", "").strip()
+    if not token:
+        return None
+    try:
+        return str(jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG]).get("user_id"))
+    except jwt.PyJWTError:
+        return None
+
+
+def _wrote_recently(user: Optional[str]) -> bool:
+    if user is None:
+        return False
+    deadline = _recent_writers.get(user)
+    return deadline is not None and deadline > monotonic()
+
+
+def _remember_write(user: str) -> None:
+    now = monotonic()
+    with _writers_lock:
+        if len(_recent_writers) >= _MAX_TRACKED_WRITERS:
+            for key in [k for k, deadline in _recent_writers.items() if deadline <= now]:
+                del _recent_writers[key]
+        _recent_writers[user] = now + current_app.config["READ_YOUR_WRITES_SECONDS"]
+
+
+def _mark_unhealthy(exception_context) -> None:
+    """
+    Replica connection failures switch reads to the primary until the
+    next lag check, instead of failing every request until then.
+    """
+    global _healthy, _checked_at
+    dbapi = exception_context.dialect.dbapi
+    if exception_context.is_disconnect or isinstance(
+        exception_context.original_exception, dbapi.OperationalError
+    ):
+        _healthy = False
+        _checked_at = monotonic()
+
+
+def replica_healthy() -> bool:
+    """
+    Cached replica health; re-measures lag at most every
+    REPLICA_LAG_CHECK_SECONDS, in one thread at a time.
+    """
+    global _healthy, _checked_at
+    config = current_app.config
+    if _checked_at is not None and monotonic() - _checked_at < config["REPLICA_LAG_CHECK_SECONDS"]:
+        return _healthy
+    if not _health_lock.acquire(blocking=False):
+        return _healthy
+    try:
+        from app import db
+        from app.metrics import DB_REPLICA_LAG
+
+        try:
+            with db.engines[REPLICA_BIND].connect() as connection:
+                lag = float(connection.execute(_LAG_QUERY).scalar())
+            DB_REPLICA_LAG.set(lag)
+            _healthy = lag <= config["REPLICA_MAX_LAG_SECONDS"]
+            if not _healthy:
+                print(f"replica {lag:.1f}s behind; reading from primary")
+        except Exception as e:
+            print("replica check failed; reading from primary:", e)
+            _healthy = False
+        _checked_at = monotonic()
+        return _healthy
+    finally:
+        _health_lock.release()
+
+
+def replica_enabled() -> bool:
+    return bool(current_app.config.get("DATABASE_REPLICA_URL"))
+
+
+def can_read_replica() -> bool:
+    """
+    Whether an explicitly read-only query may use the replica now:
+    configured, healthy, and the user has no write in flight.
+    """
+    if not replica_enabled():
+        return False
+    if has_request_context() and _wrote_recently(g.get("_db_user")):
+        return False
+    return replica_healthy()
+
+
+@contextmanager
+def replica_reads() -> Iterator[None]:
+    """
+    Route this block's reads to the replica when it is usable.
+    """
+    previous = g.get("_db_route")
+    if replica_enabled() and replica_healthy():
+        g._db_route = "replica"
+    try:
+        yield
+    finally:
+        g._db_route = previous
+
+
+def _choose_route():
+    if not replica_enabled():
+        return
+    g._db_user = _user_key()
+    view = current_app.view_functions.get(request.endpoint)
+    if (
+        request.method in ("GET", "HEAD")
+        and not getattr(view, "_db_primary_only", False)
+        and not _wrote_recently(g._db_user)
+        and replica_healthy()
+    ):
+        g._db_route = "replica"
+    else:
+        g._db_route = "primary"
+
+    from app.metrics import DB_ROUTED_REQUESTS
+
+    DB_ROUTED_REQUESTS.labels(g._db_route).inc()
+
+
+def _track_writes(response):
+    user = g.get("_db_user")
+    if user and response.status_code < 400 and (
+        g.get("_db_wrote") or request.method not in SAFE_METHODS
+    ):
+        _remember_write(user)
+    return response
+
+
+def init_db_routing(app: Flask) -> None:
+    """
+    Register the replica bind. Call before db.init_app.
+    """
+    url = app.config.get("DATABASE_REPLICA_URL")
+    if not url:
+        return
+    app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = url
+
+    app.before_request(_choose_route)
+    app.after_request(_track_writes)
+
+
+def init_replica_engine(app: Flask) -> None:
+    """
+    Hook replica connection errors into the health state. Call after
+    db.init_app.
+    """
+    if not app.config.get("DATABASE_REPLICA_URL"):
+        return
+    from app import db
+
+    with app.app_context():
+        engine = db.engines[REPLICA_BIND]
+    if not event.contains(engine, "handle_error", _mark_unhealthy):
+        event.listen(engine, "handle_error", _mark_unhealthy)
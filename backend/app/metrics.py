@@ -0,0 +1,254 @@
+# app/metrics.py
+
+"""
+Prometheus metrics for routes, the DB and the remote AI services.
+
+Multiprocess workers: set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+directory before the workers start. prometheus_client then keeps each
+process's samples in mmap'd files in that directory, and /metrics
+aggregates them. Wipe the directory on deploy. Call
+prometheus_client.multiprocess.mark_process_dead(pid) from the process
+manager when a worker exits.
+"""
+
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator, Optional
+
+from flask import Flask, Response, g, has_app_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+REQUEST_LATENCY = Histogram(
+    "viora_http_request_duration_seconds",
+    "Request latency by blueprint and route.",
+    ["blueprint", "endpoint", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "viora_http_requests_in_flight",
+    "Requests currently being handled.",
+    ["blueprint"],
+    multiprocess_mode="livesum",
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "viora_db_queries_per_request",
+    "SQL statements executed per request.",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "viora_db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool (includes connecting when the pool grows).",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+DB_REPLICA_LAG = Gauge(
+    "viora_db_replica_lag_seconds",
+    "Replication lag of the read replica at the last check.",
+    multiprocess_mode="max",
+)
+DB_ROUTED_REQUESTS = Counter(
+    "viora_db_routed_requests_total",
+    "Requests by the database their reads were routed to.",
+    ["target"],
+)
+RATE_LIMITED_REQUESTS = Counter(
+    "viora_rate_limited_requests_total",
+    "Requests refused with 429 by endpoint and caller kind (user or ip).",
+    ["endpoint", "caller"],
+)
+SINGLE_FLIGHT_COALESCED = Counter(
+    "viora_single_flight_coalesced_total",
+    "Calls answered by an identical in-flight call, in this process (local) or another worker (shared).",
+    ["namespace", "scope"],
+)
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "viora_semantic_cache_lookups_total",
+    "Semantic answer cache lookups by result (hit, miss, skip = not eligible).",
+    ["result"],
+)
+MODEL_ATTEMPTS = Counter(
+    "viora_model_attempts_total",
+    "OpenRouter requests by model, why they were sent (primary, hedge, fallback) and outcome.",
+    ["model", "kind", "outcome"],
+)
+MODEL_TOKENS = Counter(
+    "viora_model_tokens_total",
+    "Tokens reported by the central backend and model providers (kind: prompt, completion).",
+    ["target", "model", "kind"],
+)
+CHAT_CONNECTIONS = Gauge(
+    "viora_chat_connections",
+    "Open doctor chat WebSocket connections.",
+    multiprocess_mode="livesum",
+)
+CHAT_MESSAGES = Counter(
+    "viora_chat_messages_total",
+    "Doctor chat messages stored.",
+)
+CHAT_DISCONNECTS = Counter(
+    "viora_chat_disconnects_total",
+    "Doctor chat connections closed by the server (reason: slow_consumer).",
+    ["reason"],
+)
+EXTERNAL_CALL_LATENCY = Histogram(
+    "viora_external_call_duration_seconds",
+    "Latency of calls to the central backend and model providers.",
+    ["target"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "viora_external_call_errors_total",
+    "Failed calls to the central backend and model providers.",
+    ["target"],
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts wait.
+    """
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(perf_counter() - start)
+
+
+class _ExternalCall:
+    __slots__ = ("failed", "model", "usage", "attribution")
+
+    def __init__(self):
+        self.failed = False
+        self.model = None
+        self.usage = None
+        self.attribution = None
+
+    def fail(self) -> None:
+        """
+        Mark the call failed when the caller swallows the error.
+        """
+        self.failed = True
+
+    def report_usage(self, usage, model: Optional[str] = None) -> None:
+        """
+        The response's usage object (prompt_tokens, completion_tokens,
+        optionally cost) and the model that answered, for
+        app/services/usage.py.
+        """
+        if isinstance(usage, dict):
+            self.usage = usage
+        if model:
+            self.model = model
+
+
+@contextmanager
+def external_call(target: str, model: Optional[str] = None) -> Iterator[_ExternalCall]:
+    """
+    Usage:
+        with external_call("central_backend") as call:
+            try:
+                ...
+            except requests.RequestException:
+                call.fail()
+                return fallback
+    """
+    from app.services import usage
+
+    call = _ExternalCall()
+    call.model = model
+    call.attribution = usage.current()
+    start = perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.failed = True
+        raise
+    finally:
+        seconds = perf_counter() - start
+        EXTERNAL_CALL_LATENCY.labels(target).observe(seconds)
+        if call.failed:
+            EXTERNAL_CALL_ERRORS.labels(target).inc()
+        usage.record(target, call.model, seconds, call.failed, call.usage, call.attribution)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        count = g.get("_metrics_queries")
+        if count is not None:
+            g._metrics_queries = count + 1
+
+
+def _before_request():
+    blueprint = request.blueprint or "app"
+    REQUESTS_IN_FLIGHT.labels(blueprint).inc()
+    g._metrics_blueprint = blueprint
+    g._metrics_queries = 0
+    g._metrics_start = perf_counter()
+
+
+def _after_request(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return
+    blueprint = g.pop("_metrics_blueprint")
+    endpoint = request.endpoint or "unmatched"
+
+    REQUESTS_IN_FLIGHT.labels(blueprint).dec()
+    REQUEST_LATENCY.labels(
+        blueprint, endpoint, request.method, str(g.pop("_metrics_status", 500))
+    ).observe(perf_counter() - start)
+    DB_QUERIES_PER_REQUEST.labels(endpoint).observe(g.pop("_metrics_queries", 0))
+
+
+def _registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view():
+    return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app: Flask) -> None:
+    """
+    Wire request hooks, SQL counting and GET /metrics into the app.
+    Call before db.init_app (pool class) and before any other
+    before_request hooks, so every request is counted.
+    """
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"):
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {}).setdefault(
+            "poolclass", InstrumentedQueuePool
+        )
+
+    if not event.contains(Engine, "before_cursor_execute", _count_query):
+        event.listen(Engine, "before_cursor_execute", _count_query)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
@@ -0,0 +1,387 @@
+# app/profiler.py
+
+"""
+On-demand sampling profiler and tracemalloc diagnostics for live workers.
+
+Enabled only when PROFILER_TOKEN is set. Every entry point requires the
+token in the X-Profiler-Token header.
+
+Single request:
+    Send any request with X-Profiler-Token. The worker samples the thread
+    handling it (and the event-loop thread of an async view) and writes
+    the collapsed stacks to instance/profiles/<id>.folded. The response
+    carries X-Profile-Id. Fetch the file with
+    GET /admin/profiler/profiles/<id>.
+
+Time window:
+    POST /admin/profiler/sample?seconds=10&interval_ms=5
+    Samples every thread of the worker that serves it. Idle threads are
+    skipped unless idle=1 is passed.
+
+Memory:
+    POST /admin/profiler/tracemalloc/start?frames=15
+    POST /admin/profiler/tracemalloc/snapshot?limit=30   diff vs the previous snapshot
+    POST /admin/profiler/tracemalloc/stop
+
+Output is in the collapsed-stack format ("frame;frame;frame count") used by
+flamegraph.pl and speedscope. The state is per process, so with several
+workers each request reaches whichever worker accepts it. Each response
+includes that worker's pid.
+"""
+
+from __future__ import annotations
+
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Optional
+
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request
+
+bp = Blueprint("profiler", __name__, url_prefix="/admin/profiler")
+
+TOKEN_HEADER = "X-Profiler-Token"
+
+# Leaf frames of threads that are parked rather than doing work
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socketserver.py", "serve_forever"),
+    ("thread.py", "_worker"),
+}
+
+_labels: dict = {}
+_sessions_lock = threading.Lock()
+_active_sessions = 0
+_tracemalloc_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for path in sys.path:
+            if path and filename.startswith(path):
+                filename = filename[len(path):].lstrip(os.sep)
+                break
+        name = getattr(code, "co_qualname", code.co_name)
+        label = f"{name} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+def _collapse(frame, thread_name: str) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code).replace(";", ":"))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class StackSampler:
+    """
+    Samples Python stacks from a background thread via sys._current_frames.
+    Costs one stack walk per sampled thread per interval and nothing in
+    the sampled threads themselves.
+    """
+
+    def __init__(self, interval_s: float, thread_ids: Optional[set] = None,
+                 exclude: tuple = (), include_idle: bool = False):
+        self.interval_s = interval_s
+        # None samples every thread except this sampler's own
+        self.thread_ids = thread_ids
+        self.exclude = set(exclude)
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def add_thread(self, ident: int) -> None:
+        if self.thread_ids is not None:
+            self.thread_ids.add(ident)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        self.exclude.add(threading.get_ident())
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            targets = frames.keys() if self.thread_ids is None else tuple(self.thread_ids)
+            self.samples += 1
+            for ident in targets:
+                frame = frames.get(ident)
+                if frame is None or ident in self.exclude:
+                    continue
+                if not self.include_idle and _is_idle(frame):
+                    continue
+                self.stacks[_collapse(frame, names.get(ident, str(ident)))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _authorized() -> bool:
+    supplied = request.headers.get(TOKEN_HEADER, "")
+    expected = current_app.config["PROFILER_TOKEN"]
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def _profiles_dir() -> str:
+    path = os.path.join(current_app.instance_path, "profiles")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _acquire_session() -> bool:
+    global _active_sessions
+    with _sessions_lock:
+        if _active_sessions >= current_app.config["PROFILER_MAX_SESSIONS"]:
+            return False
+        _active_sessions += 1
+        return True
+
+
+def _release_session() -> None:
+    global _active_sessions
+    with _sessions_lock:
+        _active_sessions -= 1
+
+
+# --- Single request ---
+
+
+def _start_request_profile():
+    if TOKEN_HEADER not in request.headers or request.blueprint == bp.name:
+        return
+    if not _authorized():
+        # Never fail real traffic over a stale header
+        return
+    if not _acquire_session():
+        g._profile_busy = True
+        return
+
+    g._profile_id = uuid.uuid4().hex
+    g._profile_sampler = StackSampler(
+        current_app.config["PROFILER_INTERVAL_MS"] / 1000,
+        thread_ids={threading.get_ident()},
+        include_idle=True,
+    ).start()
+
+
+def _finish_request_profile(response):
+    if g.pop("_profile_busy", False):
+        response.headers["X-Profile-Skipped"] = "busy"
+        return response
+
+    sampler = g.pop("_profile_sampler", None)
+    if sampler is None:
+        return response
+    profile_id = g.pop("_profile_id")
+    _save(sampler, profile_id)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _abandon_request_profile(exc):
+    # after_request does not run when the view raised
+    sampler = g.pop("_profile_sampler", None)
+    if sampler is not None:
+        _save(sampler, g.pop("_profile_id"))
+
+
+def _save(sampler: StackSampler, profile_id: str) -> None:
+    try:
+        sampler.stop()
+        with open(os.path.join(_profiles_dir(), f"{profile_id}.folded"), "w", encoding="utf-8") as fh:
+            fh.write(sampler.folded())
+    except OSError as e:
+        print("profile save failed:", e)
+    finally:
+        _release_session()
+
+
+def _wrap_async_to_sync(app: Flask) -> None:
+    """
+    Async views run on an event loop in another thread. Let a profiled
+    request's sampler follow it there.
+    """
+    original = app.async_to_sync
+
+    def async_to_sync(func):
+        async def run(*args, **kwargs):
+            sampler = g.get("_profile_sampler")
+            if sampler is not None:
+                sampler.add_thread(threading.get_ident())
+            return await func(*args, **kwargs)
+
+        return original(run)
+
+    app.async_to_sync = async_to_sync
+
+
+# --- Admin endpoints ---
+
+
+@bp.before_request
+def require_token():
+    if not _authorized():
+        return jsonify({"error": "Invalid profiler token"}), 403
+
+
+@bp.get("/profiles/<profile_id>")
+def get_profile(profile_id: str):
+    try:
+        uuid.UUID(hex=profile_id)
+    except ValueError:
+        return jsonify({"error": "Invalid profile id"}), 400
+
+    path = os.path.join(_profiles_dir(), f"{profile_id}.folded")
+    if not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    with open(path, encoding="utf-8") as fh:
+        return Response(fh.read(), mimetype="text/plain")
+
+
+@bp.post("/sample")
+def sample_window():
+    """
+    POST /admin/profiler/sample?seconds=10&interval_ms=5&idle=0
+    Blocks for `seconds`, then returns the collapsed stacks.
+    """
+    config = current_app.config
+    try:
+        seconds = float(request.args.get("seconds", 10))
+        interval_ms = float(request.args.get("interval_ms", config["PROFILER_INTERVAL_MS"]))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    if not 0 < seconds <= config["PROFILER_MAX_SECONDS"] or not 1 <= interval_ms <= 1000:
+        return jsonify(
+            {"error": f"seconds must be in (0, {config['PROFILER_MAX_SECONDS']}], interval_ms in [1, 1000]"}
+        ), 400
+    if not _acquire_session():
+        return jsonify({"error": "Profiler busy"}), 409
+
+    try:
+        sampler = StackSampler(
+            interval_ms / 1000,
+            # The thread serving this request would only show it sleeping
+            exclude=(threading.get_ident(),),
+            include_idle=request.args.get("idle") == "1",
+        ).start()
+        time.sleep(seconds)
+        sampler.stop()
+    finally:
+        _release_session()
+
+    response = Response(sampler.folded(), mimetype="text/plain")
+    response.headers["X-Profile-Samples"] = str(sampler.samples)
+    response.headers["X-Worker-Pid"] = str(os.getpid())
+    return response
+
+
+@bp.post("/tracemalloc/start")
+def tracemalloc_start():
+    global _tracemalloc_baseline
+    try:
+        frames = int(request.args.get("frames", 15))
+    except ValueError:
+        return jsonify({"error": "frames must be an integer"}), 400
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 100)))
+    _tracemalloc_baseline = tracemalloc.take_snapshot()
+    return jsonify(
+        {"tracing": True, "frames": tracemalloc.get_traceback_limit(), "pid": os.getpid()}
+    ), 200
+
+
+@bp.post("/tracemalloc/snapshot")
+def tracemalloc_snapshot():
+    """
+    Diff a new snapshot against the previous one (or the start baseline),
+    grouped by allocation traceback. The new snapshot becomes the baseline.
+    """
+    global _tracemalloc_baseline
+    if not tracemalloc.is_tracing():
+        return jsonify({"error": "tracemalloc is not running"}), 409
+    try:
+        limit = int(request.args.get("limit", 30))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+    )
+    stats = snapshot.compare_to(_tracemalloc_baseline, "traceback") if _tracemalloc_baseline else []
+    _tracemalloc_baseline = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+
+    return jsonify(
+        {
+            "pid": os.getpid(),
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                    "traceback": stat.traceback.format(most_recent_first=True),
+                }
+                for stat in stats[: max(1, limit)]
+            ],
+        }
+    ), 200
+
+
+@bp.post("/tracemalloc/stop")
+def tracemalloc_stop():
+    global _tracemalloc_baseline
+    tracemalloc.stop()
+    _tracemalloc_baseline = None
+    return jsonify({"tracing": False, "pid": os.getpid()}), 200
+
+
+def init_profiler(app: Flask) -> None:
+    """
+    No-op unless PROFILER_TOKEN is set.
+    """
+    if not app.config.get("PROFILER_TOKEN"):
+        return
+
+    app.config.setdefault("PROFILER_INTERVAL_MS", 5.0)
+    app.config.setdefault("PROFILER_MAX_SECONDS", 60.0)
+    app.config.setdefault("PROFILER_MAX_SESSIONS", 2)
+
+    _wrap_async_to_sync(app)
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
+    app.teardown_request(_abandon_request_profile)
+    app.register_blueprint(bp)
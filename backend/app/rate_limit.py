@@ -0,0 +1,130 @@
+# app/rate_limit.py
+
+"""
+Per-caller rate limits for the endpoints that call paid remote models.
+
+Every caller has one token bucket shared by all limited endpoints. Each
+view declares what a request costs with @rate_limit(cost), roughly the
+number of model calls it makes. A request that cannot pay is refused
+with 429 and a Retry-After header before the view runs.
+
+Callers are the JWT user when the request carries a valid token, else
+the client IP (request.remote_addr; run behind ProxyFix when a proxy
+sits in front). Anonymous callers get a smaller bucket:
+
+    RATE_LIMIT_BURST / RATE_LIMIT_PER_MINUTE            signed-in users
+    RATE_LIMIT_ANON_BURST / RATE_LIMIT_ANON_PER_MINUTE  per IP
+
+Buckets live in the store named by RATE_LIMIT_STORAGE_URL (see
+app/services/shared_store.py). If the store is unreachable requests are
+let through. RATE_LIMIT=0 turns the limits off; a refill rate of 0 is
+refused at startup.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Callable, Union
+
+import jwt
+from flask import Flask, current_app, jsonify, request
+
+from app.services.shared_store import get_store
+
+
+def rate_limit(cost: Union[float, Callable[[], float]] = 1):
+    """
+    Charge `cost` tokens per request to this view; a callable is
+    evaluated per request (e.g. per item of a batch; 0 lets the request
+    through without charging). A request costing more than the caller's
+    whole bucket could never be paid for and is refused with 413. Works
+    on sync and async views alike: the view is only marked, the check
+    runs in a before_request hook.
+    """
+
+    def mark(view):
+        view._rate_limit_cost = cost
+        return view
+
+    return mark
+
+
+def _caller() -> tuple[str, bool]:
+    """
+    (bucket key, signed in)
+    """
+    from app.routes.routes_auth import JWT_ALG, JWT_SECRET
+
+    token = request.headers.get("Authorization", "").replace("Bearer ", "").strip()
+    if token:
+        try:
+            user_id = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG]).get("user_id")
+        except jwt.PyJWTError:
+            user_id = None
+        if user_id:
+            return f"rl:user:{user_id}", True
+    return f"rl:ip:{request.remote_addr or 'unknown'}", False
+
+
+def _limits(signed_in: bool) -> tuple[float, float]:
+    """
+    (capacity, tokens per second)
+    """
+    config = current_app.config
+    if signed_in:
+        return config["RATE_LIMIT_BURST"], config["RATE_LIMIT_PER_MINUTE"] / 60
+    return config["RATE_LIMIT_ANON_BURST"], config["RATE_LIMIT_ANON_PER_MINUTE"] / 60
+
+
+def _check_rate_limit():
+    view = current_app.view_functions.get(request.endpoint)
+    cost = getattr(view, "_rate_limit_cost", None)
+    if cost is None or request.method == "OPTIONS":
+        return None
+    if callable(cost):
+        cost = cost()
+    if cost <= 0:
+        return None
+
+    key, signed_in = _caller()
+    capacity, rate = _limits(signed_in)
+    if cost > capacity:
+        from app.metrics import RATE_LIMITED_REQUESTS
+
+        RATE_LIMITED_REQUESTS.labels(request.endpoint, "user" if signed_in else "ip").inc()
+        return (
+            jsonify({"error": "Request costs more than your rate limit allows", "max_cost": capacity}),
+            413,
+        )
+
+    store = get_store(current_app.config["RATE_LIMIT_STORAGE_URL"])
+    try:
+        wait = store.take(key, cost, capacity, rate)
+    except Exception as e:
+        print("rate limit store unavailable; allowing request:", e)
+        return None
+    if wait <= 0:
+        return None
+
+    from app.metrics import RATE_LIMITED_REQUESTS
+
+    RATE_LIMITED_REQUESTS.labels(request.endpoint, "user" if signed_in else "ip").inc()
+    retry_after = max(1, math.ceil(wait))
+    response = jsonify({"error": "Too many requests", "retry_after": retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def init_rate_limit(app: Flask) -> None:
+    # Buckets that never refill would divide by zero on every check, and
+    # a failing store lets requests through. Doctor chat uses the same
+    # store whether or not RATE_LIMIT is on.
+    for name in ("RATE_LIMIT_PER_MINUTE", "RATE_LIMIT_ANON_PER_MINUTE", "CHAT_RATE_PER_MINUTE"):
+        if app.config[name] <= 0:
+            raise RuntimeError(f"{name} must be greater than 0")
+    if not app.config["RATE_LIMIT"]:
+        return
+    # Fail at startup on a bad URL
+    get_store(app.config["RATE_LIMIT_STORAGE_URL"])
+    app.before_request(_check_rate_limit)
@@ -1,18 +1,24 @@
-from flask import Blueprint, request, jsonify
-from app.services.ai_orchestrator import analyze_patient_context
+import asyncio
+import json
+import queue
+import threading
+
+from flask import Blueprint, Response, current_app, request, jsonify
+from app.rate_limit import rate_limit
+from app.services import usage
+from app.services.ai_orchestrator import aanalyze_patient_context
 from app.services.risk_engine import classify_risk
 from app.services.counselling_engine import generate_response
 from app.safety.guardrails import enforce_safety
 
 analysis_bp = Blueprint("analysis", __name__)
 
+_DONE = object()
 
-@analysis_bp.route("/analyze/", methods=["POST"])
-def analyze():
-    data = request.get_json() or {}
 
+async def _analyze(data: dict) -> dict:
     # AI reasoning + explanation
-    ai_output = analyze_patient_context(data)
+    ai_output = await aanalyze_patient_context(data)
 
     # Risk classification (using your existing engine)
     risk = classify_risk(data)
@@ -23,15 +29,133 @@ def analyze():
     # Safety guardrails (may modify response in place)
     enforce_safety(response)
 
-    return jsonify(
-        {
-            "risk_level": risk,
-            "response": {
-                "message": response["message"],
-                "tone": response["tone"],
-                "disclaimer": (
-                    "This guidance is informational and not a medical diagnosis."
-                ),
-            },
-        }
+    return {
+        "risk_level": risk,
+        "response": {
+            "message": response["message"],
+            "tone": response["tone"],
+            "disclaimer": (
+                "This guidance is informational and not a medical diagnosis."
+            ),
+        },
+    }
+
+
+@analysis_bp.route("/analyze/", methods=["POST"])
+@rate_limit(cost=1)  # one central or OpenRouter call
+async def analyze():
+    data = request.get_json() or {}
+    return jsonify(await _analyze(data))
+
+
+def _batch_contexts():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("contexts")
+    return data if isinstance(data, list) else None
+
+
+def _batch_cost() -> float:
+    return len(_batch_contexts() or []) or 1
+
+
+async def _fan_out(contexts: list, out: queue.Queue, stop: threading.Event) -> None:
+    """
+    Analyze every context, at most BATCH_ANALYZE_CONCURRENCY at a time,
+    putting one result line per context on `out` as each completes.
+    """
+    config = current_app.config
+    semaphore = asyncio.Semaphore(config["BATCH_ANALYZE_CONCURRENCY"])
+    timeout = config["BATCH_ANALYZE_ITEM_TIMEOUT_SECONDS"]
+
+    async def one(index: int, context):
+        line = {"index": index}
+        if isinstance(context, dict) and context.get("id") is not None:
+            line["id"] = context["id"]
+        async with semaphore:
+            if stop.is_set():
+                return
+            if not isinstance(context, dict):
+                line.update(status="error", error="context must be an object")
+            else:
+                try:
+                    result = await asyncio.wait_for(_analyze(context), timeout)
+                    line.update(status="ok", result=result)
+                except asyncio.TimeoutError:
+                    line.update(status="error", error="timeout")
+                except Exception as e:
+                    print("batch analyze item failed:", index, e)
+                    line.update(status="error", error="analysis failed")
+        out.put(line)
+
+    await asyncio.gather(*(one(i, c) for i, c in enumerate(contexts)))
+
+
+def _stream(app, contexts: list, attribution: usage.Attribution):
+    """
+    NDJSON lines in completion order, then a summary line. The fan-out
+    runs on its own event loop in a helper thread; closing the response
+    (client gone) stops items that have not started yet.
+    """
+    out: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            with app.app_context(), usage.attributed(attribution):
+                asyncio.run(_fan_out(contexts, out, stop))
+        except Exception as e:
+            print("batch analyze failed:", e)
+        finally:
+            out.put(_DONE)
+
+    threading.Thread(target=run, name="analyze-batch", daemon=True).start()
+    ok = failed = 0
+    try:
+        while True:
+            line = out.get()
+            if line is _DONE:
+                break
+            if line["status"] == "ok":
+                ok += 1
+            else:
+                failed += 1
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "total": len(contexts), "ok": ok, "failed": failed}) + "\n"
+    finally:
+        stop.set()
+
+
+@analysis_bp.route("/analyze/batch", methods=["POST"])
+@rate_limit(cost=_batch_cost)  # one call per context; 413 beyond the caller's bucket
+def analyze_batch():
+    """
+    POST /analyze/batch
+    Body: { "contexts": [ {...}, ... ] } (or the bare list). Each context
+    is what /analyze/ takes, optionally with an "id" echoed back.
+
+    Streams application/x-ndjson: one line per context as it completes,
+    { "index", "id"?, "status": "ok", "result" } or
+    { "index", "id"?, "status": "error", "error" }, then
+    { "done": true, "total", "ok", "failed" }. A missing summary line
+    means the stream was cut short.
+
+    Each context is charged one rate-limit token, like a call to
+    /analyze/. A batch costing more than the caller's whole bucket
+    (RATE_LIMIT_BURST, RATE_LIMIT_ANON_BURST) is refused with 413.
+    """
+    contexts = _batch_contexts()
+    if contexts is None:
+        return jsonify({"error": "contexts must be a list"}), 400
+    if not contexts:
+        return jsonify({"error": "contexts is empty"}), 400
+    limit = current_app.config["BATCH_ANALYZE_MAX_ITEMS"]
+    if len(contexts) > limit:
+        return jsonify({"error": f"At most {limit} contexts per batch"}), 413
+
+    app = current_app._get_current_object()
+    return Response(
+        _stream(app, contexts, usage.current()),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
     )
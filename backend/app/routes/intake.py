@@ -1,12 +1,15 @@
 from flask import Blueprint, request, jsonify
-from app.services.central_client import call_central_backend
+from app.rate_limit import rate_limit
+from app.services import single_flight, usage
+from app.services.central_client import acall_central_backend
 from app.services.tone_adapter import adapt_tone
 
 intake_bp = Blueprint("intake", __name__, url_prefix="/intake")
 
 
 @intake_bp.route("/daily", methods=["POST"])
-def daily_intake():
+@rate_limit(cost=1)
+async def daily_intake():
     """
     Daily intake route that:
     - accepts basic patient check-in
@@ -18,7 +21,11 @@ def daily_intake():
     if "patient_id" not in data:
         return jsonify({"error": "patient_id required"}), 400
 
-    central_result = call_central_backend(data)
+    # Retries of the same check-in share one central call
+    with usage.attributed(patient_id=data["patient_id"]):
+        central_result = await single_flight.coalesce(
+            "intake", data, lambda: acall_central_backend(data)
+        )
 
     # If central returns an error-style object, bubble it up
     if isinstance(central_result, dict) and "error" in central_result:
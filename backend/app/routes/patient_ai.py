@@ -1,19 +1,65 @@
-from flask import Blueprint, request, jsonify
-from app.services.ai_handler import handle_patient_ai
+from flask import Blueprint, request, jsonify, url_for
+from app.rate_limit import rate_limit
+from app.services import ai_jobs, followups
+from app.services.ai_handler import ahandle_patient_ai, answers_immediately
 
 patient_ai_bp = Blueprint("patient_ai", __name__, url_prefix="/patient/ai")
 
 
+def _as_is(result: dict) -> dict:
+    return result
+
+
 @patient_ai_bp.route("/", methods=["POST"])
-def patient_ai():
+@rate_limit(cost=ai_jobs.free_if_known("patient_ai", 2))  # central backend + tone model
+async def patient_ai():
     """
     Generic AI endpoint for patient flows.
-    Delegates to handle_patient_ai, which calls central backend
+    Delegates to ahandle_patient_ai, which calls central backend
     and applies tone transformation.
+    With `Prefer: respond-async` the work is queued instead: 202 with a
+    job id, then GET /patient/ai/jobs/<id>.
     """
     payload = request.get_json() or {}
     if not payload:
         return jsonify({"error": "Invalid JSON"}), 400
 
-    result = handle_patient_ai(payload)
+    if ai_jobs.wants_async() and not answers_immediately(payload):
+        try:
+            job = await ai_jobs.aenqueue("patient_ai", payload)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except ai_jobs.IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        return ai_jobs.accepted(job, url_for("patient_ai.patient_ai_job", job_id=job.id), _as_is)
+
+    result = await ahandle_patient_ai(payload)
     return jsonify(result), 200
+
+
+@patient_ai_bp.route("/followups/<followup_id>", methods=["GET"])
+def patient_ai_followup(followup_id):
+    """
+    Central analysis of a red-flag payload that was answered immediately.
+    202 while it is still running.
+    """
+    entry = followups.get(followup_id)
+    if entry is None or entry.get("owner") is not None:
+        return jsonify({"error": "Follow-up not found"}), 404
+    if entry["status"] == "pending":
+        return jsonify({"status": "pending"}), 202
+    if entry.get("result") is None:
+        return jsonify({"status": "done", "error": "Analysis failed"}), 502
+    return jsonify({"status": "done", **entry["result"]}), 200
+
+
+@patient_ai_bp.route("/jobs/<uuid:job_id>", methods=["GET"])
+async def patient_ai_job(job_id):
+    """
+    Result of a queued patient AI request. 202 while it is still running;
+    ?wait=<seconds> long-polls.
+    """
+    job = await ai_jobs.aget(job_id, ai_jobs.poll_wait())
+    if job is None or job.kind != "patient_ai":
+        return jsonify({"error": "Job not found"}), 404
+    return ai_jobs.job_response(job, _as_is)
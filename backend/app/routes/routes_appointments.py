@@ -2,15 +2,16 @@
 
 from __future__ import annotations
 
-from datetime import datetime
 import os
 from typing import Optional
 
 from flask import Blueprint, jsonify, request
 import jwt
+from sqlalchemy.exc import IntegrityError
 
 from app import db
 from app.sql_models import User, Patient, Doctor, Appointment  # see example models below
+from app.services import availability, bulk_import, data_versions
 
 bp = Blueprint("appointments", __name__, url_prefix="/appointments")
 
@@ -51,6 +52,14 @@ def list_appointments():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
+    if user.role not in ("patient", "doctor"):
+        return jsonify({"error": "Invalid role"}), 400
+
+    stamp = data_versions.current("appointments", data_versions.scope(user.role, user.id))
+    cached = data_versions.not_modified(stamp)
+    if cached:
+        return cached
+
     if user.role == "patient":
         patient = Patient.query.get(user.id)  # patients.id == users.id
         if not patient:
@@ -62,7 +71,7 @@ def list_appointments():
             .all()
         )
 
-    elif user.role == "doctor":
+    else:
         doctor = Doctor.query.get(user.id)
         if not doctor:
             return jsonify([])
@@ -72,10 +81,10 @@ def list_appointments():
             .order_by(Appointment.start_time.desc())
             .all()
         )
-    else:
-        return jsonify({"error": "Invalid role"}), 400
 
-    return jsonify([appointment_to_dict(a) for a in appts])
+    return data_versions.with_validators(
+        jsonify([appointment_to_dict(a) for a in appts]), stamp
+    )
 
 
 @bp.post("")
@@ -102,19 +111,13 @@ def create_appointment():
 
     data = request.get_json() or {}
 
-    # parse times
+    # parse times (end_time defaults to a standard-length appointment)
     try:
-        start_time = datetime.fromisoformat(data.get("start_time"))
-    except Exception:
-        return jsonify({"error": "Invalid or missing start_time"}), 400
-
-    end_time_raw = data.get("end_time")
-    end_time = None
-    if end_time_raw:
-        try:
-            end_time = datetime.fromisoformat(end_time_raw)
-        except Exception:
-            return jsonify({"error": "Invalid end_time"}), 400
+        start_time, end_time = availability.booking_window(
+            data.get("start_time"), data.get("end_time")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     reason = data.get("reason")
     notes = data.get("notes")
@@ -163,10 +166,62 @@ def create_appointment():
     else:
         return jsonify({"error": "Invalid role"}), 400
 
+    # Serialize bookings per doctor: check and insert under the doctor's row lock
+    if not availability.lock_doctor(appt.doctor_id):
+        db.session.rollback()
+        return jsonify({"error": "Doctor not found"}), 400
+    if user.role == "patient" and not availability.within_working_hours(
+        appt.doctor_id, start_time, end_time
+    ):
+        db.session.rollback()
+        return jsonify({"error": "Outside the doctor's working hours"}), 409
+    if not availability.is_free(appt.doctor_id, start_time, end_time):
+        db.session.rollback()
+        return jsonify({"error": "Time slot is already booked"}), 409
+
     db.session.add(appt)
-    db.session.commit()
+    return _commit_booking(appt, 201)
 
-    return jsonify(appointment_to_dict(appt)), 201
+
+@bp.post("/bulk")
+def bulk_create_appointments():
+    """
+    POST /appointments/bulk?dry_run=1
+
+    Doctor only. Body: a JSON array (or {"rows": [...]}), a text/csv body,
+    or a multipart upload in `file`. Columns: patient_id or patient_email,
+    start_time, end_time, reason, notes, and doctor_id (defaults to self).
+
+    Rows that overlap an existing booking or an earlier row are reported
+    instead of inserted; see POST /medications/bulk for the response.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if user.role != "doctor" or not Doctor.query.get(user.id):
+        return jsonify({"error": "Doctor profile not found"}), 400
+
+    try:
+        rows = bulk_import.read_request_rows(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    dry_run = request.args.get("dry_run") in ("1", "true")
+    try:
+        result = bulk_import.import_appointments(rows, user.id, dry_run=dry_run)
+        if dry_run or not result.inserted:
+            db.session.rollback()
+            return jsonify(result.to_dict()), 200 if dry_run else 400
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        code = getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+        if code == "23P01":  # exclusion_violation
+            return jsonify({"error": "Time slot is already booked"}), 409
+        raise
+
+    return jsonify(result.to_dict()), 201
 
 
 @bp.patch("/<uuid:appointment_id>")
@@ -196,24 +251,42 @@ def update_appointment(appointment_id):
 
     data = request.get_json() or {}
 
-    status = data.get("status")
-    if status:
-        appt.status = status
+    # Work on locals until the slot is checked: the lock's SELECT would
+    # autoflush a moved row into the exclusion constraint (500, not 409)
+    was_active = appt.status not in availability.INACTIVE_STATUSES
+    status = data.get("status") or appt.status
+    start_time, end_time = appt.start_time, appt.end_time
 
-    if "start_time" in data and data["start_time"]:
+    rescheduled = bool(data.get("start_time")) or "end_time" in data
+    if rescheduled:
         try:
-            appt.start_time = datetime.fromisoformat(data["start_time"])
-        except Exception:
-            return jsonify({"error": "Invalid start_time"}), 400
-
-    if "end_time" in data:
-        if data["end_time"]:
-            try:
-                appt.end_time = datetime.fromisoformat(data["end_time"])
-            except Exception:
-                return jsonify({"error": "Invalid end_time"}), 400
-        else:
-            appt.end_time = None
+            start_time, end_time = availability.booking_window(
+                data.get("start_time") or appt.start_time.isoformat(),
+                data.get("end_time"),
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if "end_time" not in data and appt.end_time:
+            # Moving only start_time keeps the current length
+            end_time = start_time + (appt.end_time - appt.start_time)
+
+    active = status not in availability.INACTIVE_STATUSES
+    reactivated = not was_active and active
+    if (rescheduled and active) or reactivated:
+        availability.lock_doctor(appt.doctor_id)
+        if user.role == "patient" and not availability.within_working_hours(
+            appt.doctor_id, start_time, end_time
+        ):
+            db.session.rollback()
+            return jsonify({"error": "Outside the doctor's working hours"}), 409
+        if not availability.is_free(
+            appt.doctor_id, start_time, end_time, exclude_id=appt.id
+        ):
+            db.session.rollback()
+            return jsonify({"error": "Time slot is already booked"}), 409
+
+    appt.status = status
+    appt.start_time, appt.end_time = start_time, end_time
 
     if "reason" in data:
         appt.reason = data["reason"]
@@ -221,9 +294,27 @@ def update_appointment(appointment_id):
     if "notes" in data:
         appt.notes = data["notes"]
 
-    db.session.commit()
+    return _commit_booking(appt, 200)
+
 
-    return jsonify(appointment_to_dict(appt))
+def _commit_booking(appt: Appointment, status: int):
+    """
+    Commit a new or moved appointment. The exclusion constraint from
+    migrations/003 is the last line of defence against overlaps from
+    writers that skip the locked check above.
+    """
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        code = getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+        if code == "23P01":  # exclusion_violation
+            return jsonify({"error": "Time slot is already booked"}), 409
+        if code == "23503":  # foreign_key_violation
+            return jsonify({"error": "Unknown patient_id or doctor_id"}), 400
+        raise
+
+    return jsonify(appointment_to_dict(appt)), status
 
 
 def appointment_to_dict(a: Appointment) -> dict:
@@ -36,13 +36,15 @@ def register():
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
     name = data.get("name") or ""
-    role = data.get("role") or "patient"  # "patient" or "doctor"
+    role = data.get("role") or "patient"  # "patient" or "doctor"; admins via `flask make-admin`
 
     # Basic validation
     if not email or "@" not in email:
         return jsonify({"error": "Valid email is required"}), 400
     if not password or len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
+    if role not in ("patient", "doctor"):
+        return jsonify({"error": "Role must be patient or doctor"}), 400
 
     existing = User.query.filter_by(email=email).first()
     if existing:
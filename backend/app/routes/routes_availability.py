@@ -0,0 +1,131 @@
+# app/routes/routes_availability.py
+
+from __future__ import annotations
+
+from datetime import date, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import Blueprint, g, jsonify, request
+
+from app import db
+from app.routes.routes_auth import auth_required  # use shared JWT auth
+from app.services import availability
+from app.sql_models import Doctor, DoctorWorkingHours
+
+bp = Blueprint("availability", __name__, url_prefix="/doctors")
+
+
+def working_hours_to_dict(h: DoctorWorkingHours) -> dict:
+    return {
+        "weekday": h.weekday,
+        "start": h.start_time.strftime("%H:%M"),
+        "end": h.end_time.strftime("%H:%M"),
+        "timezone": h.timezone,
+        "slot_minutes": h.slot_minutes,
+    }
+
+
+@bp.get("/<uuid:doctor_id>/working-hours")
+@auth_required
+def get_working_hours(doctor_id):
+    """
+    GET /doctors/<id>/working-hours
+    """
+    hours = (
+        DoctorWorkingHours.query.filter_by(doctor_id=doctor_id)
+        .order_by(DoctorWorkingHours.weekday, DoctorWorkingHours.start_time)
+        .all()
+    )
+    return jsonify([working_hours_to_dict(h) for h in hours])
+
+
+@bp.put("/me/working-hours")
+@auth_required
+def set_working_hours():
+    """
+    PUT /doctors/me/working-hours
+    Replaces the whole weekly schedule.
+
+    Body:
+      {
+        "timezone": "Asia/Kolkata",
+        "slot_minutes": 30,
+        "hours": [
+          { "weekday": 0, "start": "09:00", "end": "13:00" },   # 0 = Monday
+          { "weekday": 0, "start": "14:00", "end": "18:00" }
+        ]
+      }
+    """
+    user = g.current_user
+    if user.role != "doctor" or not Doctor.query.get(user.id):
+        return jsonify({"error": "Doctor profile not found"}), 400
+
+    data = request.get_json() or {}
+
+    tz_name = data.get("timezone") or "UTC"
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return jsonify({"error": "Invalid timezone"}), 400
+
+    try:
+        slot_minutes = int(data.get("slot_minutes", 30))
+    except (TypeError, ValueError):
+        return jsonify({"error": "slot_minutes must be an integer"}), 400
+    if not 5 <= slot_minutes <= 240:
+        return jsonify({"error": "slot_minutes must be between 5 and 240"}), 400
+
+    rows = []
+    for entry in data.get("hours") or []:
+        try:
+            weekday = int(entry["weekday"])
+            start = time.fromisoformat(entry["start"])
+            end = time.fromisoformat(entry["end"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Each entry needs weekday, start and end (HH:MM)"}), 400
+        if not 0 <= weekday <= 6 or start == end:
+            return jsonify({"error": "Invalid working hours entry"}), 400
+        rows.append(
+            DoctorWorkingHours(
+                doctor_id=user.id,
+                weekday=weekday,
+                start_time=start,
+                end_time=end,
+                timezone=tz_name,
+                slot_minutes=slot_minutes,
+            )
+        )
+
+    DoctorWorkingHours.query.filter_by(doctor_id=user.id).delete()
+    db.session.add_all(rows)
+    db.session.commit()
+
+    return jsonify([working_hours_to_dict(h) for h in rows])
+
+
+@bp.get("/<uuid:doctor_id>/slots")
+@auth_required
+def list_slots(doctor_id):
+    """
+    GET /doctors/<id>/slots?from=YYYY-MM-DD&to=YYYY-MM-DD&duration=30
+
+    Free slots inside the doctor's working hours, in time order.
+    `to` defaults to `from`; at most 31 days per request.
+    """
+    try:
+        first = date.fromisoformat(request.args.get("from") or date.today().isoformat())
+        last = date.fromisoformat(request.args.get("to") or first.isoformat())
+        duration = timedelta(minutes=int(request.args.get("duration", 30)))
+    except ValueError:
+        return jsonify({"error": "Invalid from, to or duration"}), 400
+
+    if last < first or (last - first).days >= availability.MAX_SEARCH_DAYS:
+        return jsonify({"error": f"Date range must be 1-{availability.MAX_SEARCH_DAYS} days"}), 400
+    if not timedelta(minutes=5) <= duration <= availability.MAX_APPOINTMENT:
+        return jsonify({"error": "Invalid duration"}), 400
+
+    slots = availability.find_slots(doctor_id, first, last, duration)
+    return jsonify(
+        [{"start": start.isoformat(), "end": end.isoformat()} for start, end in slots]
+    )
+
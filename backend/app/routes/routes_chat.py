@@ -0,0 +1,203 @@
+# app/routes/routes_chat.py
+
+from __future__ import annotations
+
+import math
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from uuid import UUID
+
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import select
+
+from app import db
+from app.routes.routes_auth import auth_required  # use shared JWT auth
+from app.services import chat
+from app.services.availability import aware
+from app.sql_models import ChatSession, utcnow
+
+bp = Blueprint("chat", __name__, url_prefix="/chat")
+
+# How long a REST send waits for its message to be stored
+STORE_TIMEOUT_SECONDS = 10
+
+
+def _session_for(session_id: UUID, linked: bool = True):
+    """
+    (session, role of the current user) or an error response. With
+    `linked`, the doctor and patient must still be actively linked.
+    """
+    session = db.session.get(ChatSession, session_id)
+    role = chat.participant_role(g.current_user, session)
+    if role is None:
+        return None, (jsonify({"error": "Chat session not found"}), 404)
+    if linked and db.session.execute(chat.active_link(session.doctor_id, session.patient_id)).first() is None:
+        return None, (jsonify({"error": "No active link between this doctor and patient"}), 403)
+    return (session, role), None
+
+
+@bp.post("/sessions")
+@auth_required
+def open_session():
+    """
+    POST /chat/sessions
+
+    Patient body: {"doctor_id": "..."}; doctor body: {"patient_id": "..."}.
+    Returns the open doctor chat between the two (200) or starts one
+    (201). Requires an active doctor-patient link.
+    """
+    user = g.current_user
+    data = request.get_json(silent=True) or {}
+    if user.role not in ("patient", "doctor"):
+        return jsonify({"error": "Invalid role"}), 400
+    other = "doctor_id" if user.role == "patient" else "patient_id"
+    try:
+        other_id = UUID(str(data.get(other)))
+    except ValueError:
+        return jsonify({"error": f"{other} is required"}), 400
+
+    patient_id, doctor_id = (user.id, other_id) if user.role == "patient" else (other_id, user.id)
+    if db.session.execute(chat.active_link(doctor_id, patient_id)).first() is None:
+        return jsonify({"error": "No active link between this doctor and patient"}), 403
+
+    session = db.session.scalars(
+        select(ChatSession)
+        .where(
+            ChatSession.type == "doctor",
+            ChatSession.patient_id == patient_id,
+            ChatSession.doctor_id == doctor_id,
+            ChatSession.closed_at.is_(None),
+        )
+        .order_by(ChatSession.started_at.desc())
+        .limit(1)
+    ).first()
+    if session is not None:
+        return jsonify(chat.session_dict(session)), 200
+
+    session = ChatSession(
+        type="doctor",
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        title=(data.get("title") or None),
+    )
+    db.session.add(session)
+    db.session.commit()
+    return jsonify(chat.session_dict(session)), 201
+
+
+@bp.get("/sessions")
+@auth_required
+def list_sessions():
+    """
+    GET /chat/sessions
+
+    The current user's doctor chats, newest first.
+    """
+    user = g.current_user
+    column = ChatSession.patient_id if user.role == "patient" else ChatSession.doctor_id
+    sessions = db.session.scalars(
+        select(ChatSession)
+        .where(ChatSession.type == "doctor", column == user.id)
+        .order_by(ChatSession.started_at.desc())
+    ).all()
+    return jsonify([chat.session_dict(s) for s in sessions])
+
+
+@bp.get("/sessions/<uuid:session_id>/messages")
+@auth_required
+def list_messages(session_id: UUID):
+    """
+    GET /chat/sessions/<id>/messages?after=...&before=...&limit=50
+
+    - after: ISO8601; the first `limit` messages after it (catch-up
+      after a reconnect)
+    - before: ISO8601; the last `limit` messages before it (scrolling
+      back). Neither: the latest messages.
+
+    Returns {"messages": [...] oldest first, "presence": {user id: online}}.
+    """
+    found, error = _session_for(session_id)
+    if error:
+        return error
+    session, _ = found
+
+    try:
+        limit = min(int(request.args.get("limit", "50")), current_app.config["CHAT_HISTORY_LIMIT"])
+        after = aware(datetime.fromisoformat(request.args["after"])) if request.args.get("after") else None
+        before = aware(datetime.fromisoformat(request.args["before"])) if request.args.get("before") else None
+    except ValueError:
+        return jsonify({"error": "Invalid after, before or limit"}), 400
+
+    messages = db.session.scalars(chat.history_query(session.id, after, before, max(limit, 1))).all()
+    return jsonify(
+        {
+            "messages": [chat.row_event(m) for m in chat.ordered(messages)],
+            "presence": chat.presence(session),
+        }
+    )
+
+
+@bp.post("/sessions/<uuid:session_id>/messages")
+@auth_required
+def send_message(session_id: UUID):
+    """
+    POST /chat/sessions/<id>/messages
+    Body: {"content": "...", "client_id": "optional, echoed back"}
+
+    For clients without a WebSocket. Returns the stored message (201);
+    connected devices receive it as well.
+    """
+    found, error = _session_for(session_id)
+    if error:
+        return error
+    session, role = found
+    if session.closed_at is not None:
+        return jsonify({"error": "Chat session is closed"}), 409
+
+    data = request.get_json(silent=True) or {}
+    try:
+        content = chat.validate_content(data.get("content"))
+        client_id = chat.validate_client_id(data.get("client_id"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    wait = chat.message_wait(g.current_user.id)
+    if wait > 0:
+        retry_after = max(1, math.ceil(wait))
+        response = jsonify({"error": "Too many messages", "retry_after": retry_after})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
+    try:
+        future = chat.submit(session.id, role, g.current_user.id, content, client_id)
+    except chat.WriterBusy as e:
+        return jsonify({"error": str(e)}), 503
+    try:
+        return jsonify(future.result(timeout=STORE_TIMEOUT_SECONDS)), 201
+    except FutureTimeout:
+        # Still queued: it is stored and delivered when the writer catches up
+        return jsonify({"status": "pending", "client_id": client_id}), 202
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+
+@bp.post("/sessions/<uuid:session_id>/close")
+@auth_required
+def close_session(session_id: UUID):
+    """
+    POST /chat/sessions/<id>/close
+
+    Either participant may close the chat, also once they are no longer
+    linked. Connected devices are told and disconnected; the history
+    stays readable while the link is active.
+    """
+    found, error = _session_for(session_id, linked=False)
+    if error:
+        return error
+    session, _ = found
+    if session.closed_at is None:
+        session.closed_at = utcnow()
+        db.session.commit()
+        chat.bus().publish(chat.topic(session.id), {"type": "closed", "session_id": str(session.id)})
+    return jsonify(chat.session_dict(session))
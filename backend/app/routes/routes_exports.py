@@ -0,0 +1,161 @@
+# app/routes/routes_exports.py
+
+from __future__ import annotations
+
+import os
+from datetime import datetime
+
+from flask import Blueprint, current_app, g, jsonify, request, send_file
+
+from app import db
+from app.routes.routes_auth import auth_required  # use shared JWT auth
+from app.services import exports
+from app.services.availability import aware
+from app.sql_models import Doctor, ExportJob
+
+bp = Blueprint("exports", __name__, url_prefix="/exports")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _parse_time(value, name):
+    if not value:
+        return None
+    try:
+        return aware(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+
+def _get_job(job_id):
+    """
+    The job if the current user may see it: its requester, or any admin.
+    """
+    job = db.session.get(ExportJob, job_id)
+    user = g.current_user
+    if job is None or (user.role != "admin" and job.requested_by != user.id):
+        return None
+    return job
+
+
+@bp.post("")
+@auth_required
+def create_export():
+    """
+    POST /exports
+
+    Body:
+      {
+        "dataset": "medications",        # medications/medication_events/appointments
+        "format": "csv",                 # csv or parquet
+        "since": "ISO8601 or null",      # previous job's `until` for incremental
+        "until": "ISO8601 or null"       # defaults to now (minus a safety lag)
+      }
+
+    - doctor: rows of their actively linked patients.
+    - admin: all patients.
+
+    Answers 202 with the job; poll GET /exports/<id>, then download.
+    """
+    user = g.current_user
+    if user.role == "doctor":
+        if not Doctor.query.get(user.id):
+            return jsonify({"error": "Doctor profile not found"}), 400
+        doctor_id = user.id
+    elif user.role == "admin":
+        doctor_id = None
+    else:
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json() or {}
+
+    dataset = data.get("dataset")
+    if dataset not in exports.DATASETS:
+        return jsonify({"error": f"dataset must be one of {', '.join(exports.DATASETS)}"}), 400
+
+    fmt = data.get("format") or "csv"
+    if fmt not in exports.FORMATS:
+        return jsonify({"error": "format must be csv or parquet"}), 400
+    if fmt == "parquet" and not exports.parquet_available():
+        return jsonify({"error": "Parquet export is not available on this server"}), 400
+
+    try:
+        since = _parse_time(data.get("since"), "since")
+        until = exports.watermark(_parse_time(data.get("until"), "until"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if since is not None and since >= until:
+        return jsonify({"error": "since must be before until"}), 400
+
+    job = ExportJob(
+        requested_by=user.id,
+        doctor_id=doctor_id,
+        dataset=dataset,
+        format=fmt,
+        since=since,
+        until=until,
+        status="queued",
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    exports.submit(job)
+    return jsonify(exports.job_to_dict(job)), 202
+
+
+@bp.get("")
+@auth_required
+def list_exports():
+    """
+    GET /exports
+
+    The current user's jobs, newest first.
+    """
+    jobs = (
+        ExportJob.query.filter_by(requested_by=g.current_user.id)
+        .order_by(ExportJob.created_at.desc())
+        .limit(100)
+        .all()
+    )
+    return jsonify([exports.job_to_dict(j) for j in jobs])
+
+
+@bp.get("/<uuid:job_id>")
+@auth_required
+def get_export(job_id):
+    """
+    GET /exports/<id>
+    """
+    job = _get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Export not found"}), 404
+    return jsonify(exports.job_to_dict(job))
+
+
+@bp.get("/<uuid:job_id>/download")
+@auth_required
+def download_export(job_id):
+    """
+    GET /exports/<id>/download
+
+    Streams the finished file from EXPORT_DIR.
+    """
+    job = _get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Export not found"}), 404
+    if job.status != "done":
+        return jsonify({"error": f"Export is {job.status}"}), 409
+
+    path = exports.file_path(current_app, job)
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file is gone"}), 410
+
+    return send_file(
+        path,
+        mimetype=MEDIA_TYPES[job.format],
+        as_attachment=True,
+        download_name=f"{job.dataset}-{job.until:%Y%m%dT%H%M%S}.{job.format}",
+    )
@@ -2,8 +2,10 @@ from __future__ import annotations
 
 from datetime import datetime, date
 from flask import Blueprint, jsonify, g
+from sqlalchemy.orm import contains_eager
 from app import db
-from app.sql_models import MedicationEvent, Medication, Patient
+from app.sql_models import MedicationEvent, Patient
+from app.services import data_versions
 from app.routes.routes_auth import auth_required  # use shared JWT auth
 
 bp = Blueprint("medication_events", __name__, url_prefix="/medication-events")
@@ -16,19 +18,48 @@ def get_today_range():
     return start, end
 
 
+def medication_event_to_dict(ev: MedicationEvent) -> dict:
+    med = ev.medication
+    return {
+        "id": str(ev.id),
+        "medication_id": str(ev.medication_id),
+        "name": med.name if med else None,
+        "dosage": med.dosage if med else None,
+        "scheduled_time": ev.scheduled_time.isoformat(),
+        "taken_time": ev.taken_time.isoformat() if ev.taken_time else None,
+        "status": ev.status,
+        "notes": ev.notes,
+        # "reminder_id": ev.reminder_id,
+    }
+
+
 @bp.get("/today")
 @auth_required
 def list_today_events():
     user = g.current_user
 
+    start, end = get_today_range()
+
+    # The list also changes at midnight, so the day is part of the tag
+    stamp = data_versions.current(
+        "medication_events",
+        data_versions.scope("patient", user.id),
+        start.date().isoformat(),
+        since=start,
+    )
+    cached = data_versions.not_modified(stamp)
+    if cached:
+        return cached
+
     patient = Patient.query.get(user.id)
     if not patient:
         return jsonify([])
 
-    start, end = get_today_range()
-
+    # The join already loads the medication; populate ev.medication from it
+    # instead of lazy-loading one SELECT per event.
     events = (
-        MedicationEvent.query.join(Medication)
+        MedicationEvent.query.join(MedicationEvent.medication)
+        .options(contains_eager(MedicationEvent.medication))
         .filter(
             MedicationEvent.patient_id == patient.id,
             MedicationEvent.scheduled_time >= start,
@@ -38,21 +69,9 @@ def list_today_events():
         .all()
     )
 
-    def serialize(ev: MedicationEvent):
-        med = ev.medication
-        return {
-            "id": str(ev.id),
-            "medication_id": str(ev.medication_id),
-            "name": med.name if med else None,
-            "dosage": med.dosage if med else None,
-            "scheduled_time": ev.scheduled_time.isoformat(),
-            "taken_time": ev.taken_time.isoformat() if ev.taken_time else None,
-            "status": ev.status,
-            "notes": ev.notes,
-            # "reminder_id": ev.reminder_id,
-        }
-
-    return jsonify([serialize(e) for e in events])
+    return data_versions.with_validators(
+        jsonify([medication_event_to_dict(e) for e in events]), stamp
+    )
 
 
 @bp.patch("/<uuid:event_id>/mark-taken")
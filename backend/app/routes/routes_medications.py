@@ -11,6 +11,7 @@ import jwt
 
 from app import db
 from app.sql_models import User, Patient, Doctor, Medication, MedicationEvent
+from app.services import bulk_import, data_versions
 
 bp = Blueprint("medications", __name__, url_prefix="/medications")
 
@@ -65,6 +66,14 @@ def list_medications():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
+    if user.role not in ("patient", "doctor"):
+        return jsonify({"error": "Invalid role"}), 400
+
+    stamp = data_versions.current("medications", data_versions.scope(user.role, user.id))
+    cached = data_versions.not_modified(stamp)
+    if cached:
+        return cached
+
     if user.role == "patient":
         # Patient.id is assumed to match User.id
         patient = Patient.query.get(user.id)
@@ -77,7 +86,7 @@ def list_medications():
             .all()
         )
 
-    elif user.role == "doctor":
+    else:
         doctor = Doctor.query.get(user.id)
         if not doctor:
             return jsonify([])
@@ -87,10 +96,10 @@ def list_medications():
             .order_by(Medication.created_at.desc())
             .all()
         )
-    else:
-        return jsonify({"error": "Invalid role"}), 400
 
-    return jsonify([medication_to_dict(m) for m in meds])
+    return data_versions.with_validators(
+        jsonify([medication_to_dict(m) for m in meds]), stamp
+    )
 
 
 @bp.post("")
@@ -199,6 +208,41 @@ def create_medication():
     return jsonify(medication_to_dict(med)), 201
 
 
+@bp.post("/bulk")
+def bulk_create_medications():
+    """
+    POST /medications/bulk?dry_run=1
+
+    Doctor only. Body: a JSON array (or {"rows": [...]}), a text/csv body,
+    or a multipart upload in `file`. Columns as in POST /medications, with
+    the patient given as patient_id or patient_email.
+
+    Valid rows are inserted in one transaction; the rest are reported:
+      { "received": 3, "inserted": 2, "dry_run": false, "error_count": 1,
+        "errors": [ { "row": 2, "error": "Unknown patient" } ] }
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if user.role != "doctor" or not Doctor.query.get(user.id):
+        return jsonify({"error": "Doctor profile not found"}), 400
+
+    try:
+        rows = bulk_import.read_request_rows(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    dry_run = request.args.get("dry_run") in ("1", "true")
+    result = bulk_import.import_medications(rows, user.id, dry_run=dry_run)
+    if dry_run or not result.inserted:
+        db.session.rollback()
+        return jsonify(result.to_dict()), 200 if dry_run else 400
+
+    db.session.commit()
+    return jsonify(result.to_dict()), 201
+
+
 @bp.put("/<uuid:medication_id>")
 @bp.patch("/<uuid:medication_id>")
 def update_medication(medication_id):
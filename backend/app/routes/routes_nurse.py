@@ -4,11 +4,16 @@ import os
 from typing import Optional
 from uuid import UUID
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, url_for
 import jwt
+from sqlalchemy import select
 
+from app import tracing
+from app.async_db import async_session
+from app.rate_limit import rate_limit
 from app.sql_models import User, Patient, Medication, Appointment, PatientReport
-from app.services.ai_handler import handle_patient_ai
+from app.services import ai_jobs, followups
+from app.services.ai_handler import ahandle_patient_ai, answers_immediately
 
 bp = Blueprint("nurse", __name__, url_prefix="/nurse")
 
@@ -16,28 +21,70 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev-jwt-secret")
 JWT_ALG = "HS256"
 
 
-def get_current_user() -> Optional[User]:
+async def aget_current_user() -> Optional[User]:
+    """
+    Async variant of the shared get_current_user helper.
+    """
     auth_header = request.headers.get("Authorization", "")
     token = auth_header.replace("Bearer ", "").strip()
     if not token:
         return None
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-    except jwt.PyJWTError:
-        return None
-    user_id = payload.get("user_id")
-    if not user_id:
+        user_id = UUID(str(payload.get("user_id")))
+    except (jwt.PyJWTError, ValueError):
         return None
-    return User.query.get(user_id)
+    async with async_session() as session:
+        return await session.get(User, user_id)
+
+
+async def _load_patient_context(user_id: UUID) -> tuple:
+    """
+    Load the patient row and their chat context over one connection.
+    The async engine does not pool (see app/async_db.py), so a session
+    per query would open a connection per query.
+    """
+    async with async_session(read_only=True) as session:
+
+        async def scalars(stmt):
+            return (await session.scalars(stmt)).all()
+
+        patient = (await scalars(select(Patient).where(Patient.id == user_id)) or [None])[0]
+        if not patient:
+            return None, [], [], []
+        meds = await scalars(
+            select(Medication).where(
+                Medication.patient_id == user_id,
+                Medication.is_active.is_(True),
+            )
+        )
+        reports = await scalars(
+            select(PatientReport)
+            .where(PatientReport.patient_id == user_id)
+            .order_by(PatientReport.date.desc(), PatientReport.created_at.desc())
+            .limit(10)
+        )
+        appointments = await scalars(
+            select(Appointment)
+            .where(Appointment.patient_id == user_id)
+            .order_by(Appointment.start_time.desc())
+            .limit(10)
+        )
+    return patient, meds, reports, appointments
 
 
 @bp.post("/chat")
-def nurse_chat():
+@rate_limit(cost=ai_jobs.free_if_known("nurse_chat", 2, owner=ai_jobs.token_owner))  # central backend + tone model
+async def nurse_chat():
     """
     POST /nurse/chat
     Body: { "message": "text from user" }
+
+    With `Prefer: respond-async` (and optionally an Idempotency-Key) the
+    reply is queued: 202 with a job id, then GET /nurse/jobs/<id>.
+    Red-flag messages are always answered at once.
     """
-    user = get_current_user()
+    user = await aget_current_user()
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
@@ -46,29 +93,11 @@ def nurse_chat():
     if not message:
         return jsonify({"error": "message is required"}), 400
 
-    patient = Patient.query.get(user.id) if user.role == "patient" else None
-
-    meds = (
-        Medication.query.filter_by(patient_id=patient.id, is_active=True).all()
-        if patient
-        else []
-    )
-    reports = (
-        PatientReport.query.filter_by(patient_id=patient.id)
-        .order_by(PatientReport.date.desc(), PatientReport.created_at.desc())
-        .limit(10)
-        .all()
-        if patient
-        else []
-    )
-    appointments = (
-        Appointment.query.filter_by(patient_id=patient.id)
-        .order_by(Appointment.start_time.desc())
-        .limit(10)
-        .all()
-        if patient
-        else []
-    )
+    if user.role == "patient":
+        with tracing.span("nurse.load_context"):
+            patient, meds, reports, appointments = await _load_patient_context(user.id)
+    else:
+        patient, meds, reports, appointments = None, [], [], []
 
     # Ensure patient_id is JSON-serializable
     patient_id = patient.id if patient else None
@@ -91,21 +120,70 @@ def nurse_chat():
         else [],
     }
 
+    if ai_jobs.wants_async() and not answers_immediately(context_payload):
+        try:
+            job = await ai_jobs.aenqueue("nurse_chat", context_payload, owner=str(user.id))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except ai_jobs.IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        return ai_jobs.accepted(job, url_for("nurse.nurse_job", job_id=job.id), _reply)
+
     try:
-        ai_result = handle_patient_ai(context_payload)
-
-        return jsonify(
-            {
-                "reply": ai_result.get("patient_message"),
-                "risk_level": ai_result.get("risk_level"),
-                "confidence": ai_result.get("confidence"),
-                "escalation": ai_result.get("escalation"),
-                "safety_flags": ai_result.get("safety_flags"),
-                "clinical_signals": ai_result.get("clinical_signals"),
-                "disclaimer": ai_result.get("disclaimer"),
-            }
-        ), 200
+        ai_result = await ahandle_patient_ai(context_payload, owner=str(user.id))
+        return jsonify(_reply(ai_result)), 200
 
     except Exception as e:
         print("nurse_chat error:", e)
         return jsonify({"error": "Failed to generate nurse reply"}), 500
+
+
+@bp.get("/followups/<followup_id>")
+async def nurse_followup(followup_id):
+    """
+    GET /nurse/followups/<id>
+    Central analysis of a red-flag message answered immediately by
+    /nurse/chat. 202 while it is still running.
+    """
+    user = await aget_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    entry = followups.get(followup_id)
+    if entry is None or entry.get("owner") != str(user.id):
+        return jsonify({"error": "Follow-up not found"}), 404
+    if entry["status"] == "pending":
+        return jsonify({"status": "pending"}), 202
+    if entry.get("result") is None:
+        return jsonify({"status": "done", "error": "Analysis failed"}), 502
+    return jsonify({"status": "done", **_reply(entry["result"])}), 200
+
+
+@bp.get("/jobs/<uuid:job_id>")
+async def nurse_job(job_id):
+    """
+    GET /nurse/jobs/<id>?wait=<seconds>
+    A queued /nurse/chat reply: 200 with the reply, 202 while it is
+    still being worked on. `wait` long-polls up to AI_JOB_MAX_WAIT_SECONDS.
+    """
+    user = await aget_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = await ai_jobs.aget(job_id, ai_jobs.poll_wait())
+    if job is None or job.kind != "nurse_chat" or job.owner != str(user.id):
+        return jsonify({"error": "Job not found"}), 404
+    return ai_jobs.job_response(job, _reply)
+
+
+def _reply(ai_result: dict) -> dict:
+    return {
+        "reply": ai_result.get("patient_message"),
+        "risk_level": ai_result.get("risk_level"),
+        "confidence": ai_result.get("confidence"),
+        "escalation": ai_result.get("escalation"),
+        "safety_flags": ai_result.get("safety_flags"),
+        "clinical_signals": ai_result.get("clinical_signals"),
+        "disclaimer": ai_result.get("disclaimer"),
+        "followup_id": ai_result.get("followup_id"),
+    }
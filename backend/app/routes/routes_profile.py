@@ -7,6 +7,7 @@ from flask import Blueprint, jsonify, request
 
 from app import db
 from app.sql_models import User, Patient
+from app.services import data_versions
 from app.routes.routes_medications import get_current_user  # reuse helper
 
 bp = Blueprint("profile", __name__, url_prefix="/me")
@@ -64,9 +65,14 @@ def get_profile():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
+    stamp = data_versions.current("profile", data_versions.scope("user", user.id))
+    cached = data_versions.not_modified(stamp)
+    if cached:
+        return cached
+
     patient = Patient.query.get(user.id)
     # It’s okay if patient is None; we still return a profile with user data.
-    return jsonify(patient_to_dict(user, patient)), 200
+    return data_versions.with_validators(jsonify(patient_to_dict(user, patient)), stamp), 200
 
 
 @bp.put("/profile")
@@ -12,6 +12,7 @@ from werkzeug.utils import secure_filename
 
 from app import db
 from app.sql_models import User, Patient, PatientReport
+from app.services import data_versions
 
 bp = Blueprint("reports", __name__, url_prefix="/reports")
 
@@ -77,6 +78,18 @@ def list_reports():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
+    if user.role == "patient":
+        stamp = data_versions.current("reports", data_versions.scope("patient", user.id))
+    elif user.role == "doctor":
+        # Matches the MVP rule below: doctors see every report
+        stamp = data_versions.aggregate("reports", "patient")
+    else:
+        return jsonify({"error": "Invalid role"}), 400
+
+    cached = data_versions.not_modified(stamp)
+    if cached:
+        return cached
+
     if user.role == "patient":
         patient = Patient.query.get(user.id)
         if not patient:
@@ -86,17 +99,17 @@ def list_reports():
             .order_by(PatientReport.date.desc(), PatientReport.created_at.desc())
             .all()
         )
-    elif user.role == "doctor":
+    else:
         # MVP: show all reports; later restrict to their linked patients
         reports = (
             PatientReport.query.order_by(
                 PatientReport.date.desc(), PatientReport.created_at.desc()
             ).all()
         )
-    else:
-        return jsonify({"error": "Invalid role"}), 400
 
-    return jsonify([report_to_dict(r) for r in reports])
+    return data_versions.with_validators(
+        jsonify([report_to_dict(r) for r in reports]), stamp
+    )
 
 
 @bp.post("")
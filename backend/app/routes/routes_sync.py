@@ -0,0 +1,145 @@
+# app/routes/routes_sync.py
+
+from __future__ import annotations
+
+from collections import defaultdict
+
+from flask import Blueprint, g, jsonify, request
+from sqlalchemy.orm import joinedload
+
+from app.db_routing import primary_only
+from app.routes.routes_auth import auth_required  # use shared JWT auth
+from app.routes.routes_appointments import appointment_to_dict
+from app.routes.routes_medication_events import medication_event_to_dict
+from app.routes.routes_medications import medication_to_dict
+from app.routes.routes_profile import patient_to_dict
+from app.routes.routes_reports import report_to_dict
+from app.services import change_log
+from app.sql_models import Appointment, Medication, MedicationEvent, Patient, PatientReport
+
+bp = Blueprint("sync", __name__, url_prefix="/sync")
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+# change_log entity -> (response key, model, serializer)
+COLLECTIONS = {
+    "medication": ("medications", Medication, medication_to_dict),
+    "appointment": ("appointments", Appointment, appointment_to_dict),
+    "report": ("reports", PatientReport, report_to_dict),
+    "medication_event": ("medication_events", MedicationEvent, medication_event_to_dict),
+}
+
+
+def _load(model, patient_id, ids=None) -> list:
+    query = model.query.filter(model.patient_id == patient_id)
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    if model is MedicationEvent:
+        # medication_event_to_dict reads ev.medication
+        query = query.options(joinedload(MedicationEvent.medication))
+    return query.all()
+
+
+@bp.get("")
+@primary_only  # cursors come from the primary's transaction ids
+@auth_required
+def sync():
+    """
+    GET /sync?token=<opaque>&limit=500
+
+    Without a token: the patient's full dataset plus a token.
+    With a token: only what changed since it was issued.
+
+    {
+      "token": "...",            # pass back on the next sync
+      "full": false,             # true: replace local data instead of merging
+      "has_more": false,         # true: call again with the new token right away
+      "changes": { "medications": [...], "appointments": [...], "reports": [...],
+                   "medication_events": [...], "profile": {...} | null },
+      "deleted": { "medications": ["<id>"], ... }
+    }
+
+    Deleting a medication also deletes its events. Clients should drop
+    local events of a deleted medication.
+
+    A token older than the retained change log (CHANGE_LOG_RETENTION_DAYS)
+    gets a full resync: "full": true, as without a token.
+    """
+    user = g.current_user
+    if user.role != "patient":
+        return jsonify({"error": "Sync is only available to patients"}), 403
+
+    try:
+        limit = min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    token = request.args.get("token")
+    if not token:
+        return jsonify(_full_sync(user))
+
+    try:
+        cursor = change_log.Cursor.decode(token)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Invalid sync token"}), 400
+    if change_log.expired(cursor):
+        # Changes after the token were pruned: resync in full
+        return jsonify(_full_sync(user))
+
+    ops, next_cursor, has_more = change_log.changes_since(user.id, cursor, limit)
+
+    upserts, deleted = defaultdict(list), defaultdict(list)
+    for (entity, entity_id), op in ops.items():
+        (upserts if op == "upsert" else deleted)[entity].append(entity_id)
+
+    changes = {key: [] for key, _, _ in COLLECTIONS.values()}
+    changes["profile"] = None
+    tombstones = {
+        key: [str(i) for i in deleted.get(entity, [])]
+        for entity, (key, _, _) in COLLECTIONS.items()
+    }
+
+    for entity, (key, model, serialize) in COLLECTIONS.items():
+        ids = upserts.get(entity)
+        if not ids:
+            continue
+        rows = _load(model, user.id, ids)
+        changes[key] = [serialize(r) for r in rows]
+        # Gone again since it was logged (the delete is in a later page)
+        found = {r.id for r in rows}
+        tombstones[key] += [str(i) for i in ids if i not in found]
+
+    if upserts.get("profile") or deleted.get("profile"):
+        changes["profile"] = patient_to_dict(user, Patient.query.get(user.id))
+
+    return jsonify(
+        {
+            "token": next_cursor.encode(),
+            "full": False,
+            "has_more": has_more,
+            "changes": changes,
+            "deleted": tombstones,
+        }
+    )
+
+
+def _full_sync(user) -> dict:
+    # Horizon first: anything that commits while we read is sent again next time
+    cursor = change_log.Cursor.at_horizon(change_log.horizon())
+
+    changes = {
+        key: [serialize(r) for r in _load(model, user.id)]
+        for key, model, serialize in COLLECTIONS.values()
+    }
+    changes["profile"] = patient_to_dict(user, Patient.query.get(user.id))
+
+    return {
+        "token": cursor.encode(),
+        "full": True,
+        "has_more": False,
+        "changes": changes,
+        "deleted": {key: [] for key, _, _ in COLLECTIONS.values()},
+    }
@@ -0,0 +1,71 @@
+# app/routes/routes_usage.py
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from flask import Blueprint, g, jsonify, request
+
+from app.routes.routes_auth import auth_required  # use shared JWT auth
+from app.services import usage
+from app.services.availability import aware
+
+bp = Blueprint("usage", __name__, url_prefix="/usage")
+
+MAX_LIMIT = 1000
+
+
+@bp.get("")
+@auth_required
+def usage_report():
+    """
+    GET /usage?group_by=route,model&since=...&until=...&sort=cost&limit=100
+
+    Admin only. Totals of calls to the central backend and the model
+    providers per group: calls, errors, prompt/completion/total tokens,
+    cost_usd, avg_latency_ms, max_latency_ms.
+
+    - group_by: comma separated, any of route, patient, target, model,
+      day, hour (default: route,target,model)
+    - since / until: ISO8601 (default: the last 24 hours)
+    - sort: cost, tokens, calls, errors, avg_latency, max_latency
+      (default: cost), descending
+
+    Other workers' totals appear after their next flush
+    (USAGE_FLUSH_SECONDS); this worker's are flushed first.
+    """
+    if g.current_user.role != "admin":
+        return jsonify({"error": "Forbidden"}), 403
+
+    group_by = [d.strip() for d in (request.args.get("group_by") or "route,target,model").split(",") if d.strip()]
+    unknown = [d for d in group_by if d not in usage.DIMENSIONS]
+    if unknown or not group_by:
+        return jsonify({"error": f"group_by must be some of {', '.join(usage.DIMENSIONS)}"}), 400
+
+    sort = request.args.get("sort") or "cost"
+    if sort not in usage.SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(usage.SORTS)}"}), 400
+
+    try:
+        limit = min(int(request.args.get("limit", "100")), MAX_LIMIT)
+        since, until = usage.default_window()
+        if request.args.get("since"):
+            since = aware(datetime.fromisoformat(request.args["since"]))
+        if request.args.get("until"):
+            until = aware(datetime.fromisoformat(request.args["until"]))
+    except ValueError:
+        return jsonify({"error": "Invalid since, until or limit"}), 400
+    if since >= until:
+        return jsonify({"error": "since must be before until"}), 400
+
+    usage.flush()
+    rows = usage.report(group_by, since, until, sort, max(limit, 1))
+    return jsonify(
+        {
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+            "group_by": group_by,
+            "sort": sort,
+            "rows": rows,
+        }
+    )
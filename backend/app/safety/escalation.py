@@ -0,0 +1,34 @@
+from typing import Optional
+
+DISCLAIMER = "This guidance is informational and not a medical diagnosis."
+
+
+def red_flag_message(red_flags: list) -> str:
+    return (
+        f"What you describe ({', '.join(red_flags)}) can be a sign of a medical "
+        "emergency. Please call your local emergency number now or go to the "
+        "nearest emergency department. Do not drive yourself. If someone is "
+        "with you, let them know how you feel."
+    )
+
+
+def red_flag_response(payload: dict, triage, followup_id: Optional[str] = None) -> dict:
+    """
+    Immediate escalation for a message that matched local red flags,
+    shaped like the patient AI response.
+    """
+    return {
+        "patient_id": payload.get("patient_id"),
+        "risk_level": "HIGH",
+        "patient_message": red_flag_message(triage.red_flags),
+        "confidence": None,
+        "escalation": {
+            "requires_doctor": True,
+            "reason": "red_flag",
+            "red_flags": triage.red_flags,
+        },
+        "safety_flags": {"red_flags": triage.red_flags},
+        "clinical_signals": {"triage": triage.matches},
+        "disclaimer": DISCLAIMER,
+        "followup_id": followup_id,
+    }
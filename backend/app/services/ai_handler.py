@@ -1,35 +1,29 @@
-from app.services.central_client import call_central_backend
-from app.services.tone_transformer import transform_to_human_tone
+from typing import Optional
 
+from flask import current_app
 
-def handle_patient_ai(payload: dict) -> dict:
-    """
-    Main orchestration function for patient AI flow in Viora.
-    - Calls central backend for risk + explanation
-    - Applies tone transformer to the explanation
-    - Returns a clean, patient-facing object
-    """
+from app import tracing
+from app.safety.escalation import red_flag_response
+from app.services import followups, semantic_cache, single_flight, triage, usage
+from app.services.central_client import acall_central_backend, call_central_backend
+from app.services.tone_transformer import (
+    atransform_to_human_tone,
+    transform_to_human_tone,
+)
 
-    # Step 1: Get raw clinical reasoning from central brain
-    central_result = call_central_backend(payload)
 
-    base_explanation = (
+def _base_explanation(central_result: dict) -> str:
+    return (
         central_result.get("ai_explanation")
         or (central_result.get("counselling") or {}).get("message")
         or ""
     )
-    risk_level = central_result.get("risk_level", "UNKNOWN")
 
-    # Step 2: Convert to patient-friendly tone
-    patient_message = transform_to_human_tone(
-        clinical_text=base_explanation,
-        risk_level=risk_level,
-    )
 
-    # Step 3: Return clean response to the app
+def _patient_response(payload: dict, central_result: dict, patient_message: str) -> dict:
     return {
         "patient_id": payload.get("patient_id"),
-        "risk_level": risk_level,
+        "risk_level": central_result.get("risk_level", "UNKNOWN"),
         "patient_message": patient_message,
         "confidence": central_result.get("confidence"),
         "escalation": central_result.get("escalation"),
@@ -37,3 +31,107 @@ def handle_patient_ai(payload: dict) -> dict:
         "clinical_signals": central_result.get("clinical_signals"),
         "disclaimer": central_result.get("disclaimer"),
     }
+
+
+def handle_patient_ai(payload: dict) -> dict:
+    """
+    Main orchestration function for patient AI flow in Viora.
+    - Calls central backend for risk + explanation
+    - Applies tone transformer to the explanation
+    - Returns a clean, patient-facing object
+    Near-identical earlier questions are answered from semantic_cache.
+    """
+    probe = semantic_cache.probe(payload)
+    cached = semantic_cache.lookup(payload, probe)
+    if cached is not None:
+        return cached
+
+    with usage.attributed(patient_id=payload.get("patient_id")):
+        result = _patient_ai(payload)
+    semantic_cache.store(probe, result)
+    return result
+
+
+def _patient_ai(payload: dict) -> dict:
+    with tracing.span("patient_ai") as pipeline:
+        # Step 1: Get raw clinical reasoning from central brain
+        with tracing.span("patient_ai.central"):
+            central_result = call_central_backend(payload)
+        risk_level = central_result.get("risk_level", "UNKNOWN")
+        tracing.set_attributes(pipeline, **{"viora.risk_level": risk_level})
+
+        # Step 2: Convert to patient-friendly tone
+        with tracing.span("patient_ai.tone"):
+            patient_message = transform_to_human_tone(
+                clinical_text=_base_explanation(central_result),
+                risk_level=risk_level,
+            )
+
+        # Step 3: Return clean response to the app
+        with tracing.span("patient_ai.respond"):
+            return _patient_response(payload, central_result, patient_message)
+
+
+def answers_immediately(payload: dict) -> bool:
+    """
+    True when ahandle_patient_ai answers `payload` locally (red flag),
+    so there is nothing worth queueing.
+    """
+    if not current_app.config["TRIAGE_FAST_PATH"]:
+        return False
+    return triage.assess(payload.get("message"), payload.get("symptoms")).level == "HIGH"
+
+
+async def ahandle_patient_ai(payload: dict, owner: Optional[str] = None) -> dict:
+    """
+    Async variant of handle_patient_ai used by the async views.
+
+    Messages that match local red flags are answered at once with the
+    escalation response; the central analysis then runs in the
+    background and can be fetched with the returned followup_id.
+    `owner` (user id) restricts who may read it.
+    """
+    with usage.attributed(patient_id=payload.get("patient_id")):
+        if current_app.config["TRIAGE_FAST_PATH"]:
+            result = triage.assess(payload.get("message"), payload.get("symptoms"))
+            if result.level == "HIGH":
+                followup_id = followups.start(payload, owner)
+                return red_flag_response(payload, result, followup_id)
+        return await acentral_patient_ai(payload)
+
+
+async def acentral_patient_ai(payload: dict) -> dict:
+    """
+    The central + tone pipeline. The event loop is free while central
+    and the tone model are in flight. Near-identical earlier questions
+    are answered from semantic_cache; identical payloads already in
+    flight share one pipeline run (see single_flight).
+    """
+    probe = semantic_cache.probe(payload)
+    cached = semantic_cache.lookup(payload, probe)
+    if cached is not None:
+        return cached
+
+    async def compute() -> dict:
+        result = await _apatient_ai(payload)
+        semantic_cache.store(probe, result)
+        return result
+
+    return await single_flight.coalesce("patient_ai", payload, compute)
+
+
+async def _apatient_ai(payload: dict) -> dict:
+    with tracing.span("patient_ai") as pipeline:
+        with tracing.span("patient_ai.central"):
+            central_result = await acall_central_backend(payload)
+        risk_level = central_result.get("risk_level", "UNKNOWN")
+        tracing.set_attributes(pipeline, **{"viora.risk_level": risk_level})
+
+        with tracing.span("patient_ai.tone"):
+            patient_message = await atransform_to_human_tone(
+                clinical_text=_base_explanation(central_result),
+                risk_level=risk_level,
+            )
+
+        with tracing.span("patient_ai.respond"):
+            return _patient_response(payload, central_result, patient_message)
@@ -0,0 +1,407 @@
+# app/services/ai_jobs.py
+
+"""
+Asynchronous mode for /nurse/chat and /patient/ai/.
+
+A request with `Prefer: respond-async` is queued and answered at once
+with 202 and a job id. The client then fetches the answer from the
+endpoint's /jobs/<id>, long-polling with ?wait=<seconds>. A connection
+that drops while the model is working loses nothing: the job keeps
+running and the client reads the result when it is back.
+
+Jobs are rows in ai_jobs, so they survive a restart and any worker can
+answer a poll. Every process runs AI_JOB_WORKERS threads. Each thread
+claims queued jobs with SELECT ... FOR UPDATE SKIP LOCKED and runs the
+usual pipeline. A job left running for longer than AI_JOB_STALE_SECONDS
+belonged to a worker that died, so it is claimed again. After
+AI_JOB_MAX_ATTEMPTS attempts it fails.
+
+Idempotency-Key: a request that repeats the key of an earlier job for
+the same endpoint and user gets that job back instead of a new one. The
+repeat is not charged against the rate limit. The same key with a
+different body is refused with 422. Finished jobs and their keys are
+kept for AI_JOB_RESULT_TTL_SECONDS, then deleted.
+
+Red-flag messages answered locally by triage are never queued (see
+ai_handler.answers_immediately).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+from time import monotonic
+from typing import Callable, Optional
+from uuid import UUID
+
+import jwt
+from flask import Flask, current_app, jsonify, request
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.async_db import async_session
+from app.services import usage
+from app.sql_models import AIJob, utcnow
+
+MAX_KEY_LENGTH = 255
+
+# Seconds between expired-job sweeps, per process
+_CLEANUP_SECONDS = 60
+
+_wake = threading.Event()
+_workers_pid: Optional[int] = None
+_workers_lock = threading.Lock()
+
+# job id -> [Future resolved when the job finishes, number of waiters];
+# removed when finished or when its last waiter gives up
+_finished: dict[UUID, list] = {}
+_finished_lock = threading.Lock()
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def wants_async() -> bool:
+    if not current_app.config["AI_JOBS"]:
+        return False
+    return "respond-async" in request.headers.get("Prefer", "").lower()
+
+
+def _idempotency_key() -> Optional[str]:
+    key = (request.headers.get("Idempotency-Key") or "").strip()
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key is longer than {MAX_KEY_LENGTH} characters")
+    return key or None
+
+
+def _digest(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _live(kind: str, owner: Optional[str], key: str):
+    return select(AIJob).where(
+        AIJob.kind == kind,
+        func.coalesce(AIJob.owner, "") == (owner or ""),
+        AIJob.idempotency_key == key,
+    )
+
+
+def token_owner() -> Optional[str]:
+    """
+    Job owner for the signed-in caller (the JWT user id), or None.
+    """
+    from app.routes.routes_auth import JWT_ALG, JWT_SECRET
+
+    token = request.headers.get("Authorization", "").replace("Bearer ", "").strip()
+    if not token:
+        return None
+    try:
+        return str(UUID(str(jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG]).get("user_id"))))
+    except (jwt.PyJWTError, ValueError):
+        return None
+
+
+def free_if_known(
+    kind: str, cost: float, owner: Optional[Callable[[], Optional[str]]] = None
+) -> Callable[[], float]:
+    """
+    Rate-limit cost for a queueing endpoint: 0 when the request repeats
+    the Idempotency-Key of a live job of the same caller (the answer
+    already exists or is on its way), else `cost`. For endpoints that
+    enqueue per user, `owner` returns the caller's owner id; a request
+    without one pays.
+    """
+
+    def job_cost() -> float:
+        try:
+            key = _idempotency_key()
+        except ValueError:
+            return cost
+        if key is None or not wants_async():
+            return cost
+        caller = None
+        if owner is not None:
+            caller = owner()
+            if caller is None:
+                return cost
+        query = _live(kind, caller, key).where(
+            or_(AIJob.expires_at.is_(None), AIJob.expires_at > utcnow())
+        )
+        return 0 if db.session.execute(query.with_only_columns(AIJob.id).limit(1)).first() else cost
+
+    return job_cost
+
+
+async def aenqueue(kind: str, payload: dict, owner: Optional[str] = None) -> AIJob:
+    """
+    Queue `payload` for `kind`, or return the live job with the same
+    Idempotency-Key. Raises ValueError for a bad key and
+    IdempotencyConflict when the key was used with another body.
+    """
+    key = _idempotency_key()
+    payload = json.loads(json.dumps(payload, default=str))
+    digest = _digest(payload)
+    job = AIJob(
+        kind=kind,
+        owner=owner,
+        route=request.endpoint,
+        idempotency_key=key,
+        payload_hash=digest,
+        payload=payload,
+        status="queued",
+        attempts=0,
+        created_at=utcnow(),
+    )
+
+    async with async_session() as session:
+        if key is not None:
+            existing = (await session.scalars(_live(kind, owner, key))).first()
+            if existing is not None:
+                if existing.expires_at is None or existing.expires_at > utcnow():
+                    if existing.payload_hash != digest:
+                        raise IdempotencyConflict("Idempotency-Key was used for a different request")
+                    return existing
+                # Expired but not swept yet: the key is free again
+                await session.delete(existing)
+                await session.flush()
+        session.add(job)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Same key enqueued concurrently; return the winner
+            await session.rollback()
+            existing = (await session.scalars(_live(kind, owner, key))).first()
+            if existing is None:
+                raise
+            if existing.payload_hash != digest:
+                raise IdempotencyConflict("Idempotency-Key was used for a different request")
+            return existing
+
+    ensure_workers(current_app._get_current_object())
+    _wake.set()
+    return job
+
+
+async def aget(job_id: UUID, wait: float = 0) -> Optional[AIJob]:
+    """
+    The job, waiting up to `wait` seconds for it to finish. Jobs finished
+    by this process wake the waiter at once; others are re-read every
+    AI_JOB_POLL_SECONDS.
+    """
+    poll = current_app.config["AI_JOB_POLL_SECONDS"]
+    deadline = monotonic() + wait
+    while True:
+        # Primary: a replica may not have the job yet
+        async with async_session() as session:
+            job = await session.get(AIJob, job_id)
+        if job is not None and job.status in ("done", "failed"):
+            # Finished elsewhere: release this process's waiters
+            _notify(job_id)
+            return job
+        remaining = deadline - monotonic()
+        if job is None or remaining <= 0:
+            return job
+
+        finished = _subscribe(job_id)
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(finished)), min(poll, remaining))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Jobs finished by another process never resolve the Future
+            _unsubscribe(job_id, finished)
+
+
+def _subscribe(job_id: UUID) -> Future:
+    with _finished_lock:
+        entry = _finished.get(job_id)
+        if entry is None:
+            entry = _finished[job_id] = [Future(), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _unsubscribe(job_id: UUID, finished: Future) -> None:
+    with _finished_lock:
+        entry = _finished.get(job_id)
+        if entry is None or entry[0] is not finished:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _finished[job_id]
+
+
+def _notify(job_id: UUID) -> None:
+    with _finished_lock:
+        entry = _finished.pop(job_id, None)
+    if entry is not None:
+        entry[0].set_result(None)
+
+
+# ---------- Workers ----------
+
+
+def _claim(app: Flask) -> Optional[dict]:
+    config = app.config
+    stale = utcnow() - timedelta(seconds=config["AI_JOB_STALE_SECONDS"])
+    next_job = (
+        select(AIJob.id)
+        .where(
+            or_(
+                AIJob.status == "queued",
+                (AIJob.status == "running") & (AIJob.started_at < stale),
+            )
+        )
+        .order_by(AIJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = db.session.execute(
+        update(AIJob)
+        .where(AIJob.id == next_job)
+        .values(status="running", started_at=utcnow(), attempts=AIJob.attempts + 1)
+        .returning(AIJob.id, AIJob.kind, AIJob.owner, AIJob.route, AIJob.payload, AIJob.attempts)
+    ).first()
+    db.session.commit()
+    return None if row is None else row._asdict()
+
+
+def _finish(app: Flask, job: dict, **values) -> None:
+    now = utcnow()
+    db.session.execute(
+        update(AIJob)
+        # A job reclaimed as stale belongs to its newest attempt
+        .where(AIJob.id == job["id"], AIJob.attempts == job["attempts"])
+        .values(
+            finished_at=now,
+            expires_at=now + timedelta(seconds=app.config["AI_JOB_RESULT_TTL_SECONDS"]),
+            **values,
+        )
+    )
+    db.session.commit()
+    _notify(job["id"])
+
+
+def _run(app: Flask, job: dict) -> None:
+    from app.services.ai_handler import ahandle_patient_ai
+
+    if job["attempts"] > app.config["AI_JOB_MAX_ATTEMPTS"]:
+        _finish(app, job, status="failed", error="worker lost too many times")
+        return
+    try:
+        with usage.attributed(usage.Attribution(job["route"])):
+            result = asyncio.run(ahandle_patient_ai(job["payload"], owner=job["owner"]))
+        result = json.loads(json.dumps(result, default=str))
+    except Exception as e:
+        print("AI job failed:", job["id"], e)
+        db.session.rollback()
+        _finish(app, job, status="failed", error=str(e))
+        return
+    _finish(app, job, status="done", result=result)
+
+
+def _cleanup() -> None:
+    db.session.execute(delete(AIJob).where(AIJob.expires_at < utcnow()))
+    db.session.commit()
+
+
+def _work(app: Flask) -> None:
+    next_cleanup = monotonic()
+    while True:
+        claimed = False
+        with app.app_context():
+            try:
+                job = _claim(app)
+                if job is not None:
+                    claimed = True
+                    _run(app, job)
+                elif monotonic() >= next_cleanup:
+                    next_cleanup = monotonic() + _CLEANUP_SECONDS
+                    _cleanup()
+            except Exception as e:
+                print("AI job worker error:", e)
+                db.session.rollback()
+        if not claimed:
+            _wake.wait(app.config["AI_JOB_POLL_SECONDS"])
+            _wake.clear()
+
+
+def ensure_workers(app: Flask) -> None:
+    """
+    Start this process's worker threads (again after a fork).
+    """
+    global _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        for i in range(app.config["AI_JOB_WORKERS"]):
+            threading.Thread(target=_work, args=(app,), name=f"ai-job-{i}", daemon=True).start()
+
+
+def init_ai_jobs(app: Flask) -> None:
+    """
+    Start the workers with the first request each process serves, so
+    jobs queued before a restart are picked up. No-op when AI_JOBS=0 or
+    the AI routes are off.
+    """
+    if not app.config["AI_JOBS"] or not app.config["ENABLE_AI_ROUTES"]:
+        return
+
+    def start_workers():
+        ensure_workers(app)
+
+    app.before_request(start_workers)
+
+
+# ---------- Responses ----------
+
+
+def accepted(job: AIJob, location: str, present: Callable[[dict], dict]):
+    """
+    202 for a queued request. A repeat of a finished one gets its result.
+    """
+    if job.status in ("done", "failed"):
+        return job_response(job, present)
+    response = jsonify({"job_id": str(job.id), "status": job.status, "poll": location})
+    response.status_code = 202
+    response.headers["Location"] = location
+    response.headers["Retry-After"] = str(max(1, round(current_app.config["AI_JOB_POLL_SECONDS"])))
+    return response
+
+
+def poll_wait() -> float:
+    """
+    ?wait=<seconds>, capped at AI_JOB_MAX_WAIT_SECONDS.
+    """
+    try:
+        wait = float(request.args.get("wait", "0"))
+    except ValueError:
+        wait = 0
+    return min(max(wait, 0), current_app.config["AI_JOB_MAX_WAIT_SECONDS"])
+
+
+def job_response(job: AIJob, present: Callable[[dict], dict]):
+    """
+    200 with the presented result, 202 while queued or running, 502
+    when the job failed.
+    """
+    if job.status == "done":
+        return jsonify({"job_id": str(job.id), "status": "done", **present(job.result)}), 200
+    if job.status == "failed":
+        return jsonify({"job_id": str(job.id), "status": "failed", "error": "Analysis failed"}), 502
+    response = jsonify({"job_id": str(job.id), "status": job.status})
+    response.status_code = 202
+    response.headers["Retry-After"] = str(max(1, round(current_app.config["AI_JOB_POLL_SECONDS"])))
+    return response
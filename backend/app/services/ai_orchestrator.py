@@ -1,7 +1,44 @@
 import os
+from app.services import usage
 from app.services.health_insights import extract_clinical_signals
 from app.services.openrouter_provider import OpenRouterProvider
-from app.services.central_client import call_central_backend  # new import
+from app.services.central_client import (  # new import
+    acall_central_backend,
+    call_central_backend,
+)
+
+
+def _provider_name() -> str:
+    return os.getenv("AI_PROVIDER", "central").lower()
+
+
+def _from_central(clinical_signals: dict, central_result: dict) -> dict:
+    explanation = (
+        central_result.get("ai_explanation")
+        or (central_result.get("counselling") or {}).get("message")
+        or ""
+    )
+    confidence = central_result.get("confidence", 0.5)
+
+    return {
+        "clinical_signals": central_result.get(
+            "clinical_signals", clinical_signals
+        ),
+        "explanation": explanation,
+        "confidence": confidence,
+        "risk_level": central_result.get("risk_level"),
+        "escalation": central_result.get("escalation"),
+        "safety_flags": central_result.get("safety_flags"),
+        "disclaimer": central_result.get("disclaimer"),
+    }
+
+
+def _from_openrouter(clinical_signals: dict, reasoning: dict) -> dict:
+    return {
+        "clinical_signals": clinical_signals,
+        "explanation": reasoning.get("explanation", ""),
+        "confidence": reasoning.get("confidence", 0.5),
+    }
 
 
 def analyze_patient_context(context: dict) -> dict:
@@ -13,7 +50,7 @@ def analyze_patient_context(context: dict) -> dict:
     """
     clinical_signals = extract_clinical_signals(context)
 
-    provider_name = os.getenv("AI_PROVIDER", "central").lower()
+    provider_name = _provider_name()
 
     # Preferred path: delegate to central backend
     if provider_name == "central":
@@ -21,36 +58,43 @@ def analyze_patient_context(context: dict) -> dict:
             **context,
             "clinical_signals": clinical_signals,
         }
-        central_result = call_central_backend(central_payload)
-
-        explanation = (
-            central_result.get("ai_explanation")
-            or (central_result.get("counselling") or {}).get("message")
-            or ""
-        )
-        confidence = central_result.get("confidence", 0.5)
-
-        return {
-            "clinical_signals": central_result.get(
-                "clinical_signals", clinical_signals
-            ),
-            "explanation": explanation,
-            "confidence": confidence,
-            "risk_level": central_result.get("risk_level"),
-            "escalation": central_result.get("escalation"),
-            "safety_flags": central_result.get("safety_flags"),
-            "disclaimer": central_result.get("disclaimer"),
-        }
+        with usage.attributed(patient_id=context.get("patient_id")):
+            central_result = call_central_backend(central_payload)
+        return _from_central(clinical_signals, central_result)
 
     # Legacy path: direct OpenRouter provider
     elif provider_name == "openrouter":
         ai = OpenRouterProvider()
-        reasoning = ai.analyze(clinical_signals)
-        return {
+        with usage.attributed(patient_id=context.get("patient_id")):
+            reasoning = ai.analyze(clinical_signals)
+        return _from_openrouter(clinical_signals, reasoning)
+
+    else:
+        raise RuntimeError(f"Unsupported AI_PROVIDER: {provider_name}")
+
+
+async def aanalyze_patient_context(context: dict) -> dict:
+    """
+    Async variant of analyze_patient_context used by the async /analyze/ view.
+    """
+    clinical_signals = extract_clinical_signals(context)
+
+    provider_name = _provider_name()
+
+    if provider_name == "central":
+        central_payload = {
+            **context,
             "clinical_signals": clinical_signals,
-            "explanation": reasoning.get("explanation", ""),
-            "confidence": reasoning.get("confidence", 0.5),
         }
+        with usage.attributed(patient_id=context.get("patient_id")):
+            central_result = await acall_central_backend(central_payload)
+        return _from_central(clinical_signals, central_result)
+
+    elif provider_name == "openrouter":
+        ai = OpenRouterProvider()
+        with usage.attributed(patient_id=context.get("patient_id")):
+            reasoning = await ai.aanalyze(clinical_signals)
+        return _from_openrouter(clinical_signals, reasoning)
 
     else:
         raise RuntimeError(f"Unsupported AI_PROVIDER: {provider_name}")
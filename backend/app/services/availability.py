@@ -0,0 +1,195 @@
+# app/services/availability.py
+
+"""
+Doctor availability: weekly working hours minus booked appointments.
+
+All intervals are half-open [start, end) in aware datetimes. Free time is
+computed by merging the working intervals and the booked intervals (each
+sorted by start) and subtracting one from the other in a single sweep.
+That is O(n log n) in the number of intervals, and the booked ranges come
+from one index range scan on (doctor_id, start_time).
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select
+
+from app import db
+from app.sql_models import Appointment, Doctor, DoctorWorkingHours
+
+# Used when an appointment is booked without an end_time
+DEFAULT_APPOINTMENT_MINUTES = 30
+# Upper bound on an appointment's length; lets the booked-range query
+# use a plain index range on start_time
+MAX_APPOINTMENT = timedelta(hours=12)
+MAX_SEARCH_DAYS = 31
+
+# Statuses that free their slot again
+INACTIVE_STATUSES = ("cancelled",)
+
+Interval = tuple[datetime, datetime]
+
+
+def aware(value: datetime) -> datetime:
+    """
+    Naive datetimes are taken as server-local time, as elsewhere in the app.
+    """
+    return value if value.tzinfo else value.astimezone()
+
+
+def merge(intervals: Iterable[Interval]) -> list[Interval]:
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(free: list[Interval], busy: list[Interval]) -> list[Interval]:
+    """
+    free minus busy; both merged and sorted.
+    """
+    result: list[Interval] = []
+    j = 0
+    for start, end in free:
+        cursor = start
+        # Skip busy intervals that end before this free interval
+        while j < len(busy) and busy[j][1] <= cursor:
+            j += 1
+        k = j
+        while k < len(busy) and busy[k][0] < end:
+            if busy[k][0] > cursor:
+                result.append((cursor, busy[k][0]))
+            cursor = max(cursor, busy[k][1])
+            k += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def working_intervals(hours: list[DoctorWorkingHours], first: date, last: date) -> list[Interval]:
+    """
+    Concrete intervals for every date in [first, last], in each row's timezone.
+    """
+    intervals = []
+    day = first
+    while day <= last:
+        for row in hours:
+            if row.weekday != day.weekday():
+                continue
+            tz = ZoneInfo(row.timezone)
+            start = datetime.combine(day, row.start_time, tzinfo=tz)
+            end_day = day if row.end_time > row.start_time else day + timedelta(days=1)
+            end = datetime.combine(end_day, row.end_time, tzinfo=tz)
+            intervals.append((start, end))
+        day += timedelta(days=1)
+    return merge(intervals)
+
+
+def _appointment_end():
+    return func.coalesce(
+        Appointment.end_time,
+        Appointment.start_time + timedelta(minutes=DEFAULT_APPOINTMENT_MINUTES),
+    )
+
+
+def booked_intervals(doctor_id, start: datetime, end: datetime,
+                     exclude_id=None) -> list[Interval]:
+    """
+    Active appointments of the doctor overlapping [start, end), merged.
+    """
+    query = select(Appointment.start_time, _appointment_end()).where(
+        Appointment.doctor_id == doctor_id,
+        # Index range: nothing starting earlier can still be running
+        Appointment.start_time >= start - MAX_APPOINTMENT,
+        Appointment.start_time < end,
+        _appointment_end() > start,
+        Appointment.status.notin_(INACTIVE_STATUSES),
+    )
+    if exclude_id is not None:
+        query = query.where(Appointment.id != exclude_id)
+    return merge(db.session.execute(query).all())
+
+
+def find_slots(doctor_id, first: date, last: date, duration: timedelta,
+               now: Optional[datetime] = None) -> list[Interval]:
+    hours = DoctorWorkingHours.query.filter_by(doctor_id=doctor_id).all()
+    working = working_intervals(hours, first, last)
+    if not working:
+        return []
+
+    now = now or datetime.now(timezone.utc)
+    busy = booked_intervals(doctor_id, working[0][0], working[-1][1])
+    step = timedelta(minutes=min(h.slot_minutes for h in hours))
+    # Booked times come back in UTC; report slots in the doctor's timezone
+    tz = ZoneInfo(hours[0].timezone)
+
+    slots = []
+    for start, end in subtract(working, busy):
+        slot = start.astimezone(tz)
+        while slot + duration <= end:
+            if slot >= now:
+                slots.append((slot, slot + duration))
+            slot += step
+    return slots
+
+
+def within_working_hours(doctor_id, start: datetime, end: datetime) -> bool:
+    """
+    True when [start, end) fits in one working interval, or the doctor
+    has not published working hours.
+    """
+    hours = DoctorWorkingHours.query.filter_by(doctor_id=doctor_id).all()
+    if not hours:
+        return True
+    start, end = aware(start), aware(end)
+    # A day either side covers every timezone offset and overnight shifts
+    working = working_intervals(hours, start.date() - timedelta(days=1), end.date() + timedelta(days=1))
+    return any(w_start <= start and end <= w_end for w_start, w_end in working)
+
+
+def booking_window(start_raw, end_raw) -> Interval:
+    """
+    Parse an appointment's start/end from request JSON; end defaults to
+    DEFAULT_APPOINTMENT_MINUTES after start. Raises ValueError with a
+    client-facing message.
+    """
+    try:
+        start = datetime.fromisoformat(start_raw)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid or missing start_time")
+    if end_raw:
+        try:
+            end = datetime.fromisoformat(end_raw)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid end_time")
+    else:
+        end = start + timedelta(minutes=DEFAULT_APPOINTMENT_MINUTES)
+
+    length = aware(end) - aware(start)
+    if length <= timedelta(0):
+        raise ValueError("end_time must be after start_time")
+    if length > MAX_APPOINTMENT:
+        raise ValueError("Appointment is too long")
+    return start, end
+
+
+def lock_doctor(doctor_id) -> bool:
+    """
+    Row-lock the doctor until commit so overlapping bookings for the same
+    doctor check and insert one at a time. False if no such doctor.
+    """
+    return db.session.execute(
+        select(Doctor.id).where(Doctor.id == doctor_id).with_for_update()
+    ).first() is not None
+
+
+def is_free(doctor_id, start: datetime, end: datetime, exclude_id=None) -> bool:
+    return not booked_intervals(doctor_id, aware(start), aware(end), exclude_id)
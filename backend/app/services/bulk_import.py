@@ -0,0 +1,429 @@
+# app/services/bulk_import.py
+
+"""
+Bulk import of medications and appointments for clinic onboarding.
+
+Rows arrive as a JSON array or CSV. They are validated in one pass,
+patients are resolved with a single query, and the valid rows are
+written in one transaction: COPY on PostgreSQL, multi-row INSERT
+elsewhere. Invalid rows are reported back by row number (1 = first data
+row) and skipped.
+
+COPY and Core inserts bypass the ORM flush hooks, so this module bumps
+data_versions and appends change_log entries itself.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Iterable, Optional
+from uuid import UUID, uuid4
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import DBAPIError
+
+from app import db, tracing
+from app.services import availability, change_log, data_versions
+from app.sql_models import Appointment, ChangeLogEntry, Medication, Patient, User, utcnow
+
+MAX_ROWS = 100_000
+# Only the first errors are listed; error_count has the total
+MAX_REPORTED_ERRORS = 1000
+# Below this a multi-row INSERT is as fast as COPY
+COPY_MIN_ROWS = 500
+INSERT_BATCH_SIZE = 5000
+
+MEDICATION_COLUMNS = (
+    "id", "patient_id", "prescribed_by", "name", "dosage", "frequency", "route",
+    "start_date", "end_date", "instructions", "is_active", "created_at", "updated_at",
+)
+APPOINTMENT_COLUMNS = (
+    "id", "patient_id", "doctor_id", "start_time", "end_time", "status",
+    "reason", "notes", "created_at", "updated_at",
+)
+# txid is left to its server default
+CHANGE_LOG_COLUMNS = ("patient_id", "entity", "entity_id", "op", "changed_at")
+
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n"}
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class BulkResult:
+    received: int
+    dry_run: bool = False
+    inserted: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def fail(self, row: int, message: str) -> None:
+        self.errors.append({"row": row, "error": message})
+
+    def to_dict(self) -> dict:
+        errors = sorted(self.errors, key=lambda e: e["row"])
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "dry_run": self.dry_run,
+            "error_count": len(errors),
+            "errors": errors[:MAX_REPORTED_ERRORS],
+        }
+
+
+# ---------- Input ----------
+
+
+def parse_csv(text: str) -> list[dict]:
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    if not reader.fieldnames:
+        raise ValueError("CSV has no header row")
+    reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+    return list(reader)
+
+
+def parse_json(payload) -> list[dict]:
+    """
+    Accepts a bare array or {"rows": [...]}.
+    """
+    if isinstance(payload, dict):
+        payload = payload.get("rows")
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of rows")
+    return payload
+
+
+def read_request_rows(request) -> list[dict]:
+    """
+    Rows from a JSON body, a text/csv body, or a multipart upload in `file`.
+    Raises ValueError with a client-facing message.
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        raw = upload.read().decode("utf-8-sig")
+        if (upload.filename or "").lower().endswith(".json"):
+            rows = parse_json(json.loads(raw))
+        else:
+            rows = parse_csv(raw)
+    elif request.mimetype == "text/csv":
+        rows = parse_csv(request.get_data(as_text=True))
+    else:
+        rows = parse_json(request.get_json(silent=True))
+
+    if not rows:
+        raise ValueError("No rows to import")
+    if len(rows) > MAX_ROWS:
+        raise ValueError(f"At most {MAX_ROWS} rows per import")
+    return rows
+
+
+def read_file_rows(path: str) -> list[dict]:
+    with open(path, encoding="utf-8-sig") as fh:
+        if path.lower().endswith(".json"):
+            return parse_json(json.load(fh))
+        return parse_csv(fh.read())
+
+
+# ---------- Field validation ----------
+
+
+def _text(row: dict, key: str, max_len: int, required: bool = False) -> Optional[str]:
+    value = row.get(key)
+    if value is not None and not isinstance(value, str):
+        value = str(value)
+    value = (value or "").strip() or None
+    if value is None and required:
+        raise RowError(f"{key} is required")
+    if value is not None and len(value) > max_len:
+        raise RowError(f"{key} is longer than {max_len} characters")
+    return value
+
+
+def _date(row: dict, key: str) -> Optional[date]:
+    value = _text(row, key, 32)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        raise RowError(f"Invalid {key}")
+
+
+def _bool(row: dict, key: str, default: bool) -> bool:
+    value = row.get(key)
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise RowError(f"Invalid {key}")
+
+
+def _uuid(row: dict, key: str) -> Optional[UUID]:
+    value = _text(row, key, 64)
+    if value is None:
+        return None
+    try:
+        return UUID(value)
+    except ValueError:
+        raise RowError(f"Invalid {key}")
+
+
+def _patient_ref(row: dict) -> tuple[str, object]:
+    patient_id = _uuid(row, "patient_id")
+    if patient_id is not None:
+        return ("id", patient_id)
+    email = _text(row, "patient_email", 255)
+    if email is not None:
+        return ("email", email.lower())
+    raise RowError("patient_id or patient_email is required")
+
+
+def resolve_patients(refs: Iterable[tuple[str, object]]) -> dict[tuple[str, object], UUID]:
+    """
+    Map ("id", uuid) / ("email", address) references to patient ids in
+    one query. Unknown references are left out.
+    """
+    refs = set(refs)
+    ids = [value for kind, value in refs if kind == "id"]
+    emails = [value for kind, value in refs if kind == "email"]
+    if not refs:
+        return {}
+
+    rows = db.session.execute(
+        select(Patient.id, User.email)
+        .join(User, User.id == Patient.id)
+        .where(or_(Patient.id.in_(ids), func.lower(User.email).in_(emails)))
+    ).all()
+
+    resolved = {}
+    for patient_id, email in rows:
+        resolved[("id", patient_id)] = patient_id
+        resolved[("email", email.lower())] = patient_id
+    return resolved
+
+
+def _validate(rows: list[dict], result: BulkResult,
+              parse: Callable[[dict], dict]) -> list[tuple[int, dict]]:
+    """
+    Parse every row and attach patient_id. Returns [(row number, record)].
+    """
+    parsed = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            result.fail(number, "Row must be an object")
+            continue
+        try:
+            parsed.append((number, _patient_ref(row), parse(row)))
+        except RowError as e:
+            result.fail(number, str(e))
+
+    patients = resolve_patients(ref for _, ref, _ in parsed)
+
+    valid = []
+    for number, ref, record in parsed:
+        patient_id = patients.get(ref)
+        if patient_id is None:
+            result.fail(number, "Unknown patient")
+            continue
+        record["patient_id"] = patient_id
+        valid.append((number, record))
+    return valid
+
+
+# ---------- Writing ----------
+
+
+def _copy_supported(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    raw = connection.connection.dbapi_connection
+    with raw.cursor() as cursor:
+        # psycopg2: copy_expert; psycopg 3: copy
+        return hasattr(cursor, "copy_expert") or hasattr(cursor, "copy")
+
+
+def _copy(connection, table, columns: tuple, records: list[dict]) -> None:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for record in records:
+        # None is written as an empty unquoted field, which COPY reads as NULL
+        writer.writerow([record[c] for c in columns])
+    sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    raw = connection.connection.dbapi_connection
+    with raw.cursor() as cursor:
+        if hasattr(cursor, "copy_expert"):
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buf.getvalue())
+
+
+def _insert(connection, table, columns: tuple, records: list[dict]) -> None:
+    with tracing.span(f"bulk_import.{table.name}", kind="client", **{"db.rows": len(records)}):
+        if len(records) >= COPY_MIN_ROWS and _copy_supported(connection):
+            dbapi_error = connection.dialect.dbapi.Error
+            try:
+                _copy(connection, table, columns, records)
+            except dbapi_error as e:
+                # Raw cursor errors: wrap like Core does (IntegrityError etc.)
+                raise DBAPIError.instance(f"COPY {table.name}", None, e, dbapi_error)
+        else:
+            for start in range(0, len(records), INSERT_BATCH_SIZE):
+                connection.execute(table.insert(), records[start:start + INSERT_BATCH_SIZE])
+
+
+def write_rows(model, columns: tuple, records: list[dict]) -> None:
+    """
+    Insert `records` in the session's transaction and record the change
+    for conditional GETs and /sync.
+    """
+    if not records:
+        return
+    connection = db.session.connection()
+    _insert(connection, model.__table__, columns, records)
+
+    keys = set()
+    for collection, kind, column in data_versions.TRACKED[model]:
+        values = {r[column] for r in records} - {None}
+        keys.update((collection, data_versions.scope(kind, v)) for v in values)
+    data_versions.bump(connection, keys)
+
+    # Same rows change_log.record() would write, but as one COPY
+    entity, column = change_log.TRACKED[model]
+    now = utcnow()
+    _insert(
+        connection,
+        ChangeLogEntry.__table__,
+        CHANGE_LOG_COLUMNS,
+        [
+            {"patient_id": r[column], "entity": entity, "entity_id": r["id"],
+             "op": "upsert", "changed_at": now}
+            for r in records
+        ],
+    )
+
+
+# ---------- Medications ----------
+
+
+def _parse_medication(row: dict) -> dict:
+    return {
+        "name": _text(row, "name", 255, required=True),
+        "dosage": _text(row, "dosage", 100),
+        "frequency": _text(row, "frequency", 100),
+        "route": _text(row, "route", 50),
+        "start_date": _date(row, "start_date"),
+        "end_date": _date(row, "end_date"),
+        "instructions": _text(row, "instructions", 10_000),
+        "is_active": _bool(row, "is_active", True),
+    }
+
+
+def import_medications(rows: list[dict], doctor_id, dry_run: bool = False) -> BulkResult:
+    """
+    Prescribe each row's medication to its patient as `doctor_id`.
+    The caller commits (or rolls back for a dry run).
+    """
+    result = BulkResult(received=len(rows), dry_run=dry_run)
+    now = utcnow()
+
+    records = []
+    for _, record in _validate(rows, result, _parse_medication):
+        record.update(id=uuid4(), prescribed_by=doctor_id, created_at=now, updated_at=now)
+        records.append(record)
+
+    if not dry_run:
+        write_rows(Medication, MEDICATION_COLUMNS, records)
+    result.inserted = 0 if dry_run else len(records)
+    return result
+
+
+# ---------- Appointments ----------
+
+
+def _parse_appointment(row: dict) -> dict:
+    try:
+        start, end = availability.booking_window(
+            _text(row, "start_time", 64), _text(row, "end_time", 64)
+        )
+    except ValueError as e:
+        raise RowError(str(e))
+    return {
+        "doctor_id": _uuid(row, "doctor_id"),
+        "start_time": availability.aware(start),
+        "end_time": availability.aware(end),
+        "reason": _text(row, "reason", 255),
+        "notes": _text(row, "notes", 10_000),
+    }
+
+
+def _free_of_overlaps(doctor_id, rows: list[tuple[int, dict]],
+                      result: BulkResult) -> list[dict]:
+    """
+    Keep the rows that overlap neither an existing booking nor an earlier
+    row of the same import. Call with the doctor's row lock held.
+    """
+    rows = sorted(rows, key=lambda r: (r[1]["start_time"], r[0]))
+    busy = availability.booked_intervals(
+        doctor_id,
+        rows[0][1]["start_time"],
+        max(record["end_time"] for _, record in rows),
+    )
+
+    kept, j, last_end = [], 0, None
+    for number, record in rows:
+        start, end = record["start_time"], record["end_time"]
+        # Rows come in start order, so the busy pointer only moves forward
+        while j < len(busy) and busy[j][1] <= start:
+            j += 1
+        if j < len(busy) and busy[j][0] < end:
+            result.fail(number, "Time slot is already booked")
+        elif last_end is not None and start < last_end:
+            result.fail(number, "Overlaps another row in this import")
+        else:
+            kept.append(record)
+            last_end = end
+    return kept
+
+
+def import_appointments(rows: list[dict], doctor_id, dry_run: bool = False) -> BulkResult:
+    """
+    Book each row with its doctor (doctor_id column, default `doctor_id`).
+    Takes each doctor's row lock in id order, like single bookings, so the
+    overlap check holds until the caller commits.
+    """
+    result = BulkResult(received=len(rows), dry_run=dry_run)
+
+    by_doctor: dict[UUID, list[tuple[int, dict]]] = {}
+    for number, record in _validate(rows, result, _parse_appointment):
+        record["doctor_id"] = record["doctor_id"] or doctor_id
+        by_doctor.setdefault(record["doctor_id"], []).append((number, record))
+
+    now = utcnow()
+    records = []
+    for doctor in sorted(by_doctor, key=str):
+        if not availability.lock_doctor(doctor):
+            for number, _ in by_doctor[doctor]:
+                result.fail(number, "Doctor not found")
+            continue
+        for record in _free_of_overlaps(doctor, by_doctor[doctor], result):
+            record.update(id=uuid4(), status="scheduled", created_at=now, updated_at=now)
+            records.append(record)
+
+    if not dry_run:
+        write_rows(Appointment, APPOINTMENT_COLUMNS, records)
+    result.inserted = 0 if dry_run else len(records)
+    return result
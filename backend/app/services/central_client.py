@@ -1,10 +1,68 @@
+import asyncio
 import os
 import requests
 
+from app import tracing
+from app.metrics import external_call
+from app.services import engine_loop
+
 CENTRAL_BACKEND_URL = os.getenv(
     "CENTRAL_BACKEND_URL",
     "https://viora-central-backend.onrender.com",
 )
+CENTRAL_TIMEOUT_SECONDS = 10
+
+
+def _normalize_central_response(data: dict) -> dict:
+    """
+    Ensure minimal keys exist for downstream logic.
+    """
+    return {
+        "risk_level": data.get("risk_level", "UNKNOWN"),
+        "ai_explanation": data.get("ai_explanation")
+        or data.get("counselling", {}).get("message")
+        or "I have analyzed your symptoms, but my explanation is limited right now.",
+        "confidence": data.get("confidence", 0.0),
+        "escalation": data.get("escalation", {}),
+        "safety_flags": data.get("safety_flags", {}),
+        "clinical_signals": data.get("clinical_signals", {}),
+        "counselling": data.get("counselling"),
+        "disclaimer": data.get("disclaimer"),
+    }
+
+
+def _central_unavailable() -> dict:
+    # Patient app must NEVER crash
+    return {
+        "risk_level": "UNKNOWN",
+        "ai_explanation": (
+            "I’m having a small delay understanding your symptoms right now. "
+            "Please give me a moment and try again shortly."
+        ),
+        "confidence": 0.0,
+        "escalation": {
+            "requires_doctor": False,
+            "reason": "central_unavailable",
+        },
+        "safety_flags": {},
+        "clinical_signals": {},
+        "counselling": None,
+        "disclaimer": None,
+    }
+
+
+def _report_usage(call, data) -> None:
+    # Token counts, when central passes on its model's usage
+    if isinstance(data, dict):
+        call.report_usage(data.get("usage"), model=data.get("model"))
+
+
+def _central_span(url: str):
+    return tracing.span(
+        "POST /doctor/ask-nurse",
+        kind="client",
+        **{"http.request.method": "POST", "url.full": url, "peer.service": "central_backend"},
+    )
 
 
 def call_central_backend(payload: dict) -> dict:
@@ -12,44 +70,66 @@ def call_central_backend(payload: dict) -> dict:
     Sends patient context to central brain and returns raw clinical output.
     Never raises to the caller; always returns a safe dict.
     """
-    try:
-        resp = requests.post(
-            f"{CENTRAL_BACKEND_URL}/doctor/ask-nurse",
-            json=payload,
-            timeout=10,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-
-        # Ensure minimal keys exist for downstream logic
-        return {
-            "risk_level": data.get("risk_level", "UNKNOWN"),
-            "ai_explanation": data.get("ai_explanation")
-            or data.get("counselling", {}).get("message")
-            or "I have analyzed your symptoms, but my explanation is limited right now.",
-            "confidence": data.get("confidence", 0.0),
-            "escalation": data.get("escalation", {}),
-            "safety_flags": data.get("safety_flags", {}),
-            "clinical_signals": data.get("clinical_signals", {}),
-            "counselling": data.get("counselling"),
-            "disclaimer": data.get("disclaimer"),
-        }
-
-    except requests.RequestException:
-        # Patient app must NEVER crash
-        return {
-            "risk_level": "UNKNOWN",
-            "ai_explanation": (
-                "I’m having a small delay understanding your symptoms right now. "
-                "Please give me a moment and try again shortly."
-            ),
-            "confidence": 0.0,
-            "escalation": {
-                "requires_doctor": False,
-                "reason": "central_unavailable",
-            },
-            "safety_flags": {},
-            "clinical_signals": {},
-            "counselling": None,
-            "disclaimer": None,
-        }
+    url = f"{CENTRAL_BACKEND_URL}/doctor/ask-nurse"
+    with external_call("central_backend") as call, _central_span(url) as span:
+        try:
+            resp = requests.post(
+                url,
+                json=payload,
+                headers=tracing.inject_headers(),
+                timeout=CENTRAL_TIMEOUT_SECONDS,
+            )
+            tracing.set_attributes(span, **{"http.response.status_code": resp.status_code})
+            resp.raise_for_status()
+            data = resp.json()
+            _report_usage(call, data)
+            return _normalize_central_response(data)
+
+        except requests.RequestException:
+            call.fail()
+            tracing.set_attributes(span, **{"error.type": "central_unavailable"})
+            return _central_unavailable()
+
+
+def _new_async_client():
+    import httpx
+
+    return httpx.AsyncClient(timeout=CENTRAL_TIMEOUT_SECONDS)
+
+
+# Lives on the engine loop, so connections are reused across requests
+_async_client = engine_loop.Local(_new_async_client)
+
+
+async def _apost(url: str, payload: dict, headers: dict):
+    # Runs on the engine loop
+    resp = await _async_client.get().post(url, json=payload, headers=headers)
+    await resp.aread()
+    return resp
+
+
+async def acall_central_backend(payload: dict) -> dict:
+    """
+    Async variant of call_central_backend for the async views.
+    Same contract: never raises, always returns a safe dict.
+    """
+    import httpx
+
+    url = f"{CENTRAL_BACKEND_URL}/doctor/ask-nurse"
+    with external_call("central_backend") as call, _central_span(url) as span:
+        try:
+            # Flask runs each async view on its own event loop, and httpx
+            # connections cannot cross loops: post from the engine loop
+            resp = await asyncio.wrap_future(
+                engine_loop.submit(_apost(url, payload, tracing.inject_headers()))
+            )
+            tracing.set_attributes(span, **{"http.response.status_code": resp.status_code})
+            resp.raise_for_status()
+            data = resp.json()
+            _report_usage(call, data)
+            return _normalize_central_response(data)
+
+        except (httpx.HTTPError, ValueError):
+            call.fail()
+            tracing.set_attributes(span, **{"error.type": "central_unavailable"})
+            return _central_unavailable()
@@ -0,0 +1,242 @@
+# app/services/change_log.py
+
+"""
+Per-patient change log behind GET /sync.
+
+Every ORM flush that creates, updates or deletes a patient-owned row
+appends (patient_id, entity, entity_id, op) to change_log in the same
+transaction. Sync cursors walk it in (txid, id) order.
+
+Why txid and not just the BIGSERIAL id: ids are handed out at insert time
+but become visible at commit time, so id 41 can commit after id 42 has
+been read and a cursor at 42 would skip it forever. A cursor instead only
+advances to the snapshot xmin, the oldest transaction still running. Every
+transaction below it has finished, so nothing can still appear behind
+the cursor. Changes newer than xmin are picked up by the next sync.
+
+Writes that bypass the ORM (Core inserts, COPY, raw SQL) must call
+record() themselves.
+
+Retention: `flask maintain-partitions` deletes entries older than
+CHANGE_LOG_RETENTION_DAYS (0 keeps them all) and remembers the newest
+(txid, id) it deleted in change_log_pruned. A cursor before that point
+may have missed changes, so /sync answers it with a full resync.
+"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import chain
+from typing import Iterable
+
+from flask import Flask
+from sqlalchemy import event, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.sql_models import (
+    Appointment,
+    ChangeLogEntry,
+    ChangeLogPruned,
+    Medication,
+    MedicationEvent,
+    Patient,
+    PatientReport,
+    User,
+    utcnow,
+)
+
+# model -> (entity name, column holding the owning patient's id)
+TRACKED = {
+    Medication: ("medication", "patient_id"),
+    Appointment: ("appointment", "patient_id"),
+    PatientReport: ("report", "patient_id"),
+    MedicationEvent: ("medication_event", "patient_id"),
+    # patients.id == users.id
+    Patient: ("profile", "id"),
+    User: ("profile", "id"),
+}
+
+TOKEN_VERSION = "1"
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """
+    Exclusive lower bound on (txid, id).
+    """
+
+    txid: int
+    id: int
+
+    def encode(self) -> str:
+        raw = f"{TOKEN_VERSION}:{self.txid}:{self.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        """
+        Raises ValueError for anything that is not a token we issued.
+        """
+        padded = token + "=" * (-len(token) % 4)
+        version, txid, id_ = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        if version != TOKEN_VERSION:
+            raise ValueError("unsupported token version")
+        return cls(int(txid), int(id_))
+
+    @classmethod
+    def at_horizon(cls, horizon: int) -> "Cursor":
+        # (txid, id) > (horizon, -1)  <=>  txid >= horizon
+        return cls(horizon, -1)
+
+
+def _entries(session: Session) -> list[dict]:
+    dirty = (o for o in session.dirty if session.is_modified(o, include_collections=False))
+    now = utcnow()
+    seen = {}
+    for obj, op in chain(
+        ((o, "upsert") for o in session.new),
+        ((o, "upsert") for o in dirty),
+        ((o, "delete") for o in session.deleted),
+    ):
+        tracked = TRACKED.get(type(obj))
+        if tracked is None or (isinstance(obj, User) and obj.role != "patient"):
+            continue
+        entity, column = tracked
+        patient_id = getattr(obj, column)
+        if patient_id is None:
+            continue
+        entity_id = patient_id if entity == "profile" else obj.id
+        # Last op wins for rows touched twice in one flush
+        seen[(entity, entity_id)] = {
+            "patient_id": patient_id,
+            "entity": entity,
+            "entity_id": entity_id,
+            "op": op,
+            "changed_at": now,
+        }
+    return list(seen.values())
+
+
+def record(connection, entries: Iterable[dict]) -> None:
+    """
+    Append change_log rows: dicts with patient_id, entity, entity_id, op.
+    """
+    rows = [{"changed_at": utcnow(), **e} for e in entries]
+    if rows:
+        connection.execute(ChangeLogEntry.__table__.insert(), rows)
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    record(session.connection(), _entries(session))
+
+
+def init_change_log() -> None:
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def horizon() -> int:
+    """
+    Oldest transaction id still running: every change below it is final.
+    """
+    return db.session.execute(
+        text("SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint")
+    ).scalar_one()
+
+
+def changes_since(patient_id, cursor: Cursor, limit: int) -> tuple[dict, Cursor, bool]:
+    """
+    Collapse the log after `cursor` to the latest op per entity.
+    Returns ({(entity, entity_id): op}, next cursor, has_more).
+    """
+    upper = horizon()
+    rows = db.session.execute(
+        select(ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.op,
+               ChangeLogEntry.txid, ChangeLogEntry.id)
+        .where(
+            ChangeLogEntry.patient_id == patient_id,
+            tuple_(ChangeLogEntry.txid, ChangeLogEntry.id) > tuple_(cursor.txid, cursor.id),
+            ChangeLogEntry.txid < upper,
+        )
+        .order_by(ChangeLogEntry.txid, ChangeLogEntry.id)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    ops = {}
+    for entity, entity_id, op, _, _ in rows:
+        ops[(entity, entity_id)] = op
+
+    if has_more:
+        last = rows[-1]
+        next_cursor = Cursor(last.txid, last.id)
+    else:
+        next_cursor = Cursor.at_horizon(max(upper, cursor.txid))
+    return ops, next_cursor, has_more
+
+
+# ---------- Retention ----------
+
+
+def expired(cursor: Cursor) -> bool:
+    """
+    True when retention deleted entries after `cursor`.
+    """
+    row = db.session.execute(select(ChangeLogPruned.txid, ChangeLogPruned.entry_id)).first()
+    return row is not None and (cursor.txid, cursor.id) < (row.txid, row.entry_id)
+
+
+def prune(app: Flask) -> int:
+    """
+    Delete entries older than CHANGE_LOG_RETENTION_DAYS, a batch per
+    transaction so no lock is held for long. Returns the rows deleted.
+    """
+    days = app.config["CHANGE_LOG_RETENTION_DAYS"]
+    if days <= 0:
+        return 0
+    cutoff = utcnow() - timedelta(days=days)
+    deleted = 0
+    while True:
+        # Newest deleted (txid, id) of the batch, and the batch size
+        row = db.session.execute(
+            text(
+                """
+                WITH gone AS (
+                    DELETE FROM change_log
+                    WHERE id IN (
+                        SELECT id FROM change_log WHERE changed_at < :cutoff LIMIT :batch
+                    )
+                    RETURNING txid, id
+                )
+                SELECT txid, id, count(*) OVER () AS n
+                FROM gone
+                ORDER BY txid DESC, id DESC
+                LIMIT 1
+                """
+            ),
+            {"cutoff": cutoff, "batch": app.config["CHANGE_LOG_PRUNE_BATCH"]},
+        ).first()
+        if row is None:
+            db.session.commit()
+            return deleted
+
+        stmt = insert(ChangeLogPruned).values(id=1, txid=row.txid, entry_id=row.id, pruned_at=utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChangeLogPruned.id],
+            set_={
+                "txid": stmt.excluded.txid,
+                "entry_id": stmt.excluded.entry_id,
+                "pruned_at": stmt.excluded.pruned_at,
+            },
+            # Keep the newest point; batches do not come in (txid, id) order
+            where=tuple_(ChangeLogPruned.txid, ChangeLogPruned.entry_id)
+            < tuple_(stmt.excluded.txid, stmt.excluded.entry_id),
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+        deleted += row.n
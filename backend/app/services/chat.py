@@ -0,0 +1,329 @@
+# app/services/chat.py
+
+"""
+Doctor chat: ChatSession rows of type "doctor" between a patient and a
+doctor actively linked to them, their messages and who is online.
+
+Messages are stored before anyone sees them. `submit` hands a message to
+this process's writer thread, which collects up to
+CHAT_WRITE_BATCH_SIZE messages (waiting at most CHAT_WRITE_DELAY_MS
+after the first), inserts them in one statement, and only then
+publishes each one on the chat bus (see chat_bus) and resolves the
+sender's future. A message someone received is therefore always in
+the history, and a failed insert is reported to the sender instead of
+being half-delivered. When CHAT_WRITE_QUEUE_SIZE messages are already
+waiting, `submit` refuses with WriterBusy.
+
+Presence: each connected device keeps a key per (session, user) in the
+store at CHAT_PRESENCE_STORAGE_URL alive for CHAT_PRESENCE_TTL_SECONDS
+(`heartbeat`). The first device of a user in this process publishes
+"online" and the last one "offline". With several nodes, one node can
+announce "offline" while a device on another is still connected; the
+presence snapshot corrects itself within a heartbeat.
+
+Message ids are uuid4 and created_at is set on submit, so clients order
+by (created_at, id) and resume with `after`.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future, InvalidStateError
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+from uuid import UUID
+
+from flask import Flask, current_app
+from sqlalchemy import insert, select
+
+from app import db
+from app.services.chat_bus import get_bus, node_id
+from app.services.shared_store import get_store
+from app.sql_models import ChatMessage, ChatSession, DoctorPatientLink, User, utcnow
+
+MAX_CLIENT_ID_LENGTH = 100
+
+
+class WriterBusy(Exception):
+    pass
+
+
+def topic(session_id) -> str:
+    return f"session:{session_id}"
+
+
+def bus():
+    return get_bus(current_app.config["CHAT_PUBSUB_URL"])
+
+
+def participant_role(user: User, session: Optional[ChatSession]) -> Optional[str]:
+    """
+    "patient" or "doctor" when `user` takes part in doctor chat `session`.
+    """
+    if session is None or session.type != "doctor":
+        return None
+    if session.patient_id == user.id:
+        return "patient"
+    if session.doctor_id is not None and session.doctor_id == user.id:
+        return "doctor"
+    return None
+
+
+def active_link(doctor_id, patient_id):
+    return select(DoctorPatientLink.id).where(
+        DoctorPatientLink.doctor_id == doctor_id,
+        DoctorPatientLink.patient_id == patient_id,
+        DoctorPatientLink.status == "active",
+    )
+
+
+def validate_content(content) -> str:
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("content is required")
+    content = content.strip()
+    limit = current_app.config["CHAT_MESSAGE_MAX_LENGTH"]
+    if len(content) > limit:
+        raise ValueError(f"content is longer than {limit} characters")
+    return content
+
+
+def validate_client_id(client_id) -> Optional[str]:
+    if client_id is None:
+        return None
+    if not isinstance(client_id, str) or len(client_id) > MAX_CLIENT_ID_LENGTH:
+        raise ValueError(f"client_id must be a string of at most {MAX_CLIENT_ID_LENGTH} characters")
+    return client_id
+
+
+def message_wait(user_id) -> float:
+    """
+    Charge one message to the user's chat bucket (CHAT_RATE_BURST,
+    CHAT_RATE_PER_MINUTE; in the rate-limit store). 0 when it may be
+    sent, else the seconds to wait. An unreachable store lets it through.
+    """
+    config = current_app.config
+    try:
+        return get_store(config["RATE_LIMIT_STORAGE_URL"]).take(
+            f"chat:rl:{user_id}", 1, config["CHAT_RATE_BURST"], config["CHAT_RATE_PER_MINUTE"] / 60
+        )
+    except Exception as e:
+        print("rate limit store unavailable; allowing message:", e)
+        return 0
+
+
+def message_event(message: dict) -> dict:
+    return {
+        "type": "message",
+        "id": str(message["id"]),
+        "session_id": str(message["session_id"]),
+        "sender_type": message["sender_type"],
+        "sender_id": str(message["sender_id"]) if message["sender_id"] else None,
+        "content": message["content"],
+        "client_id": (message.get("extra_metadata") or {}).get("client_id"),
+        "created_at": message["created_at"].isoformat(),
+    }
+
+
+def history_query(session_id: UUID, after: Optional[datetime] = None, before: Optional[datetime] = None, limit: int = 50):
+    """
+    Messages of a session in (created_at, id) order: the first `limit`
+    after `after`, else the last `limit` before `before` (or now).
+    """
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if after is not None:
+        return query.where(ChatMessage.created_at > after).order_by(
+            ChatMessage.created_at, ChatMessage.id
+        ).limit(limit)
+    if before is not None:
+        query = query.where(ChatMessage.created_at < before)
+    return query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit)
+
+
+def ordered(messages: list) -> list:
+    return sorted(messages, key=lambda m: (m.created_at, str(m.id)))
+
+
+def row_event(message: ChatMessage) -> dict:
+    return message_event(
+        {column.name: getattr(message, column.name) for column in ChatMessage.__table__.columns}
+    )
+
+
+# ---------- Writer ----------
+
+_queue: Optional[queue.Queue] = None
+_queue_pid: Optional[int] = None
+_queue_lock = threading.Lock()
+
+
+def _writer_queue(app: Flask) -> queue.Queue:
+    """
+    This process's writer queue; starts the writer thread on first use
+    (again after a fork).
+    """
+    global _queue, _queue_pid
+    if _queue is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue_pid != os.getpid():
+                _queue = queue.Queue(maxsize=app.config["CHAT_WRITE_QUEUE_SIZE"])
+                _queue_pid = os.getpid()
+                threading.Thread(target=_write_forever, args=(app, _queue), name="chat-writer", daemon=True).start()
+    return _queue
+
+
+def submit(session_id: UUID, sender_type: str, sender_id: UUID, content: str, client_id: Optional[str] = None) -> Future:
+    """
+    Queue a message for storage and delivery. The future resolves to its
+    message event once it is stored and published. Raises WriterBusy
+    when the writer is too far behind.
+    """
+    app = current_app._get_current_object()
+    row = {
+        "id": uuid.uuid4(),
+        "session_id": session_id,
+        "sender_type": sender_type,
+        "sender_id": sender_id,
+        "content": content,
+        "extra_metadata": {"client_id": client_id} if client_id else None,
+        "created_at": utcnow(),
+    }
+    future: Future = Future()
+    try:
+        _writer_queue(app).put_nowait((row, future))
+    except queue.Full:
+        raise WriterBusy("Too many messages waiting to be stored; retry shortly") from None
+    return future
+
+
+def _resolve(future: Future, event: Optional[dict] = None, error: Optional[Exception] = None) -> None:
+    # The sender may have gone (its future cancelled); the message stands
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(event)
+    except InvalidStateError:
+        pass
+
+
+def _write_batch(batch: list) -> None:
+    try:
+        db.session.execute(insert(ChatMessage), [row for row, _ in batch])
+        db.session.commit()
+    except Exception as e:
+        print("chat messages not stored:", len(batch), e)
+        db.session.rollback()
+        for _, future in batch:
+            _resolve(future, error=RuntimeError("Message could not be stored"))
+        return
+
+    from app.metrics import CHAT_MESSAGES
+
+    CHAT_MESSAGES.inc(len(batch))
+    chat_bus = bus()
+    for row, future in batch:
+        event = message_event(row)
+        chat_bus.publish(topic(row["session_id"]), event)
+        _resolve(future, event)
+
+
+def _write_forever(app: Flask, pending: queue.Queue) -> None:
+    config = app.config
+    while True:
+        batch = [pending.get()]
+        deadline = monotonic() + config["CHAT_WRITE_DELAY_MS"] / 1000
+        while len(batch) < config["CHAT_WRITE_BATCH_SIZE"]:
+            remaining = deadline - monotonic()
+            try:
+                batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+        with app.app_context():
+            try:
+                _write_batch(batch)
+            finally:
+                db.session.remove()
+
+
+# ---------- Presence ----------
+
+# (session id, user id) -> devices connected to this process
+_local_devices: dict[tuple[str, str], int] = {}
+_devices_lock = threading.Lock()
+
+
+def _presence_key(session_id, user_id) -> str:
+    return f"chat:presence:{session_id}:{user_id}"
+
+
+def _store():
+    return get_store(current_app.config["CHAT_PRESENCE_STORAGE_URL"])
+
+
+def heartbeat(session_id, user_id) -> None:
+    try:
+        _store().set(
+            _presence_key(session_id, user_id), node_id(), current_app.config["CHAT_PRESENCE_TTL_SECONDS"]
+        )
+    except Exception as e:
+        print("chat presence store unavailable:", e)
+
+
+def _presence_event(session_id, user_id, status: str) -> dict:
+    return {"type": "presence", "session_id": str(session_id), "user_id": str(user_id), "status": status}
+
+
+def connected(session_id, user_id) -> None:
+    key = (str(session_id), str(user_id))
+    with _devices_lock:
+        _local_devices[key] = _local_devices.get(key, 0) + 1
+        first = _local_devices[key] == 1
+    heartbeat(session_id, user_id)
+    if first:
+        bus().publish(topic(session_id), _presence_event(session_id, user_id, "online"))
+
+
+def disconnected(session_id, user_id) -> None:
+    key = (str(session_id), str(user_id))
+    with _devices_lock:
+        _local_devices[key] -= 1
+        last = _local_devices[key] == 0
+        if last:
+            del _local_devices[key]
+    if not last:
+        return
+    try:
+        _store().delete_if(_presence_key(session_id, user_id), node_id())
+    except Exception as e:
+        print("chat presence store unavailable:", e)
+    bus().publish(topic(session_id), _presence_event(session_id, user_id, "offline"))
+
+
+def presence(session: ChatSession) -> dict[str, bool]:
+    """
+    {user id: online} for the session's participants.
+    """
+    participants = [session.patient_id] + ([session.doctor_id] if session.doctor_id else [])
+    result = {}
+    for user_id in participants:
+        try:
+            online = _store().get(_presence_key(session.id, user_id)) is not None
+        except Exception:
+            online = False
+        result[str(user_id)] = online
+    return result
+
+
+def session_dict(session: ChatSession) -> dict:
+    return {
+        "id": str(session.id),
+        "patient_id": str(session.patient_id),
+        "doctor_id": str(session.doctor_id) if session.doctor_id else None,
+        "title": session.title,
+        "started_at": session.started_at.isoformat() if session.started_at else None,
+        "closed_at": session.closed_at.isoformat() if session.closed_at else None,
+    }
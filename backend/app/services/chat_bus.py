@@ -0,0 +1,153 @@
+# app/services/chat_bus.py
+
+"""
+Publish/subscribe for doctor chat events (messages, presence, typing).
+
+Subscribers are callbacks registered per topic ("session:<id>") in this
+process. `publish` calls them synchronously, from whatever thread
+publishes, so a callback must only hand the event over (e.g. with
+loop.call_soon_threadsafe) and return.
+
+CHAT_PUBSUB_URL picks how events reach other processes and nodes:
+
+- memory:// (default): they don't. Right for a single worker.
+- redis://host:port/db: every event is also PUBLISHed to Redis on
+  channel viora:chat:<topic>. One listener thread per process
+  subscribes to viora:chat:* and hands on events from other processes.
+  Local subscribers get events straight away, without the round trip.
+  Needs the optional `redis` package. An event published while Redis
+  is down still reaches this process's subscribers.
+
+Events are JSON-serializable dicts.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+Callback = Callable[[dict], None]
+
+_CHANNEL_PREFIX = "viora:chat:"
+
+_buses: dict = {}
+_buses_lock = threading.Lock()
+
+_node: Optional[tuple[int, str]] = None
+
+
+def node_id() -> str:
+    """
+    Id of this process; a new one after a fork.
+    """
+    global _node
+    if _node is None or _node[0] != os.getpid():
+        _node = (os.getpid(), uuid.uuid4().hex)
+    return _node[1]
+
+
+class LocalBus:
+    def __init__(self):
+        self._subscribers: dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, callback: Callback) -> Callable[[], None]:
+        """
+        Register `callback` for `topic`; returns the unsubscribe function.
+        """
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                callbacks = self._subscribers.get(topic)
+                if callbacks is not None:
+                    callbacks.discard(callback)
+                    if not callbacks:
+                        del self._subscribers[topic]
+
+        return unsubscribe
+
+    def _dispatch(self, topic: str, event: dict) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("chat subscriber failed:", topic, e)
+
+    def publish(self, topic: str, event: dict) -> None:
+        self._dispatch(topic, event)
+
+
+class RedisBus(LocalBus):
+    def __init__(self, url: str):
+        super().__init__()
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        # The listener blocks in pubsub; no socket timeout
+        self._listen_client = redis.Redis.from_url(url, socket_connect_timeout=0.5)
+        self._listener_pid: Optional[int] = None
+
+    def subscribe(self, topic: str, callback: Callback) -> Callable[[], None]:
+        self._ensure_listener()
+        return super().subscribe(topic, callback)
+
+    def publish(self, topic: str, event: dict) -> None:
+        self._dispatch(topic, event)
+        try:
+            self._client.publish(
+                _CHANNEL_PREFIX + topic, json.dumps({"node": node_id(), "event": event})
+            )
+        except Exception as e:
+            print("chat pub/sub unavailable; delivered locally only:", e)
+
+    def _ensure_listener(self) -> None:
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid != os.getpid():
+                self._listener_pid = os.getpid()
+                threading.Thread(target=self._listen, name="chat-pubsub", daemon=True).start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._listen_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(_CHANNEL_PREFIX + "*")
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("node") == node_id():
+                        continue  # already dispatched by publish
+                    topic = message["channel"].decode()[len(_CHANNEL_PREFIX) :]
+                    self._dispatch(topic, data["event"])
+            except Exception as e:
+                print("chat pub/sub listener reconnecting:", e)
+                time.sleep(1)
+
+
+def create_bus(url: str):
+    if url.startswith("memory://"):
+        return LocalBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBus(url)
+    raise RuntimeError(f"Unsupported CHAT_PUBSUB_URL: {url}")
+
+
+def get_bus(url: str):
+    """
+    The process-wide bus for `url`.
+    """
+    bus = _buses.get(url)
+    if bus is None:
+        with _buses_lock:
+            bus = _buses.get(url)
+            if bus is None:
+                bus = _buses[url] = create_bus(url)
+    return bus
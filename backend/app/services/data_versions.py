@@ -0,0 +1,196 @@
+# app/services/data_versions.py
+
+"""
+Version stamps for conditional GETs on the polled list/profile endpoints.
+
+Every ORM flush that touches a tracked model bumps a counter in
+data_versions for each (collection, scope) it affects, inside the same
+transaction. A list endpoint then answers If-None-Match /
+If-Modified-Since with one primary-key lookup and a 304, without
+running the list query or serializing anything.
+
+Writes that bypass the ORM (Core inserts, COPY, raw SQL) must call
+bump() themselves.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from itertools import chain
+from typing import Iterable, NamedTuple, Optional
+from uuid import UUID
+
+from flask import Response, current_app, request
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.sql_models import (
+    Appointment,
+    DataVersion,
+    Medication,
+    MedicationEvent,
+    Patient,
+    PatientReport,
+    User,
+    utcnow,
+)
+
+# Bump when a serializer's output changes, so cached copies revalidate
+SERIALIZER_VERSION = 1
+
+# model -> [(collection, scope kind, column holding the scope id)]
+TRACKED = {
+    Medication: [
+        ("medications", "patient", "patient_id"),
+        ("medications", "doctor", "prescribed_by"),
+        # /medication-events/today embeds the medication name and dosage
+        ("medication_events", "patient", "patient_id"),
+    ],
+    MedicationEvent: [("medication_events", "patient", "patient_id")],
+    Appointment: [
+        ("appointments", "patient", "patient_id"),
+        ("appointments", "doctor", "doctor_id"),
+    ],
+    # Doctors currently see every report; their stamp is aggregate()
+    # over the patient scopes rather than one row every upload would bump
+    PatientReport: [("reports", "patient", "patient_id")],
+    # patients.id == users.id
+    User: [("profile", "user", "id")],
+    Patient: [("profile", "user", "id")],
+}
+
+
+class Stamp(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+
+def scope(kind: str, value=None) -> str:
+    if value is None:
+        return kind
+    try:
+        # Ids set from request JSON arrive as strings in any case
+        value = UUID(str(value))
+    except ValueError:
+        pass
+    return f"{kind}:{value}"
+
+
+def _changed_keys(session: Session) -> set[tuple[str, str]]:
+    dirty = (o for o in session.dirty if session.is_modified(o, include_collections=False))
+    keys = set()
+    for obj in chain(session.new, session.deleted, dirty):
+        for collection, kind, column in TRACKED.get(type(obj), ()):
+            # Old and new values: moving a row between scopes changes both
+            history = inspect(obj).attrs[column].history
+            for value in chain(history.added, history.unchanged, history.deleted):
+                if value is not None:
+                    keys.add((collection, scope(kind, value)))
+    return keys
+
+
+def bump(connection, keys: Iterable[tuple[str, str]]) -> None:
+    """
+    Increment the version of each (collection, scope) key.
+    """
+    # Sorted so concurrent transactions lock the rows in the same order
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    now = utcnow()
+    stmt = insert(DataVersion).values(
+        [{"collection": c, "scope": s, "version": 1, "updated_at": now} for c, s in keys]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.collection, DataVersion.scope],
+        set_={"version": DataVersion.version + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    connection.execute(stmt)
+
+
+def _after_flush(session: Session, flush_context) -> None:
+    bump(session.connection(), _changed_keys(session))
+
+
+def init_data_versions() -> None:
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def current(collection: str, scope_key: str, *salt, since: Optional[datetime] = None) -> Stamp:
+    """
+    Read the stamp before running the list query: a write that lands in
+    between then yields new data under the old tag, which only costs the
+    client one extra full response.
+
+    `salt` goes into the ETag for responses that also depend on something
+    other than the data (e.g. today's date); `since` is the matching lower
+    bound for Last-Modified.
+    """
+    row = db.session.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(
+            DataVersion.collection == collection,
+            DataVersion.scope == scope_key,
+        )
+    ).first()
+    version, updated_at = row if row else (0, None)
+    return _stamp((collection, scope_key, version, *salt), updated_at, since)
+
+
+def aggregate(collection: str, kind: str, *salt, since: Optional[datetime] = None) -> Stamp:
+    """
+    Stamp over every scope of `kind` in `collection`, for lists that span
+    them all (e.g. the doctor's view of every report). Versions only
+    grow, so their sum changes with every bump of any scope; reading it
+    costs one indexed range scan instead of a global row that every
+    write would have to lock.
+    """
+    total, updated_at = db.session.execute(
+        select(func.coalesce(func.sum(DataVersion.version), 0), func.max(DataVersion.updated_at)).where(
+            DataVersion.collection == collection,
+            DataVersion.scope.startswith(f"{kind}:"),
+        )
+    ).one()
+    return _stamp((collection, f"{kind}:*", total, *salt), updated_at, since)
+
+
+def _stamp(parts: tuple, updated_at: Optional[datetime], since: Optional[datetime]) -> Stamp:
+    if since is not None and (updated_at is None or updated_at < since):
+        updated_at = since
+    raw = ":".join(str(p) for p in (SERIALIZER_VERSION, *parts))
+    # Hashed so the tag does not expose ids or change counts
+    return Stamp(hashlib.sha256(raw.encode()).hexdigest()[:32], updated_at)
+
+
+def with_validators(response: Response, stamp: Stamp) -> Response:
+    response.set_etag(stamp.etag, weak=True)
+    # Last-Modified has one-second resolution. Only send it once that second
+    # is over, so a later write can never share it and be answered with 304.
+    if stamp.last_modified is not None and (
+        utcnow().replace(microsecond=0) > stamp.last_modified.replace(microsecond=0)
+    ):
+        response.last_modified = stamp.last_modified
+    # Per-user data: private, and revalidate on every use
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Authorization")
+    return response
+
+
+def not_modified(stamp: Stamp) -> Optional[Response]:
+    """
+    A 304 response when the request's validators match, else None.
+    If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2).
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(stamp.etag)
+    elif request.if_modified_since and stamp.last_modified is not None:
+        fresh = stamp.last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    return with_validators(current_app.response_class(status=304), stamp)
@@ -0,0 +1,72 @@
+# app/services/engine_loop.py
+
+"""
+One long-lived event loop per process, on a background thread.
+
+Flask runs every async view on an event loop of its own that is closed
+when the view returns, so a pooled async client (httpx, AsyncOpenAI, an
+asyncpg pool) cannot outlive a request there. Clients that should keep
+their connections live on this loop instead: callers hand coroutines to
+`submit` from any thread or loop and wait on the returned future.
+
+    client = engine_loop.Local(make_client)   # built on the loop, per process
+
+    async def call():
+        return await client.get().get(url)
+
+    result = await asyncio.wrap_future(engine_loop.submit(call()))
+
+The loop is started on first use, and again in a forked child (the
+parent's thread does not survive the fork).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+
+
+def loop() -> asyncio.AbstractEventLoop:
+    """
+    The background loop, started on first use (again after a fork).
+    """
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="engine-loop", daemon=True).start()
+    return _loop
+
+
+def submit(coro: Coroutine) -> Future:
+    """
+    Run `coro` on the engine loop; returns a concurrent.futures.Future.
+    Cancelling the future cancels the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, loop())
+
+
+class Local:
+    """
+    A value built by `factory` on first use, once per process. Only
+    call get() from coroutines running on the engine loop.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._value = None
+        self._pid: Optional[int] = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            self._value = self._factory()
+            self._pid = os.getpid()
+        return self._value
@@ -0,0 +1,430 @@
+# app/services/exports.py
+
+"""
+Background exports of patient data for analytics.
+
+A job streams one dataset (medications, medication_events, appointments)
+to a CSV or Parquet file in EXPORT_DIR (default instance/exports). Rows
+are read through a server-side cursor EXPORT_BATCH_SIZE at a time and
+written batch by batch, so memory stays flat however large the table
+is. The file is written under a .part name and renamed when complete.
+Every process that runs workers or serves downloads must see the same
+EXPORT_DIR: on more than one host, mount shared storage there.
+
+Jobs are rows in export_jobs, claimed the way ai_jobs claims its jobs:
+every process runs EXPORT_WORKERS threads (default 1) that take queued
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, so at most that many
+connections per process are busy with exports, and jobs queued before a
+restart still run. A job left running for longer than
+EXPORT_STALE_SECONDS belonged to a worker that died and is claimed
+again; after EXPORT_MAX_ATTEMPTS attempts it fails.
+
+Finished jobs and their files are kept for EXPORT_RESULT_TTL_SECONDS,
+then deleted by the workers and by `flask maintain-partitions`.
+
+Incremental exports: a job covers since <= updated_at < until, and the
+previous job's `until` passed as the next `since` gets each change once.
+updated_at is stamped when the row is flushed, not when its transaction
+commits, so `until` is capped below the start of the oldest transaction
+still writing (from pg_stat_activity), minus EXPORT_WATERMARK_LAG_SECONDS
+for clock skew between app servers and the database. Rows those
+transactions write therefore fall in a later window. This needs the app
+to see its own role's sessions in pg_stat_activity, which is the default
+when one role is used. Deleted rows are not exported.
+
+Parquet needs pyarrow, which is optional.
+"""
+
+from __future__ import annotations
+
+import csv
+import importlib.util
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from typing import Optional
+from uuid import UUID
+
+from flask import Flask, current_app
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Integer,
+    SmallInteger,
+    delete,
+    or_,
+    select,
+    text,
+    update,
+)
+
+from app import db, db_routing
+from app.sql_models import (
+    Appointment,
+    DoctorPatientLink,
+    ExportJob,
+    Medication,
+    MedicationEvent,
+    utcnow,
+)
+
+DATASETS = {
+    "medications": Medication,
+    "medication_events": MedicationEvent,
+    "appointments": Appointment,
+}
+FORMATS = ("csv", "parquet")
+
+_CLEANUP_SECONDS = 60
+
+# Start of the oldest other transaction that has written (holds an xid)
+_OLDEST_WRITE = text(
+    "SELECT min(xact_start) FROM pg_stat_activity"
+    " WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+)
+
+_wake = threading.Event()
+_workers_pid: Optional[int] = None
+_workers_lock = threading.Lock()
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_dir(app: Flask) -> str:
+    return app.config.get("EXPORT_DIR") or os.path.join(app.instance_path, "exports")
+
+
+def file_path(app: Flask, job: ExportJob) -> str:
+    return os.path.join(export_dir(app), job.file_name)
+
+
+def watermark(until: Optional[datetime] = None) -> datetime:
+    """
+    Upper bound for a job created now: `until` capped at the start of
+    the oldest transaction still writing (or now), minus the lag.
+    """
+    lag = timedelta(seconds=current_app.config["EXPORT_WATERMARK_LAG_SECONDS"])
+    limit = utcnow()
+    oldest = db.session.execute(_OLDEST_WRITE).scalar()
+    if oldest is not None:
+        limit = min(limit, oldest)
+    limit -= lag
+    return limit if until is None else min(until, limit)
+
+
+def export_query(job: ExportJob):
+    model = DATASETS[job.dataset]
+    query = select(*model.__table__.columns).where(model.updated_at < job.until)
+    if job.since is not None:
+        query = query.where(model.updated_at >= job.since)
+    if job.doctor_id is not None:
+        linked = select(DoctorPatientLink.patient_id).where(
+            DoctorPatientLink.doctor_id == job.doctor_id,
+            DoctorPatientLink.status == "active",
+        )
+        query = query.where(model.patient_id.in_(linked))
+    # Index order on updated_at; id breaks ties so reruns are identical
+    return query.order_by(model.updated_at, model.id)
+
+
+# ---------- Writers ----------
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CsvWriter:
+    def __init__(self, path: str, columns: list):
+        self._fh = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow([c.name for c in columns])
+
+    def write(self, rows: list) -> None:
+        self._writer.writerows([_csv_value(v) for v in row] for row in rows)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def _arrow_type(column):
+    import pyarrow as pa
+
+    kind = column.type
+    if isinstance(kind, DateTime):
+        return pa.timestamp("us", tz="UTC") if kind.timezone else pa.timestamp("us")
+    if isinstance(kind, Date):
+        return pa.date32()
+    if isinstance(kind, Boolean):
+        return pa.bool_()
+    if isinstance(kind, (SmallInteger, Integer, BigInteger)):
+        return pa.int64()
+    # UUID, String, Text
+    return pa.string()
+
+
+class ParquetWriter:
+    """
+    One row group per batch, built column by column.
+    """
+
+    def __init__(self, path: str, columns: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([(c.name, _arrow_type(c)) for c in columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: list) -> None:
+        pa = self._pa
+        arrays = []
+        for i, field in enumerate(self._schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_string(field.type):
+                values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter}
+
+
+# ---------- Jobs ----------
+
+
+def _claim(app: Flask) -> Optional[dict]:
+    stale = utcnow() - timedelta(seconds=app.config["EXPORT_STALE_SECONDS"])
+    next_job = (
+        select(ExportJob.id)
+        .where(
+            or_(
+                ExportJob.status == "queued",
+                (ExportJob.status == "running") & (ExportJob.started_at < stale),
+            )
+        )
+        .order_by(ExportJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = db.session.execute(
+        update(ExportJob)
+        .where(ExportJob.id == next_job)
+        .values(status="running", started_at=utcnow(), attempts=ExportJob.attempts + 1)
+        .returning(ExportJob.id, ExportJob.attempts)
+    ).first()
+    db.session.commit()
+    return None if row is None else row._asdict()
+
+
+def _finish(claimed: dict, **values) -> bool:
+    """
+    Record the outcome, unless the job was reclaimed as stale meanwhile
+    (it then belongs to its newest attempt). Commits; False when the
+    outcome was dropped.
+    """
+    now = utcnow()
+    ttl = timedelta(seconds=current_app.config["EXPORT_RESULT_TTL_SECONDS"])
+    result = db.session.execute(
+        update(ExportJob)
+        .where(ExportJob.id == claimed["id"], ExportJob.attempts == claimed["attempts"])
+        .values(finished_at=now, expires_at=now + ttl, **values)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+def _reads_for(app: Flask, job: ExportJob):
+    """
+    Read from the replica only once it has surely replayed every commit
+    before the job was created; a younger job reads the primary.
+    """
+    settled = timedelta(
+        seconds=app.config["REPLICA_MAX_LAG_SECONDS"] + app.config["REPLICA_LAG_CHECK_SECONDS"]
+    )
+    if job.created_at + settled < utcnow():
+        return db_routing.replica_reads()
+    return nullcontext()
+
+
+def _write_file(app: Flask, job: ExportJob, path: str) -> int:
+    """
+    Write the job's rows to `path`; returns the row count.
+    """
+    model = DATASETS[job.dataset]
+    batch_size = app.config["EXPORT_BATCH_SIZE"]
+    rows = 0
+    writer = WRITERS[job.format](path, list(model.__table__.columns))
+    try:
+        # yield_per: server-side cursor, fetched batch_size rows at a time
+        with _reads_for(app, job):
+            result = db.session.execute(
+                export_query(job).execution_options(yield_per=batch_size)
+            )
+            for batch in result.partitions():
+                writer.write(batch)
+                rows += len(batch)
+    finally:
+        writer.close()
+    db.session.rollback()  # end the read transaction
+    return rows
+
+
+def run(claimed: dict) -> None:
+    """
+    Execute a claimed job. Needs an app context.
+    """
+    app = current_app._get_current_object()
+    if claimed["attempts"] > app.config["EXPORT_MAX_ATTEMPTS"]:
+        _finish(claimed, status="failed", error="worker lost too many times", file_name=None)
+        return
+
+    job = db.session.get(ExportJob, claimed["id"])
+    if job is None:
+        return
+    file_name = f"{job.id}.{job.format}"
+    path = os.path.join(export_dir(app), file_name)
+    # Per attempt, so a stale attempt still writing cannot clobber it
+    partial = f"{path}.{claimed['attempts']}.part"
+    os.makedirs(export_dir(app), exist_ok=True)
+    try:
+        rows = _write_file(app, job, partial)
+        os.replace(partial, path)
+    except Exception as e:
+        print("export failed:", claimed["id"], e)
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        _finish(claimed, status="failed", error=str(e), file_name=None)
+        return
+    _finish(claimed, status="done", rows=rows, file_name=file_name, error=None)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune(app: Flask) -> int:
+    """
+    Delete jobs past their expiry with their files, and .part files
+    left by workers that died. Returns the number of jobs deleted.
+    """
+    expired = db.session.execute(
+        select(ExportJob.id, ExportJob.file_name).where(ExportJob.expires_at < utcnow())
+    ).all()
+    # Files first: a job row without its file answers 410, a file
+    # without its row would never be deleted
+    for row in expired:
+        if row.file_name:
+            _remove(os.path.join(export_dir(app), row.file_name))
+    if expired:
+        db.session.execute(delete(ExportJob).where(ExportJob.id.in_([r.id for r in expired])))
+    db.session.commit()
+
+    directory = export_dir(app)
+    if os.path.isdir(directory):
+        stale = time.time() - app.config["EXPORT_STALE_SECONDS"]
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".part") and os.path.getmtime(path) < stale:
+                _remove(path)
+    return len(expired)
+
+
+# ---------- Workers ----------
+
+
+def _work(app: Flask) -> None:
+    next_cleanup = time.monotonic()
+    while True:
+        claimed = None
+        with app.app_context():
+            try:
+                claimed = _claim(app)
+                if claimed is not None:
+                    run(claimed)
+                elif time.monotonic() >= next_cleanup:
+                    next_cleanup = time.monotonic() + _CLEANUP_SECONDS
+                    prune(app)
+            except Exception as e:
+                print("export worker error:", e)
+                db.session.rollback()
+        if claimed is None:
+            _wake.wait(app.config["EXPORT_POLL_SECONDS"])
+            _wake.clear()
+
+
+def ensure_workers(app: Flask) -> None:
+    """
+    Start this process's worker threads (again after a fork).
+    """
+    global _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        for i in range(app.config["EXPORT_WORKERS"]):
+            threading.Thread(target=_work, args=(app,), name=f"export-{i}", daemon=True).start()
+
+
+def init_exports(app: Flask) -> None:
+    """
+    Start the workers with the first request each process serves, so
+    jobs queued before a restart are picked up. No-op when
+    EXPORT_WORKERS=0 (e.g. web processes when exports run elsewhere).
+    """
+    if app.config["EXPORT_WORKERS"] <= 0:
+        return
+
+    def start_workers():
+        ensure_workers(app)
+
+    app.before_request(start_workers)
+
+
+def submit(job: ExportJob) -> None:
+    """
+    Wake this process's workers for a committed job. Any other process's
+    workers find it on their next poll.
+    """
+    app = current_app._get_current_object()
+    if app.config["EXPORT_WORKERS"] > 0:
+        ensure_workers(app)
+        _wake.set()
+
+
+def job_to_dict(job: ExportJob) -> dict:
+    return {
+        "id": str(job.id),
+        "dataset": job.dataset,
+        "format": job.format,
+        "scope": "all" if job.doctor_id is None else "doctor",
+        "since": job.since.isoformat() if job.since else None,
+        "until": job.until.isoformat(),
+        "status": job.status,
+        "rows": job.rows,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,83 @@
+# app/services/followups.py
+
+"""
+Central analysis that continues after a red-flag message was answered
+locally (see triage).
+
+`start` queues the usual central + tone pipeline on a small thread pool
+(TRIAGE_FOLLOWUP_WORKERS) and returns an id. The entry lives in the
+shared store at FOLLOWUP_STORAGE_URL for FOLLOWUP_TTL_SECONDS:
+
+    {"status": "pending" | "done", "owner": user id or null, "result": {...}}
+
+With memory:// (the default) a follow-up can only be read back from the
+worker that started it; use Redis when several workers serve traffic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import Flask, current_app
+
+from app.services import usage
+from app.services.shared_store import get_store
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _key(followup_id: str) -> str:
+    return f"followup:{followup_id}"
+
+
+def _save(app: Flask, followup_id: str, entry: dict) -> None:
+    get_store(app.config["FOLLOWUP_STORAGE_URL"]).set(
+        _key(followup_id), json.dumps(entry, default=str), app.config["FOLLOWUP_TTL_SECONDS"]
+    )
+
+
+def _run(
+    app: Flask, followup_id: str, payload: dict, owner: Optional[str], attribution: usage.Attribution
+) -> None:
+    from app.services.ai_handler import acentral_patient_ai
+
+    with app.app_context(), usage.attributed(attribution):
+        try:
+            result = asyncio.run(acentral_patient_ai(payload))
+        except Exception as e:
+            print("follow-up analysis failed:", followup_id, e)
+            result = None
+        try:
+            _save(app, followup_id, {"status": "done", "owner": owner, "result": result})
+        except Exception as e:
+            print("follow-up result not stored:", followup_id, e)
+
+
+def start(payload: dict, owner: Optional[str] = None) -> Optional[str]:
+    """
+    Queue the central analysis of `payload`. Returns the follow-up id,
+    or None when the store is unavailable (the analysis is skipped).
+    """
+    global _executor
+    app = current_app._get_current_object()
+    followup_id = uuid.uuid4().hex
+    try:
+        _save(app, followup_id, {"status": "pending", "owner": owner})
+    except Exception as e:
+        print("follow-up store unavailable:", e)
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config["TRIAGE_FOLLOWUP_WORKERS"], thread_name_prefix="followup"
+        )
+    _executor.submit(_run, app, followup_id, payload, owner, usage.current())
+    return followup_id
+
+
+def get(followup_id: str) -> Optional[dict]:
+    value = get_store(current_app.config["FOLLOWUP_STORAGE_URL"]).get(_key(followup_id))
+    return None if value is None else json.loads(value)
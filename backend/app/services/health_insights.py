@@ -1,7 +1,177 @@
-def extract_clinical_signals(user_input: dict) -> dict:
+"""
+Clinical signal normalization: symptom strings and free text -> canonical
+codes from the precomputed lexicon (see lexicon.py).
+
+Each text is tokenized and matched longest phrase first against the
+lexicon. A match is negated when a negation cue ("no", "denies",
+"without", "dont have", ...) precedes it by at most triage.NEGATION_WINDOW
+words in the same clause, or a resolution cue ("gone", "resolved")
+follows it directly. Clauses end at punctuation (commas included, so
+"no fever, headache" reports the headache) and at "but", "however", ...
+A code that is both affirmed and negated counts as present.
+
+extract_clinical_signals_batch normalizes many check-ins at once: the
+n-grams of every text are hashed and looked up in one vectorized pass.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.lexicon import PRIME, get_lexicon, token_hash, tokenize
+from app.services.triage import CLAUSE_BREAKS, negated
+
+_MOODS = {
+    "anxious": "anxious", "worried": "anxious", "nervous": "anxious", "stressed": "anxious",
+    "sad": "low", "down": "low", "low": "low", "depressed": "low",
+    "angry": "irritable", "irritable": "irritable", "frustrated": "irritable",
+    "calm": "neutral", "ok": "neutral", "okay": "neutral", "fine": "neutral",
+    "neutral": "neutral", "good": "positive", "happy": "positive", "great": "positive",
+}
+
+
+def _texts(user_input: dict) -> tuple[list[str], list[str]]:
+    """
+    (symptom list entries, free text)
+    """
+    symptoms = user_input.get("symptoms") or []
+    if isinstance(symptoms, str):
+        symptoms = [symptoms]
+    elif not isinstance(symptoms, (list, tuple)):
+        symptoms = []
+    entries = [s for s in symptoms if isinstance(s, str) and s.strip()]
+    message = user_input.get("message")
+    return entries, [message] if isinstance(message, str) and message.strip() else []
+
+
+def _hits(texts: list[list[str]], max_n: int) -> list[dict[tuple[int, int], int]]:
+    """
+    For each tokenized text, {(start, length): code id} of every n-gram
+    found in the lexicon. The n-grams of all texts are hashed and looked
+    up together; none crosses a clause break or the end of a text.
+    """
+    lexicon = get_lexicon()
+    flat = [token for tokens in texts for token in tokens]
+    found: list[dict] = [{} for _ in texts]
+    if not flat:
+        return found
+
+    token_hashes = np.array([token_hash(t) for t in flat], dtype=np.uint64)
+    # Runs of words between breaks share a segment id; breaks get -1
+    segments = np.empty(len(flat), dtype=np.int64)
+    owner = np.empty(len(flat), dtype=np.int64)
+    offsets = []
+    segment, position = 0, 0
+    for index, tokens in enumerate(texts):
+        offsets.append(position)
+        segment += 1
+        for token in tokens:
+            if token in CLAUSE_BREAKS:
+                segments[position] = -1
+                segment += 1
+            else:
+                segments[position] = segment
+            owner[position] = index
+            position += 1
+
+    prime = np.uint64(PRIME)
+    hashes = token_hashes.copy()
+    for n in range(1, max_n + 1):
+        if n > 1:
+            # hash of tokens[i : i + n] from the hash of tokens[i : i + n - 1]
+            hashes = hashes[:-1] * prime + token_hashes[n - 1 :]
+        if not len(hashes):
+            break
+        starts = np.flatnonzero(
+            (segments[: len(hashes)] >= 0) & (segments[: len(hashes)] == segments[n - 1 :])
+        )
+        ids = lexicon.lookup(hashes[starts])
+        for i, code_id in zip(starts[ids >= 0].tolist(), ids[ids >= 0].tolist()):
+            text = int(owner[i])
+            found[text][(i - offsets[text], n)] = code_id
+    return found
+
+
+def _match(tokens: list[str], found: dict[tuple[int, int], int], max_n: int, codes: list[str]):
+    """
+    Longest-first, left-to-right matches: [(code, negated)].
+    """
+    matches = []
+    i = 0
+    while i < len(tokens):
+        for n in range(min(max_n, len(tokens) - i), 0, -1):
+            code_id = found.get((i, n))
+            if code_id is not None:
+                matches.append((codes[code_id], negated(tokens, i, i + n)))
+                i += n
+                break
+        else:
+            i += 1
+    return matches
+
+
+def _signals(user_input: dict, entry_matches: list[list], message_matches: list) -> dict:
+    present, negated = [], []
+    for code, is_negated in [m for ms in entry_matches for m in ms] + message_matches:
+        target = negated if is_negated else present
+        if code not in target:
+            target.append(code)
+    negated = [code for code in negated if code not in present]
+
+    unrecognized = [
+        entry for entry, ms in zip(_texts(user_input)[0], entry_matches) if not ms
+    ]
+    if entry_matches:
+        confidence = 1 - len(unrecognized) / len(entry_matches)
+    else:
+        confidence = 1.0 if message_matches else 0.0
+
+    mood = user_input.get("mood") or "neutral"
+    if isinstance(mood, str):
+        mood = mood.strip().lower()
+        mental_state = _MOODS.get(mood, mood)
+    else:
+        mental_state = mood  # not text: echoed back as sent
+    summary = ", ".join(code.replace("_", " ") for code in present) or "no symptoms reported"
+    if negated:
+        summary += "; denies " + ", ".join(code.replace("_", " ") for code in negated)
+
     return {
-        "normalized_symptoms": user_input.get("symptoms", []),
-        "mental_state": user_input.get("mood", "neutral"),
-        "clinical_summary": "Temporary clinical normalization",
-        "confidence": 0.7
+        "normalized_symptoms": present,
+        "negated_symptoms": negated,
+        "unrecognized_symptoms": unrecognized,
+        "mental_state": mental_state,
+        "clinical_summary": summary,
+        "confidence": round(confidence, 2),
     }
+
+
+def extract_clinical_signals_batch(user_inputs: list[dict]) -> list[dict]:
+    lexicon = get_lexicon()
+
+    # Every text of every check-in: (input index, is symptom entry, tokens)
+    texts = []
+    for index, user_input in enumerate(user_inputs):
+        entries, message = _texts(user_input)
+        texts += [(index, True, tokenize(t)) for t in entries]
+        texts += [(index, False, tokenize(t)) for t in message]
+
+    found = _hits([tokens for _, _, tokens in texts], lexicon.max_ngram)
+
+    entry_matches: list[list] = [[] for _ in user_inputs]
+    message_matches: list[list] = [[] for _ in user_inputs]
+    for (index, is_entry, tokens), spans in zip(texts, found):
+        matches = _match(tokens, spans, lexicon.max_ngram, lexicon.codes)
+        if is_entry:
+            entry_matches[index].append(matches)
+        else:
+            message_matches[index] += matches
+
+    return [
+        _signals(user_input, entry_matches[i], message_matches[i])
+        for i, user_input in enumerate(user_inputs)
+    ]
+
+
+def extract_clinical_signals(user_input: dict) -> dict:
+    return extract_clinical_signals_batch([user_input])[0]
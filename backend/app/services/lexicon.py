@@ -0,0 +1,190 @@
+# app/services/lexicon.py
+
+"""
+Precomputed symptom lexicon: phrase -> canonical code.
+
+Sources are app/data/symptom_lexicon.json and the red-flag vocabulary in
+triage.RED_FLAGS (a red-flag symptom's code is its name with
+underscores, e.g. "chest_pain"). Every phrase is tokenized like patient
+text and hashed: each token gets a 64-bit BLAKE2b hash, and a phrase
+hashes to the polynomial h = h * PRIME + token over its tokens, mod
+2**64. NumPy computes the same polynomial for every n-gram of a batch
+with a few array operations (see health_insights).
+
+`flask build-lexicon` compiles them into one binary file:
+
+    header   <4sIQQQ  magic, format, entries, meta offset, meta length
+    hashes   uint64[entries], sorted
+    codes    uint32[entries], index into meta["codes"]
+    meta     JSON: codes, longest phrase in tokens, source digest
+
+The file is opened with numpy.memmap, so every worker on a host shares
+one copy in the page cache and a lookup is a single searchsorted over
+all the n-grams of a batch. The file name carries the digest of the
+sources; a missing or stale file is rebuilt on first use.
+
+LEXICON_DIR picks the directory (default: <tmp>/viora-lexicon).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Bump when the layout, tokenization or hashing changes: old files then go stale
+FORMAT = 1
+MAGIC = b"VLEX"
+_HEADER = struct.Struct("<4sIQQQ")
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "symptom_lexicon.json")
+
+PRIME = 0x100000001B3
+_MASK = (1 << 64) - 1
+
+# Words, plus clause boundaries that negation scope stops at
+_TOKEN = re.compile(r"[a-z0-9]+|[.,;:!?]")
+_APOSTROPHES = re.compile(r"['’‘`]")
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+_token_hashes: dict[str, int] = {}
+_MAX_CACHED_TOKENS = 200_000
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(_APOSTROPHES.sub("", text.lower()))
+
+
+def token_hash(token: str) -> int:
+    value = _token_hashes.get(token)
+    if value is None:
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        if len(_token_hashes) < _MAX_CACHED_TOKENS:
+            _token_hashes[token] = value
+    return value
+
+
+def phrase_hash(tokens) -> int:
+    value = 0
+    for token in tokens:
+        value = (value * PRIME + token_hash(token)) & _MASK
+    return value
+
+
+def _sources() -> tuple[dict[str, list[str]], str]:
+    """
+    ({code: phrases}, digest of everything that goes into the file)
+    """
+    from app.services.triage import RED_FLAGS
+
+    with open(SOURCE_PATH, "rb") as fh:
+        raw = fh.read()
+    phrases: dict[str, list[str]] = {}
+    for symptoms in RED_FLAGS.values():
+        for symptom, variants in symptoms.items():
+            phrases.setdefault(symptom.replace(" ", "_"), []).extend([symptom, *variants])
+    for code, variants in json.loads(raw)["codes"].items():
+        phrases.setdefault(code, []).extend(variants)
+
+    digest = hashlib.sha256(
+        raw + json.dumps(RED_FLAGS, sort_keys=True).encode() + str(FORMAT).encode()
+    ).hexdigest()
+    return phrases, digest
+
+
+def lexicon_dir() -> str:
+    return os.getenv("LEXICON_DIR") or os.path.join(tempfile.gettempdir(), "viora-lexicon")
+
+
+def _path(directory: str, digest: str) -> str:
+    return os.path.join(directory, f"symptom_lexicon-{digest[:16]}.bin")
+
+
+def build(directory: Optional[str] = None) -> str:
+    """
+    Compile the sources into `directory` and return the file's path.
+    Writes to a temporary name first, so workers never see half a file.
+    """
+    phrases, digest = _sources()
+    directory = directory or lexicon_dir()
+    path = _path(directory, digest)
+
+    codes = sorted(phrases)
+    entries: dict[int, int] = {}
+    longest = 1
+    for code_id, code in enumerate(codes):
+        for phrase in phrases[code]:
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            # A phrase listed under two codes keeps the first by name
+            entries.setdefault(phrase_hash(tokens), code_id)
+            longest = max(longest, len(tokens))
+
+    hashes = np.array(sorted(entries), dtype="<u8")
+    ids = np.array([entries[h] for h in hashes.tolist()], dtype="<u4")
+    meta = json.dumps({"codes": codes, "max_ngram": longest, "digest": digest}).encode()
+    meta_offset = _HEADER.size + hashes.nbytes + ids.nbytes
+
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, FORMAT, len(hashes), meta_offset, len(meta)))
+        fh.write(hashes.tobytes())
+        fh.write(ids.tobytes())
+        fh.write(meta)
+    os.replace(partial, path)
+    return path
+
+
+class Lexicon:
+    def __init__(self, path: str):
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, fmt, count, meta_offset, meta_length = _HEADER.unpack(bytes(data[: _HEADER.size]))
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"{path} is not a format {FORMAT} lexicon")
+        start = _HEADER.size
+        self.hashes = data[start : start + 8 * count].view("<u8")
+        self.ids = data[start + 8 * count : meta_offset].view("<u4")
+        meta = json.loads(bytes(data[meta_offset : meta_offset + meta_length]))
+        self.codes: list[str] = meta["codes"]
+        self.max_ngram: int = meta["max_ngram"]
+        self.digest: str = meta["digest"]
+        self.path = path
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Code id for each hash, -1 where the phrase is unknown.
+        """
+        if not len(self.hashes) or not len(hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.searchsorted(self.hashes, hashes)
+        positions[positions == len(self.hashes)] = 0
+        found = self.hashes[positions] == hashes
+        return np.where(found, self.ids[positions].astype(np.int64), -1)
+
+
+def get_lexicon() -> Lexicon:
+    """
+    The current lexicon, built first if this host has no up-to-date file.
+    """
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _, digest = _sources()
+                path = _path(lexicon_dir(), digest)
+                if not os.path.exists(path):
+                    path = build()
+                _lexicon = Lexicon(path)
+    return _lexicon
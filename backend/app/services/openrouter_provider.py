@@ -1,13 +1,271 @@
+"""
+OpenRouter provider for AI_PROVIDER=openrouter.
+
+All calls run on the engine loop (app/services/engine_loop.py), which
+owns a pooled httpx.AsyncClient, so connections (and TLS sessions) are
+reused across requests, whichever thread or per-request event loop the
+caller runs on.
+
+A call walks OPENROUTER_MODELS in order:
+
+- the first model gets the request;
+- if it has not answered after its hedge delay (the p95 of its recent
+  successful latencies, bounded by OPENROUTER_HEDGE_MIN_SECONDS; before
+  enough samples, OPENROUTER_HEDGE_DEFAULT_SECONDS), the next model gets
+  a duplicate request and the first valid answer wins;
+- an error, a stalled stream or an invalid answer moves on to the next
+  model.
+
+At most two requests are in flight per call. OPENROUTER_DEADLINE_SECONDS
+bounds the whole call. With a single model, the hedge and fallback
+repeat the request to that same model.
+
+Responses are streamed (OPENROUTER_READ_TIMEOUT_SECONDS is the longest
+allowed gap between chunks) and requested in strict json_schema mode. An
+answer that does not match the schema counts as a failed attempt; it is
+never passed on as raw text.
+"""
+
+import asyncio
+import json
 import os
-import requests
+import threading
+from collections import deque
+from time import perf_counter
+from typing import Optional
+
+from app import tracing
+from app.metrics import MODEL_ATTEMPTS, external_call
+from app.services import engine_loop, usage
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+# Ordered fallback list, comma separated
+OPENROUTER_MODELS = [
+    m.strip()
+    for m in os.getenv("OPENROUTER_MODELS", "openai/gpt-4o-mini").split(",")
+    if m.strip()
+]
+OPENROUTER_MODEL = OPENROUTER_MODELS[0]
+OPENROUTER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT_SECONDS", "3"))
+OPENROUTER_READ_TIMEOUT_SECONDS = float(os.getenv("OPENROUTER_READ_TIMEOUT_SECONDS", "8"))
+OPENROUTER_DEADLINE_SECONDS = float(os.getenv("OPENROUTER_DEADLINE_SECONDS", "15"))
+OPENROUTER_HEDGE_MIN_SECONDS = float(os.getenv("OPENROUTER_HEDGE_MIN_SECONDS", "1"))
+OPENROUTER_HEDGE_DEFAULT_SECONDS = float(os.getenv("OPENROUTER_HEDGE_DEFAULT_SECONDS", "4"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+
+# Latency samples needed before the p95 replaces the default hedge delay
+_MIN_SAMPLES = 20
+
+RESPONSE_SCHEMA = {
+    "name": "counselling",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "explanation": {"type": "string"},
+            "confidence": {"type": "number"},
+        },
+        "required": ["explanation", "confidence"],
+        "additionalProperties": False,
+    },
+}
+
+
+class InvalidResponse(ValueError):
+    pass
+
+
+def _openrouter_span(model: str, kind: str):
+    return tracing.span(
+        "POST /chat/completions",
+        kind="client",
+        **{
+            "http.request.method": "POST",
+            "url.full": OPENROUTER_URL,
+            "peer.service": "openrouter",
+            "gen_ai.request.model": model,
+            "viora.attempt": kind,
+        },
+    )
+
+
+# ---------- Latency ----------
+
+_latencies: dict[str, deque] = {}
+_latencies_lock = threading.Lock()
+
+
+def _record_latency(model: str, seconds: float) -> None:
+    with _latencies_lock:
+        _latencies.setdefault(model, deque(maxlen=200)).append(seconds)
+
+
+def hedge_delay(model: str) -> float:
+    with _latencies_lock:
+        samples = sorted(_latencies.get(model, ()))
+    if len(samples) < _MIN_SAMPLES:
+        return OPENROUTER_HEDGE_DEFAULT_SECONDS
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return max(OPENROUTER_HEDGE_MIN_SECONDS, p95)
+
+
+# ---------- Client ----------
 
-class OpenRouterProvider:
-    def analyze(self, clinical_signals: dict) -> dict:
-        """
-        Uses OpenRouter to reason over clinical signals
-        and return counselling-style guidance.
-        """
 
+def _new_client():
+    import httpx
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            OPENROUTER_CONNECT_TIMEOUT_SECONDS, read=OPENROUTER_READ_TIMEOUT_SECONDS
+        ),
+        limits=httpx.Limits(
+            max_connections=OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS,
+        ),
+    )
+
+
+# Lives on the engine loop, so connections are reused across requests
+_client = engine_loop.Local(_new_client)
+
+
+# ---------- Requests ----------
+
+
+def _validate(content: str) -> dict:
+    try:
+        parsed = json.loads(content)
+    except ValueError as e:
+        raise InvalidResponse(f"not JSON: {e}") from None
+    if (
+        not isinstance(parsed, dict)
+        or not isinstance(parsed.get("explanation"), str)
+        or not isinstance(parsed.get("confidence"), (int, float))
+        or isinstance(parsed.get("confidence"), bool)
+    ):
+        raise InvalidResponse("does not match the response schema")
+    return {
+        "explanation": parsed["explanation"],
+        "confidence": min(1.0, max(0.0, float(parsed["confidence"]))),
+    }
+
+
+async def _stream_completion(model: str, headers: dict, messages: list, call) -> dict:
+    body = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "response_format": {"type": "json_schema", "json_schema": RESPONSE_SCHEMA},
+        # Only route to providers that honour response_format
+        "provider": {"require_parameters": True},
+        # Token counts and cost in the last chunk
+        "usage": {"include": True},
+    }
+    parts = []
+    async with _client.get().stream(
+        "POST", OPENROUTER_URL, json=body, headers=tracing.inject_headers(dict(headers))
+    ) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            # Blank lines separate events; ":" lines are keep-alive comments
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                # Keep reading to the end so the connection goes back to the pool
+                continue
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise RuntimeError(f"{model}: {chunk['error']}")
+            if chunk.get("usage"):
+                call.report_usage(chunk["usage"])
+            for choice in chunk.get("choices") or []:
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    parts.append(content)
+    return _validate("".join(parts))
+
+
+async def _attempt(model: str, kind: str, headers: dict, messages: list, parent, attribution) -> dict:
+    start = perf_counter()
+    outcome = "error"
+    cancelled = False
+    try:
+        with tracing.attached(parent), usage.attributed(attribution):
+            with external_call("openrouter", model=model) as call, _openrouter_span(model, kind):
+                try:
+                    result = await _stream_completion(model, headers, messages, call)
+                except asyncio.CancelledError:
+                    # Lost a hedge race or hit the deadline: not a provider error
+                    cancelled = True
+                except InvalidResponse:
+                    outcome = "invalid"
+                    call.fail()
+                    raise
+                except Exception:
+                    call.fail()
+                    raise
+        if cancelled:
+            outcome = "cancelled"
+            raise asyncio.CancelledError
+        outcome = "ok"
+        _record_latency(model, perf_counter() - start)
+        return result
+    finally:
+        MODEL_ATTEMPTS.labels(model, kind, outcome).inc()
+
+
+async def _complete(headers: dict, messages: list, parent, attribution) -> dict:
+    models = OPENROUTER_MODELS
+    # With one model the hedge/fallback repeats it
+    attempts = [models[i % len(models)] for i in range(max(len(models), 2))]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + OPENROUTER_DEADLINE_SECONDS
+    pending: dict = {}  # task -> model
+    errors = []
+    launched = 0
+
+    def launch(kind: str):
+        nonlocal launched
+        model = attempts[launched]
+        launched += 1
+        pending[loop.create_task(_attempt(model, kind, headers, messages, parent, attribution))] = model
+        return loop.time() + hedge_delay(model)
+
+    hedge_at = launch("primary")
+    try:
+        while pending:
+            now = loop.time()
+            if now >= deadline:
+                break
+            can_hedge = launched < len(attempts) and len(pending) < 2
+            wait = (min(hedge_at, deadline) if can_hedge else deadline) - now
+            done, _ = await asyncio.wait(pending, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                model = pending.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                errors.append(f"{model}: {task.exception()}")
+                print("openrouter attempt failed:", errors[-1])
+
+            if not done and can_hedge and loop.time() >= hedge_at:
+                hedge_at = launch("hedge")
+            elif done and not pending and launched < len(attempts):
+                hedge_at = launch("fallback")
+    finally:
+        for task in pending:
+            task.cancel()
+    reason = "; ".join(errors) or f"no answer within {OPENROUTER_DEADLINE_SECONDS}s"
+    raise RuntimeError(f"OpenRouter failed: {reason}")
+
+
+class OpenRouterProvider:
+    def _request_args(self, clinical_signals: dict) -> dict:
         api_key = os.getenv("OPENROUTER_API_KEY")
         if not api_key:
             raise RuntimeError("OPENROUTER_API_KEY not set")
@@ -26,42 +284,36 @@ Your role:
 Clinical signals:
 {clinical_signals}
 
-Respond in this JSON format ONLY:
-{{
-  "explanation": "...",
-  "confidence": 0.0
-}}
+Respond with a JSON object: "explanation" (string) and
+"confidence" (number between 0 and 1).
 """
 
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
+        return {
+            "headers": {
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             },
-            json={
-                "model": "openai/gpt-4o-mini",
-                "messages": [
-                    {"role": "system", "content": "You are a clinical decision support assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            },
-            timeout=20
-        )
+            "messages": [
+                {"role": "system", "content": "You are a clinical decision support assistant."},
+                {"role": "user", "content": prompt}
+            ],
+        }
 
-        response.raise_for_status()
-        data = response.json()
-
-        content = data["choices"][0]["message"]["content"]
+    def _submit(self, clinical_signals: dict):
+        args = self._request_args(clinical_signals)
+        return engine_loop.submit(
+            _complete(args["headers"], args["messages"], tracing.current_context(), usage.current())
+        )
 
-        # VERY IMPORTANT: we keep parsing safe
-        try:
-            import json
-            parsed = json.loads(content)
-        except Exception:
-            parsed = {
-                "explanation": content,
-                "confidence": 0.5
-            }
+    def analyze(self, clinical_signals: dict) -> dict:
+        """
+        Uses OpenRouter to reason over clinical signals
+        and return counselling-style guidance.
+        """
+        return self._submit(clinical_signals).result()
 
-        return parsed
+    async def aanalyze(self, clinical_signals: dict) -> dict:
+        """
+        Async variant of analyze for the async views.
+        """
+        return await asyncio.wrap_future(self._submit(clinical_signals))
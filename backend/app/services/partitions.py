@@ -0,0 +1,198 @@
+# app/services/partitions.py
+
+"""
+Monthly range partitions for medication_events and chat_messages.
+
+Each table is partitioned by month on its time column, plus a DEFAULT
+partition for rows outside every monthly range. Queries that bound the
+time column (today's doses, recent chat) are pruned to the matching
+months, and the indexes declared on the parent (patient/session +
+time, a BRIN on time) exist on every partition.
+
+`flask maintain-partitions`, run daily from cron, does both jobs:
+
+- ensure: create the partitions for the current month and
+  PARTITION_MONTHS_AHEAD months after it. Rows already sitting in the
+  DEFAULT partition for a new month are moved into it.
+- retention: partitions that ended more than <TABLE>_RETENTION_MONTHS
+  ago (0 = keep forever) are written to ARCHIVE_DIR as gzipped CSV,
+  then detached and dropped. Old rows in the DEFAULT partition are
+  archived and deleted the same way.
+
+Partitions are named <table>_pYYYY_MM and bounded in UTC.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import text
+
+from app import db
+
+# table -> partition key
+PARTITIONED = {
+    "medication_events": "scheduled_time",
+    "chat_messages": "created_at",
+}
+
+_PARTITION_NAME = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def monthly_partitions(connection, table: str) -> dict[date, str]:
+    """
+    {month: partition name} for the table's monthly partitions.
+    """
+    names = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    ).scalars()
+    months = {}
+    for name in names:
+        match = _PARTITION_NAME.search(name)
+        if match and name == partition_name(table, date(int(match[1]), int(match[2]), 1)):
+            months[date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def create_partition(connection, table: str, month: date) -> str:
+    """
+    Create the partition for `month`. Rows for that month already in the
+    DEFAULT partition are moved over, which Postgres otherwise refuses.
+    """
+    column = PARTITIONED[table]
+    name = partition_name(table, month)
+    default = f"{table}_default"
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    in_range = f"{column} >= '{lower}' AND {column} < '{upper}'"
+
+    stranded = connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")
+    ).scalar()
+    if not stranded:
+        connection.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            )
+        )
+        return name
+
+    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    connection.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    )
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"))
+    connection.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    return name
+
+
+def ensure_partitions(app: Flask, today: Optional[date] = None) -> list[str]:
+    """
+    Create missing partitions from this month to PARTITION_MONTHS_AHEAD
+    months ahead. Returns the names created.
+    """
+    first = month_start(today or datetime.now(timezone.utc).date())
+    ahead = app.config["PARTITION_MONTHS_AHEAD"]
+    created = []
+    for table in PARTITIONED:
+        connection = db.session.connection()
+        existing = monthly_partitions(connection, table)
+        for n in range(ahead + 1):
+            month = add_months(first, n)
+            if month not in existing:
+                created.append(create_partition(connection, table, month))
+        # One transaction per table keeps the DEFAULT partition lock short
+        db.session.commit()
+    return created
+
+
+def _archive(connection, query: str, path: str) -> None:
+    """
+    Stream `COPY (query) TO STDOUT` into a gzipped CSV file.
+    """
+    sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    partial = path + ".part"
+    raw = connection.connection.dbapi_connection
+    with gzip.open(partial, "wb") as fh, raw.cursor() as cursor:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(sql, fh)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                for block in copy:
+                    fh.write(block)
+    os.replace(partial, path)
+
+
+def archive_dir(app: Flask) -> str:
+    return app.config.get("ARCHIVE_DIR") or os.path.join(app.instance_path, "archive")
+
+
+def apply_retention(app: Flask, today: Optional[date] = None) -> list[str]:
+    """
+    Archive and drop partitions past each table's retention.
+    Returns the archive files written.
+    """
+    this_month = month_start(today or datetime.now(timezone.utc).date())
+    directory = archive_dir(app)
+    written = []
+    for table, column in PARTITIONED.items():
+        months = app.config[f"{table.upper()}_RETENTION_MONTHS"]
+        if months <= 0:
+            continue
+        cutoff = add_months(this_month, -months)
+        os.makedirs(directory, exist_ok=True)
+
+        connection = db.session.connection()
+        for month, name in sorted(monthly_partitions(connection, table).items()):
+            if month >= cutoff:
+                break
+            path = os.path.join(directory, f"{name}.csv.gz")
+            # File first: if the drop fails the rows are only duplicated
+            _archive(connection, f"SELECT * FROM {name}", path)
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+            written.append(path)
+            connection = db.session.connection()
+
+        old = f"{column} < '{_bound(cutoff)}'"
+        default = f"{table}_default"
+        if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {old})")).scalar():
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(directory, f"{default}_before_{cutoff:%Y_%m}_{stamp}.csv.gz")
+            _archive(connection, f"SELECT * FROM {default} WHERE {old}", path)
+            connection.execute(text(f"DELETE FROM {default} WHERE {old}"))
+            written.append(path)
+        db.session.commit()
+    return written
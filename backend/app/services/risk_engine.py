@@ -1,11 +1,16 @@
+from app.services import triage
+
+
 def classify_risk(raw_input: dict) -> str:
     symptoms = raw_input.get("symptoms", [])
     mood = raw_input.get("mood", "").lower()
 
-    if "chest pain" in symptoms or "shortness of breath" in symptoms:
+    # Red-flag vocabulary over the symptom list and the free-text message
+    level = triage.assess(raw_input.get("message"), symptoms).level
+    if level == "HIGH":
         return "HIGH"
 
-    if mood in ["anxious", "depressed"]:
+    if level == "MEDIUM" or mood in ["anxious", "depressed"]:
         return "MEDIUM"
 
     return "LOW"
@@ -0,0 +1,261 @@
+# app/services/semantic_cache.py
+
+"""
+Semantic answer cache in front of the patient AI pipeline.
+
+Near-identical questions ("is it normal to feel dizzy after my new
+tablet?") reuse an earlier central + tone answer instead of making the
+round trip again.
+
+- Embeddings are local: a signed hashing vectorizer (DIM buckets) over
+  words (plurals folded), word pairs and the canonical symptom codes from
+  health_insights, L2-normalized. No model, no network.
+- The index is a NumPy matrix of SEMANTIC_CACHE_SIZE vectors with
+  random-hyperplane LSH (TABLES tables of BITS bits) to pick candidates,
+  then exact cosine similarity on those. Entries expire after
+  SEMANTIC_CACHE_TTL_SECONDS. When the index is full the least recently
+  used entry is evicted.
+- An answer is reused only when the similarity is at least
+  SEMANTIC_CACHE_THRESHOLD and both questions have the same context
+  key: local triage level, present and negated symptom codes, mental
+  state, and a digest of the rest of the payload (patient_id,
+  medications, reports, appointments, days_post_discharge, ...).
+  Central answers from the patient's own context, so an answer is only
+  ever reused for the same patient with the same context.
+
+Safety: only LOW and MEDIUM answers are stored. HIGH answers, UNKNOWN
+ones (central unavailable) and anything local triage rates HIGH are
+never stored, so they can never be served from the cache.
+
+The index is per worker process.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+import numpy as np
+from flask import current_app
+
+from app.services import triage
+from app.services.health_insights import extract_clinical_signals
+from app.services.lexicon import token_hash, tokenize
+
+DIM = 1024
+TABLES = 8
+BITS = 8
+CACHEABLE_RISK_LEVELS = ("LOW", "MEDIUM")
+# Payload fields that make up the question itself; everything else is
+# patient context and goes into the key's digest
+QUESTION_FIELDS = ("message", "symptoms", "mood")
+
+_STOPWORDS = {
+    "a", "an", "the", "i", "im", "me", "my", "is", "it", "its", "am", "are", "was",
+    "be", "to", "of", "and", "or", "in", "on", "at", "for", "with", "this", "that",
+    "do", "does", "so", "just", "really", "very", "have", "has", "had", "ive",
+    ".", ",", ";", ":", "!", "?",
+}
+
+
+@dataclass
+class Probe:
+    vector: np.ndarray
+    key: tuple
+
+
+def _fold(word: str) -> str:
+    # Crude plural folding: "tablets" -> "tablet", "pills" -> "pill"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def embed(text: str, signals: dict) -> np.ndarray:
+    words = [_fold(t) for t in tokenize(text) if t not in _STOPWORDS]
+    features = [(w, 1.0) for w in words]
+    features += [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+    features += [(f"code:{c}", 2.0) for c in signals["normalized_symptoms"]]
+    features += [(f"not:{c}", 2.0) for c in signals["negated_symptoms"]]
+
+    vector = np.zeros(DIM, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([token_hash(f) for f, _ in features], dtype=np.uint64)
+    weights = np.array([w for _, w in features], dtype=np.float32)
+    signs = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % np.uint64(DIM)).astype(np.int64), signs * weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Fixed-capacity cosine index with LSH candidate selection.
+    Not thread-safe; callers hold a lock.
+    """
+
+    def __init__(self, capacity: int, dim: int = DIM, seed: int = 7):
+        self.capacity = capacity
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.planes = np.random.default_rng(seed).standard_normal((TABLES * BITS, dim)).astype(np.float32)
+        self._powers = (1 << np.arange(BITS)).astype(np.int64)
+        self.signatures = np.zeros((capacity, TABLES), dtype=np.int64)
+        self.expires = np.zeros(capacity)
+        self.last_used = np.zeros(capacity)
+        self.keys: list = [None] * capacity
+        self.values: list = [None] * capacity
+        self.buckets: list[dict[int, set]] = [{} for _ in range(TABLES)]
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return self.capacity - len(self.free)
+
+    def _signature(self, vector: np.ndarray) -> np.ndarray:
+        bits = (self.planes @ vector > 0).reshape(TABLES, BITS)
+        return bits @ self._powers
+
+    def _remove(self, slot: int) -> None:
+        for table, signature in enumerate(self.signatures[slot].tolist()):
+            bucket = self.buckets[table].get(signature)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self.buckets[table][signature]
+        self.keys[slot] = self.values[slot] = None
+        self.free.append(slot)
+
+    def search(self, vector: np.ndarray, key, threshold: float, now: float):
+        """
+        (value, similarity) of the closest live entry with `key`, or None.
+        """
+        candidates = set()
+        for table, signature in enumerate(self._signature(vector).tolist()):
+            candidates |= self.buckets[table].get(signature, set())
+        candidates = [s for s in candidates if self.keys[s] == key]
+        if not candidates:
+            return None
+
+        slots = np.array(candidates)
+        expired = slots[self.expires[slots] <= now]
+        for slot in expired.tolist():
+            self._remove(slot)
+        slots = slots[self.expires[slots] > now]
+        if not len(slots):
+            return None
+
+        scores = self.vectors[slots] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        slot = int(slots[best])
+        self.last_used[slot] = now
+        return self.values[slot], float(scores[best])
+
+    def add(self, vector: np.ndarray, key, value, ttl: float, now: float) -> None:
+        if not self.free:
+            # Full: drop whatever has expired, else the least recently used
+            expired = np.flatnonzero(self.expires <= now)
+            if len(expired):
+                for slot in expired.tolist():
+                    self._remove(slot)
+            else:
+                self._remove(int(np.argmin(self.last_used)))
+
+        slot = self.free.pop()
+        signature = self._signature(vector)
+        self.vectors[slot] = vector
+        self.signatures[slot] = signature
+        self.expires[slot] = now + ttl
+        self.last_used[slot] = now
+        self.keys[slot] = key
+        self.values[slot] = value
+        for table, sig in enumerate(signature.tolist()):
+            self.buckets[table].setdefault(sig, set()).add(slot)
+
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def _get_index() -> VectorIndex:
+    global _index
+    capacity = current_app.config["SEMANTIC_CACHE_SIZE"]
+    if _index is None or _index.capacity != capacity:
+        _index = VectorIndex(capacity)
+    return _index
+
+
+def _count(result: str) -> None:
+    from app.metrics import SEMANTIC_CACHE_LOOKUPS
+
+    SEMANTIC_CACHE_LOOKUPS.labels(result).inc()
+
+
+def _context_digest(payload: dict) -> str:
+    context = {k: v for k, v in payload.items() if k not in QUESTION_FIELDS}
+    canonical = json.dumps(context, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def probe(payload: dict) -> Optional[Probe]:
+    """
+    Embedding and context key of a payload, or None when it is not
+    eligible (cache off, nothing to embed, or triage rates it HIGH).
+    """
+    if not current_app.config["SEMANTIC_CACHE"]:
+        return None
+    message = payload.get("message") if isinstance(payload.get("message"), str) else ""
+    symptoms = payload.get("symptoms") or []
+    if isinstance(symptoms, str):
+        symptoms = [symptoms]
+    text = " . ".join([message, *[s for s in symptoms if isinstance(s, str)]]).strip(" .")
+    if not text:
+        return None
+
+    level = triage.assess(message, symptoms).level
+    if level == "HIGH":
+        _count("skip")
+        return None
+    signals = extract_clinical_signals(payload)
+    key = (
+        level,
+        tuple(sorted(signals["normalized_symptoms"])),
+        tuple(sorted(signals["negated_symptoms"])),
+        signals["mental_state"],
+        _context_digest(payload),
+    )
+    return Probe(embed(text, signals), key)
+
+
+def lookup(payload: dict, found: Optional[Probe]) -> Optional[dict]:
+    """
+    A cached answer for the probed payload, with its patient_id.
+    """
+    if found is None:
+        return None
+    config = current_app.config
+    with _index_lock:
+        hit = _get_index().search(found.vector, found.key, config["SEMANTIC_CACHE_THRESHOLD"], monotonic())
+    if hit is None:
+        _count("miss")
+        return None
+    _count("hit")
+    result = copy.deepcopy(hit[0])
+    result["patient_id"] = payload.get("patient_id")
+    return result
+
+
+def store(found: Optional[Probe], result: dict) -> None:
+    if found is None or result.get("risk_level") not in CACHEABLE_RISK_LEVELS:
+        return
+    config = current_app.config
+    value = copy.deepcopy(result)
+    value.pop("patient_id", None)
+    with _index_lock:
+        _get_index().add(found.vector, found.key, value, config["SEMANTIC_CACHE_TTL_SECONDS"], monotonic())
@@ -0,0 +1,176 @@
+# app/services/shared_store.py
+
+"""
+Small key-value store shared by workers: rate-limit counters and
+single-flight locks.
+
+The URL (RATE_LIMIT_STORAGE_URL, SINGLE_FLIGHT_STORAGE_URL) picks the
+backend:
+
+- memory:// (default): a dict in this process. Right for a single
+  worker; with N workers each one enforces the limit separately, so a
+  caller gets up to N times the budget.
+- redis://host:port/db: one Redis shared by every worker and node. Needs
+  the optional `redis` package. Buckets are updated by a Lua script, so
+  concurrent requests from one caller cannot both spend the same tokens.
+
+Both backends implement:
+
+- token buckets: `capacity` tokens, refilled at `rate` tokens per
+  second; `take` spends `cost` of them or reports how long until it
+  could;
+- string values with a TTL: `get`, `set`, `add` (set only if absent,
+  i.e. a lock) and `delete_if` (delete only if it still holds the
+  given value, i.e. unlock).
+"""
+
+from __future__ import annotations
+
+import threading
+from time import monotonic
+from typing import Optional
+
+_MAX_MEMORY_BUCKETS = 100_000
+
+_stores: dict = {}
+_stores_lock = threading.Lock()
+
+
+class MemoryStore:
+    def __init__(self):
+        # key -> (tokens, monotonic time of the last update, time it is full again)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        # key -> (value, monotonic expiry)
+        self._values: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        """
+        Spend `cost` tokens. Returns 0 on success, otherwise the seconds
+        until enough tokens will have refilled (nothing is spent).
+        """
+        now = monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            if key not in self._buckets and len(self._buckets) >= _MAX_MEMORY_BUCKETS:
+                # Full buckets carry no state; drop them
+                for stale in [k for k, bucket in self._buckets.items() if bucket[2] <= now]:
+                    del self._buckets[stale]
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return wait
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key, monotonic())
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._values[key] = (value, monotonic() + ttl)
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        now = monotonic()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            if len(self._values) >= _MAX_MEMORY_BUCKETS:
+                for stale in [k for k, entry in self._values.items() if entry[1] <= now]:
+                    del self._values[stale]
+            self._values[key] = (value, now + ttl)
+            return True
+
+    def delete_if(self, key: str, value: str) -> None:
+        with self._lock:
+            if self._live(key, monotonic()) == value:
+                del self._values[key]
+
+
+# KEYS[1] bucket; ARGV cost, capacity, rate. Uses the Redis clock so
+# every node agrees on the refill.
+_TAKE_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+_DELETE_IF_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._delete_if = self._client.register_script(_DELETE_IF_SCRIPT)
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        return float(self._take(keys=[key], args=[cost, capacity, rate]))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return None if value is None else value.decode()
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        return bool(self._client.set(key, value, px=max(1, int(ttl * 1000)), nx=True))
+
+    def delete_if(self, key: str, value: str) -> None:
+        self._delete_if(keys=[key], args=[value])
+
+
+def create_store(url: str):
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise RuntimeError(f"Unsupported RATE_LIMIT_STORAGE_URL: {url}")
+
+
+def get_store(url: str):
+    """
+    The process-wide store for `url`.
+    """
+    store = _stores.get(url)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(url)
+            if store is None:
+                store = _stores[url] = create_store(url)
+    return store
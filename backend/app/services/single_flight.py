@@ -0,0 +1,130 @@
+# app/services/single_flight.py
+
+"""
+Single-flight coalescing for the AI pipelines.
+
+Double taps and client retries send the same payload several times in
+quick succession. `coalesce` keys each call on a hash of the canonical
+JSON payload. While one call for a key is running, identical calls wait
+for it and get a copy of its result instead of making their own central
+and tone-model calls.
+
+Within a process the waiters share a concurrent.futures.Future, which
+works across the per-request event loops Flask runs async views on.
+
+Across workers (SINGLE_FLIGHT_STORAGE_URL, e.g. the Redis used for rate
+limits) the first caller takes a lock in the shared store and publishes
+its result there for SINGLE_FLIGHT_RESULT_SECONDS. Callers in other
+workers poll for that result for up to SINGLE_FLIGHT_WAIT_SECONDS and
+compute it themselves if the holder disappears. A store that is down
+only disables the cross-worker part.
+
+Results must be JSON-serializable dicts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import uuid
+from concurrent.futures import Future
+from time import monotonic
+from typing import Awaitable, Callable, Optional
+
+from flask import current_app
+
+from app.services.shared_store import get_store
+
+_POLL_SECONDS = 0.05
+
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def payload_key(namespace: str, payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return f"sf:{namespace}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+def _count(namespace: str, scope: str) -> None:
+    from app.metrics import SINGLE_FLIGHT_COALESCED
+
+    SINGLE_FLIGHT_COALESCED.labels(namespace, scope).inc()
+
+
+async def _shared(namespace: str, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Run `compute` under the cross-worker lock, or wait for the worker
+    that holds it.
+    """
+    config = current_app.config
+    url: Optional[str] = config["SINGLE_FLIGHT_STORAGE_URL"]
+    if not url:
+        return await compute()
+
+    store = get_store(url)
+    lock_key, result_key = f"{key}:lock", f"{key}:result"
+    token = uuid.uuid4().hex
+    wait = config["SINGLE_FLIGHT_WAIT_SECONDS"]
+    try:
+        deadline = monotonic() + wait
+        while True:
+            published = store.get(result_key)
+            if published is not None:
+                _count(namespace, "shared")
+                return json.loads(published)
+            if store.add(lock_key, token, wait):
+                break
+            if monotonic() >= deadline:
+                return await compute()
+            await asyncio.sleep(_POLL_SECONDS)
+    except Exception as e:
+        print("single-flight store unavailable; computing locally:", e)
+        return await compute()
+
+    try:
+        result = await compute()
+        try:
+            store.set(result_key, json.dumps(result, default=str), config["SINGLE_FLIGHT_RESULT_SECONDS"])
+        except Exception as e:
+            print("single-flight result not published:", e)
+        return result
+    finally:
+        try:
+            store.delete_if(lock_key, token)
+        except Exception:
+            pass  # expires after SINGLE_FLIGHT_WAIT_SECONDS
+
+
+async def coalesce(namespace: str, payload: dict, compute: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    `await compute()` once for all identical concurrent calls.
+    """
+    if not current_app.config["SINGLE_FLIGHT"]:
+        return await compute()
+
+    key = payload_key(namespace, payload)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        _count(namespace, "local")
+        return copy.deepcopy(await asyncio.wrap_future(future))
+
+    try:
+        result = await _shared(namespace, key, compute)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
@@ -1,11 +1,59 @@
+import asyncio
 import os
-from openai import OpenAI
+import threading
+
+from app import tracing
+from app.metrics import external_call
+from app.services import engine_loop
 
 TONE_MODEL = os.getenv("TONE_MODEL", "gpt-4o-mini")
 TONE_AI_API_KEY = os.getenv("TONE_AI_API_KEY")
+# None -> OpenAI default; point at a local stand-in for load tests
+TONE_AI_BASE_URL = os.getenv("TONE_AI_BASE_URL") or None
+
+# Created on first use: importing `openai` is a large share of cold start,
+# and workers that never serve AI traffic should not pay for it.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Lazy OpenAI client singleton. None when no key is configured.
+    """
+    global _client
+    if _client is None and TONE_AI_API_KEY:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                _client = OpenAI(api_key=TONE_AI_API_KEY, base_url=TONE_AI_BASE_URL)
+    return _client
 
-# Only create client if a key is present to avoid import-time errors
-client = OpenAI(api_key=TONE_AI_API_KEY) if TONE_AI_API_KEY else None
+
+def _new_async_client():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=TONE_AI_API_KEY, base_url=TONE_AI_BASE_URL)
+
+
+# Lives on the engine loop, so its connection pool is reused across requests
+_async_client = engine_loop.Local(_new_async_client)
+
+
+def get_async_client():
+    """
+    Shared AsyncOpenAI client; only use it on the engine loop (see
+    app/services/engine_loop.py). None when no key is configured.
+    """
+    if not TONE_AI_API_KEY:
+        return None
+    return _async_client.get()
+
+
+async def _acreate(**kwargs):
+    # Runs on the engine loop
+    return await get_async_client().chat.completions.create(**kwargs)
 
 SYSTEM_PROMPT = """
 You are a calm, empathetic AI nurse.
@@ -22,44 +70,108 @@ STRICT RULES:
 """
 
 
+def _fallback_text(clinical_text: str) -> str:
+    return (
+        "I’m here with you. Based on what we understand so far:\n\n"
+        + clinical_text
+    )
+
+
+def _build_messages(clinical_text: str, risk_level: str) -> list:
+    user_prompt = f"""
+Risk level: {risk_level}
+
+Clinical explanation:
+\"\"\"{clinical_text}\"\"\"
+
+Rewrite this in a warm, gentle, reassuring nurse-like tone.
+"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _tone_span():
+    return tracing.span(
+        "chat.completions tone_model",
+        kind="client",
+        **{"peer.service": "tone_model", "gen_ai.request.model": TONE_MODEL},
+    )
+
+
+def _record_usage(call, span, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        call.report_usage(
+            {
+                "prompt_tokens": usage.prompt_tokens or 0,
+                "completion_tokens": usage.completion_tokens or 0,
+            }
+        )
+        tracing.set_attributes(
+            span,
+            **{
+                "gen_ai.usage.input_tokens": usage.prompt_tokens or 0,
+                "gen_ai.usage.output_tokens": usage.completion_tokens or 0,
+            },
+        )
+
+
 def transform_to_human_tone(clinical_text: str, risk_level: str) -> str:
     """
     Take the clinical explanation and risk level, and return a warmer
     but medically identical version. If tone model fails or is misconfigured,
     return a safe fallback that still surfaces the original text.
     """
+    client = get_client()
+
     # No key or client configured, skip the model call
     if client is None:
-        return (
-            "I’m here with you. Based on what we understand so far:\n\n"
-            + clinical_text
-        )
+        return _fallback_text(clinical_text)
 
-    user_prompt = f"""
-Risk level: {risk_level}
+    with external_call("tone_model", model=TONE_MODEL) as call, _tone_span() as span:
+        try:
+            response = client.chat.completions.create(
+                model=TONE_MODEL,
+                messages=_build_messages(clinical_text, risk_level),
+                temperature=0.4,
+            )
 
-Clinical explanation:
-\"\"\"{clinical_text}\"\"\"
+            _record_usage(call, span, response)
+            content = response.choices[0].message.content or ""
+            return content.strip()
 
-Rewrite this in a warm, gentle, reassuring nurse-like tone.
-"""
+        except Exception:
+            # Fallback — never block patient response
+            call.fail()
+            return _fallback_text(clinical_text)
 
-    try:
-        response = client.chat.completions.create(
-            model=TONE_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.4,
-        )
 
-        content = response.choices[0].message.content or ""
-        return content.strip()
+async def atransform_to_human_tone(clinical_text: str, risk_level: str) -> str:
+    """
+    Async variant of transform_to_human_tone for the async views. The
+    call runs on the engine loop, where the client keeps its connections.
+    """
+    if not TONE_AI_API_KEY:
+        return _fallback_text(clinical_text)
+
+    with external_call("tone_model", model=TONE_MODEL) as call, _tone_span() as span:
+        try:
+            response = await asyncio.wrap_future(
+                engine_loop.submit(
+                    _acreate(
+                        model=TONE_MODEL,
+                        messages=_build_messages(clinical_text, risk_level),
+                        temperature=0.4,
+                    )
+                )
+            )
 
-    except Exception:
-        # Fallback — never block patient response
-        return (
-            "I’m here with you. Based on what we understand so far:\n\n"
-            + clinical_text
-        )
+            _record_usage(call, span, response)
+            content = response.choices[0].message.content or ""
+            return content.strip()
+
+        except Exception:
+            call.fail()
+            return _fallback_text(clinical_text)
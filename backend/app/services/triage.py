@@ -0,0 +1,263 @@
+# app/services/triage.py
+
+"""
+Local red-flag triage.
+
+RED_FLAGS maps each symptom to the phrasings patients actually type:
+synonyms, plain-language descriptions and common misspellings. All
+phrases are compiled once into an Aho-Corasick automaton over
+normalized text, so a message is scanned in a single pass whatever the
+vocabulary size (tens of microseconds for a chat message). That makes
+it cheap enough to run before any remote call.
+
+Normalization: lower case, curly quotes folded, apostrophes dropped
+("can't" -> "cant"), text split into words and clause punctuation.
+Phrases only match on whole words within one clause.
+
+Only affirmed mentions count. A match is negated when a negation cue
+("no", "dont", "denies", ...) precedes it by at most NEGATION_WINDOW
+words in the same clause, or a resolution cue ("gone", "stopped")
+follows it directly. Clauses end at punctuation and at "but",
+"however", ... health_insights applies the same scope. Phrases that are
+ambiguous on their own ("stroke", "hurt myself") only appear together
+with a cue that makes them a symptom ("having a stroke", "want to hurt
+myself").
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Union
+
+# level -> {symptom: phrasings}
+RED_FLAGS: dict[str, dict[str, tuple[str, ...]]] = {
+    "HIGH": {
+        "chest pain": (
+            "chest pain", "chest pains", "pain in my chest", "pain in chest",
+            "chest hurts", "chest is hurting", "chest tightness", "tight chest",
+            "chest feels tight", "chest pressure", "pressure in my chest",
+            "crushing chest", "chest pian", "chset pain", "chest pane", "chestpain",
+        ),
+        "shortness of breath": (
+            "shortness of breath", "short of breath", "out of breath at rest",
+            "cant breathe", "cant breath", "cannot breathe", "can not breathe",
+            "unable to breathe", "difficulty breathing", "trouble breathing",
+            "hard to breathe", "hard to breath", "struggling to breathe",
+            "gasping for air", "breathless", "breathlessness",
+            "shortness of breathe", "shortnes of breath", "short of breth",
+            "difficulty in breathing", "breathing difficulty",
+        ),
+        "stroke signs": (
+            "having a stroke", "had a stroke today", "signs of a stroke",
+            "stroke symptoms", "face drooping", "facial droop", "face is drooping",
+            "slurred speech", "slurring my words", "speech is slurred",
+            "sudden weakness", "weakness on one side", "numbness on one side",
+            "one side of my body", "cant move my arm", "cant lift my arm",
+        ),
+        "loss of consciousness": (
+            "fainted", "fainting", "passed out", "passing out", "blacked out",
+            "unconscious", "i collapsed", "just collapsed", "lost consciousness", "fanted",
+        ),
+        "severe bleeding": (
+            "severe bleeding", "heavy bleeding", "bleeding heavily",
+            "wont stop bleeding", "bleeding wont stop", "vomiting blood",
+            "throwing up blood", "coughing up blood", "blood in my vomit",
+            "black stool", "black stools", "tarry stool",
+        ),
+        "seizure": (
+            "seizure", "seizures", "convulsion", "convulsions",
+            "siezure", "seziure",
+        ),
+        "anaphylaxis": (
+            "anaphylaxis", "anaphylactic", "throat swelling", "throat is swelling",
+            "throat closing", "throat is closing", "tongue swelling",
+            "swollen tongue", "lips swelling", "swollen lips",
+        ),
+        "severe headache": (
+            "worst headache", "thunderclap headache", "sudden severe headache",
+        ),
+        "suicidal thoughts": (
+            "suicidal", "suicide", "kill myself", "killing myself", "end my life",
+            "want to die", "wanna die", "self harm", "harm myself",
+            "want to hurt myself", "going to hurt myself", "thoughts of hurting myself",
+            "thinking about hurting myself", "urge to hurt myself",
+        ),
+    },
+    "MEDIUM": {
+        "fever": ("fever", "high temperature", "feverish", "fevr", "chills"),
+        "vomiting": (
+            "vomiting", "throwing up", "cant keep food down", "cant keep anything down",
+            "vomitting",
+        ),
+        "dizziness": ("dizzy", "dizziness", "lightheaded", "light headed", "dizzyness"),
+        "palpitations": (
+            "palpitations", "heart racing", "racing heart", "heart pounding",
+            "irregular heartbeat", "palpitation",
+        ),
+        "confusion": ("confused", "confusion", "disoriented"),
+        "wound problem": (
+            "wound infection", "infected wound", "pus", "wound is red",
+            "redness around the wound", "wound opened", "stitches opened",
+        ),
+        "severe pain": ("severe pain", "unbearable pain", "excruciating"),
+        "swelling": ("swollen leg", "leg swelling", "calf pain", "swollen calf"),
+        "dehydration": ("dehydrated", "not urinating", "no urine", "cant drink"),
+    },
+}
+
+LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+NEGATION_WINDOW = 5
+NEGATION_CUES = {
+    "no", "not", "without", "denies", "deny", "denied", "never", "none", "nor",
+    "dont", "doesnt", "didnt", "havent", "hasnt", "isnt", "arent", "wasnt", "free",
+}
+RESOLUTION_CUES = {"gone", "resolved", "subsided", "stopped"}
+CLAUSE_BREAKS = {".", ",", ";", ":", "!", "?", "but", "however", "although", "though", "except", "yet"}
+
+_APOSTROPHES = re.compile(r"['’‘`]")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# Words, plus the clause punctuation negation scope stops at
+_TOKEN = re.compile(r"[a-z0-9]+|[.,;:!?]")
+
+
+def normalize(text: str) -> str:
+    """
+    " <normalized words> ": padded so every word has a space on both sides.
+    """
+    text = _APOSTROPHES.sub("", text.lower())
+    return " " + _NON_WORD.sub(" ", text).strip() + " "
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(_APOSTROPHES.sub("", text.lower()))
+
+
+def negated(tokens: list[str], start: int, end: int) -> bool:
+    """
+    Whether tokens[start:end] is negated within its clause.
+    """
+    for i in range(start - 1, max(start - 1 - NEGATION_WINDOW, -1), -1):
+        if tokens[i] in CLAUSE_BREAKS:
+            break
+        if tokens[i] in NEGATION_CUES:
+            return True
+    following = tokens[end : end + 3]
+    return any(t in RESOLUTION_CUES for t in following if t not in CLAUSE_BREAKS)
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over characters. `search` yields
+    (start, end, pattern index) for every occurrence, overlaps included.
+    """
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(index)
+
+        # Breadth-first: a node's failure link points at the longest
+        # proper suffix of its path that is also a prefix of some pattern.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def search(self, text: str):
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                yield position - len(patterns[index]) + 1, position + 1, index
+
+
+@dataclass
+class Triage:
+    level: str = "LOW"
+    # Matched symptoms by level, in order of first appearance
+    matches: dict[str, list[str]] = field(default_factory=dict)
+
+    @property
+    def red_flags(self) -> list[str]:
+        return self.matches.get("HIGH", [])
+
+
+def _compile() -> tuple[Automaton, list[tuple[str, str]]]:
+    patterns, labels = [], []
+    for level, symptoms in RED_FLAGS.items():
+        for symptom, phrases in symptoms.items():
+            for phrase in phrases:
+                patterns.append(normalize(phrase).strip())
+                labels.append((level, symptom))
+    return Automaton(patterns), labels
+
+
+_AUTOMATON, _LABELS = _compile()
+
+
+def assess(
+    message: Optional[str] = None,
+    symptoms: Union[Iterable[str], str, None] = None,
+) -> Triage:
+    """
+    Triage a free-text message plus the structured symptom list.
+    """
+    # Payloads come from clients: anything that is not text is ignored
+    texts = [message] if isinstance(message, str) and message else []
+    if isinstance(symptoms, str):
+        texts.append(symptoms)
+    elif isinstance(symptoms, (list, tuple)):
+        # One scan per entry so two entries never join into a phrase
+        texts.extend(s for s in symptoms if isinstance(s, str))
+
+    result = Triage()
+    for text in texts:
+        tokens = tokenize(text)
+        # Punctuation stays a token, so no phrase matches across it
+        normalized = " " + " ".join(tokens) + " "
+        # character offset of each token -> its index
+        offsets, position = {}, 1
+        for i, token in enumerate(tokens):
+            offsets[position] = i
+            position += len(token) + 1
+        for start, end, index in _AUTOMATON.search(normalized):
+            # Whole words only
+            if normalized[start - 1] != " " or normalized[end] != " ":
+                continue
+            first = offsets[start]
+            if negated(tokens, first, first + normalized.count(" ", start, end) + 1):
+                continue
+            level, symptom = _LABELS[index]
+            found = result.matches.setdefault(level, [])
+            if symptom not in found:
+                found.append(symptom)
+            if LEVELS.index(level) > LEVELS.index(result.level):
+                result.level = level
+    return result
@@ -0,0 +1,369 @@
+# app/services/usage.py
+
+"""
+Token, cost and latency accounting for calls to the central backend and
+the model providers.
+
+Every external_call (see app/metrics.py) is recorded here: latency and
+failure for all of them, plus token counts and cost where the response
+reports them (the OpenAI-style `usage` object). A call is attributed to:
+
+- route: the Flask endpoint that caused it ("background" outside a
+  request);
+- patient: the patient_id of the pipeline run (see `attributed`);
+- target and model.
+
+Totals are kept in memory per (minute, route, patient, target, model)
+and written to model_usage every USAGE_FLUSH_SECONDS by a background
+thread, one row per key, so the table grows with the number of distinct
+flows per minute, not with traffic. Rows from several workers for the
+same minute are summed by the report queries. When the database is
+unreachable a flush keeps the totals for the next one (up to
+USAGE_MAX_PENDING keys). When a batch fails for any other reason, its
+rows are retried one at a time and rows the table refuses are dropped,
+so one bad row cannot stall accounting. Attribution strings are cut to
+their column lengths on record (patient_id comes from the client).
+
+Cost is the provider-reported cost when there is one (OpenRouter), else
+tokens times USAGE_PRICES, a JSON object of
+{"model": [USD per 1M prompt tokens, USD per 1M completion tokens]}.
+
+Code that hops threads (background jobs, the OpenRouter engine loop)
+carries `current()` across and re-enters it with `attributed`.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from flask import Flask, has_request_context, request
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.sql_models import ModelUsage
+
+# Report dimensions: name -> column expression
+DIMENSIONS = {
+    "route": ModelUsage.route,
+    "patient": ModelUsage.patient_id,
+    "target": ModelUsage.target,
+    "model": ModelUsage.model,
+    "day": func.date_trunc("day", ModelUsage.bucket),
+    "hour": func.date_trunc("hour", ModelUsage.bucket),
+}
+SORTS = ("cost", "tokens", "calls", "errors", "avg_latency", "max_latency")
+
+
+@dataclass(frozen=True)
+class Attribution:
+    route: str
+    patient_id: Optional[str] = None
+
+
+_attribution: ContextVar[Optional[Attribution]] = ContextVar("viora_usage_attribution", default=None)
+
+# key -> [calls, errors, prompt tokens, completion tokens, cost, latency ms sum, latency ms max]
+_totals: dict[tuple, list] = {}
+_totals_lock = threading.Lock()
+
+_app: Optional[Flask] = None
+_prices: dict[str, tuple[float, float]] = {}
+_flusher_pid: Optional[int] = None
+_flusher_lock = threading.Lock()
+
+
+def current() -> Attribution:
+    found = _attribution.get()
+    if found is not None:
+        return found
+    if has_request_context() and request.endpoint:
+        return Attribution(request.endpoint)
+    return Attribution("background")
+
+
+@contextmanager
+def attributed(attribution: Optional[Attribution] = None, patient_id=None) -> Iterator[None]:
+    """
+    Attribute calls made inside the block to `attribution` (default: the
+    current one) and, when given, to `patient_id`.
+    """
+    base = attribution or current()
+    if patient_id is not None:
+        base = Attribution(base.route, str(patient_id))
+    token = _attribution.set(base)
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def _clip(value: Optional[str], column) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value)[: column.type.length]
+
+
+def _cost(model: str, prompt_tokens: int, completion_tokens: int, reported) -> float:
+    if isinstance(reported, (int, float)) and not isinstance(reported, bool):
+        return float(reported)
+    prompt_price, completion_price = _prices.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record(
+    target: str,
+    model: Optional[str],
+    seconds: float,
+    failed: bool,
+    usage: Optional[dict] = None,
+    attribution: Optional[Attribution] = None,
+) -> None:
+    """
+    Add one call. `usage` is the response's usage object, if any:
+    prompt_tokens, completion_tokens and optionally cost.
+    """
+    if _app is None:
+        return
+    usage = usage or {}
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    model = _clip(model or target, ModelUsage.model)
+    attribution = attribution or current()
+    bucket = int(time.time()) // 60 * 60
+    key = (
+        bucket,
+        _clip(attribution.route, ModelUsage.route),
+        _clip(attribution.patient_id, ModelUsage.patient_id),
+        _clip(target, ModelUsage.target),
+        model,
+    )
+    latency_ms = seconds * 1000
+
+    with _totals_lock:
+        totals = _totals.get(key)
+        if totals is None:
+            if len(_totals) >= _app.config["USAGE_MAX_PENDING"]:
+                return
+            totals = _totals[key] = [0, 0, 0, 0, 0.0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += int(failed)
+        totals[2] += prompt_tokens
+        totals[3] += completion_tokens
+        totals[4] += _cost(model, prompt_tokens, completion_tokens, usage.get("cost"))
+        totals[5] += latency_ms
+        totals[6] = max(totals[6], latency_ms)
+
+    if prompt_tokens or completion_tokens:
+        from app.metrics import MODEL_TOKENS
+
+        MODEL_TOKENS.labels(target, model, "prompt").inc(prompt_tokens)
+        MODEL_TOKENS.labels(target, model, "completion").inc(completion_tokens)
+    _ensure_flusher()
+
+
+def _merge(pending: dict[tuple, list]) -> None:
+    with _totals_lock:
+        for key, values in pending.items():
+            totals = _totals.get(key)
+            if totals is None:
+                if len(_totals) >= _app.config["USAGE_MAX_PENDING"]:
+                    continue
+                _totals[key] = values
+            else:
+                for i in range(6):
+                    totals[i] += values[i]
+                totals[6] = max(totals[6], values[6])
+
+
+def flush() -> int:
+    """
+    Write the in-memory totals to model_usage; returns the rows written.
+    """
+    global _totals
+    if _app is None:
+        return 0
+    with _totals_lock:
+        pending, _totals = _totals, {}
+    if not pending:
+        return 0
+
+    rows = {key: _row(key, values) for key, values in pending.items()}
+    with _app.app_context():
+        try:
+            db.session.execute(insert(ModelUsage), list(rows.values()))
+            db.session.commit()
+            return len(rows)
+        except OperationalError as e:
+            print("usage flush failed; keeping totals for the next one:", e)
+            db.session.rollback()
+            _merge(pending)
+            return 0
+        except Exception as e:
+            print("usage flush failed; retrying row by row:", e)
+            db.session.rollback()
+            return _flush_each(pending, rows)
+        finally:
+            db.session.remove()
+
+
+def _row(key: tuple, values: list) -> dict:
+    bucket, route, patient_id, target, model = key
+    calls, errors, prompt_tokens, completion_tokens, cost, latency_total, latency_max = values
+    return {
+        "bucket": datetime.fromtimestamp(bucket, timezone.utc),
+        "route": route,
+        "patient_id": patient_id,
+        "target": target,
+        "model": model,
+        "calls": calls,
+        "errors": errors,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": cost,
+        "latency_ms_total": latency_total,
+        "latency_ms_max": latency_max,
+    }
+
+
+def _flush_each(pending: dict[tuple, list], rows: dict[tuple, dict]) -> int:
+    """
+    Insert rows one at a time, dropping those the table refuses. Stops
+    and keeps the rest when the database goes away.
+    """
+    written = 0
+    keys = list(rows)
+    for i, key in enumerate(keys):
+        try:
+            db.session.execute(insert(ModelUsage), [rows[key]])
+            db.session.commit()
+            written += 1
+        except OperationalError as e:
+            print("usage flush failed; keeping totals for the next one:", e)
+            db.session.rollback()
+            _merge({k: pending[k] for k in keys[i:]})
+            break
+        except Exception as e:
+            print("usage row dropped:", key, e)
+            db.session.rollback()
+    return written
+
+
+def _flush_forever(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception as e:
+            print("usage flush error:", e)
+
+
+def _ensure_flusher() -> None:
+    """
+    Start this process's flush thread on first use (again after a fork).
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(
+                target=_flush_forever,
+                args=(_app.config["USAGE_FLUSH_SECONDS"],),
+                name="usage-flush",
+                daemon=True,
+            ).start()
+
+
+def _parse_prices(raw: Optional[str]) -> dict[str, tuple[float, float]]:
+    if not raw:
+        return {}
+    try:
+        return {model: (float(p[0]), float(p[1])) for model, p in json.loads(raw).items()}
+    except (ValueError, TypeError, IndexError, AttributeError) as e:
+        print("USAGE_PRICES ignored:", e)
+        return {}
+
+
+def init_usage(app: Flask) -> None:
+    """
+    Turn accounting on for this process (no-op when USAGE_ACCOUNTING=0).
+    """
+    global _app, _prices
+    if not app.config["USAGE_ACCOUNTING"]:
+        return
+    _app = app
+    _prices = _parse_prices(app.config["USAGE_PRICES"])
+    atexit.register(flush)
+
+
+# ---------- Reports ----------
+
+
+def report(group_by: list[str], since: datetime, until: datetime, sort: str, limit: int) -> list[dict]:
+    """
+    Totals per group over since <= bucket < until, most expensive first
+    (or by `sort`).
+    """
+    columns = [DIMENSIONS[name].label(name) for name in group_by]
+    calls = func.sum(ModelUsage.calls)
+    prompt = func.sum(ModelUsage.prompt_tokens)
+    completion = func.sum(ModelUsage.completion_tokens)
+    order = {
+        "cost": func.sum(ModelUsage.cost_usd),
+        "tokens": prompt + completion,
+        "calls": calls,
+        "errors": func.sum(ModelUsage.errors),
+        "avg_latency": func.sum(ModelUsage.latency_ms_total) / calls,
+        "max_latency": func.max(ModelUsage.latency_ms_max),
+    }
+    query = (
+        select(
+            *columns,
+            calls.label("calls"),
+            func.sum(ModelUsage.errors).label("errors"),
+            prompt.label("prompt_tokens"),
+            completion.label("completion_tokens"),
+            func.sum(ModelUsage.cost_usd).label("cost_usd"),
+            func.sum(ModelUsage.latency_ms_total).label("latency_ms_total"),
+            func.max(ModelUsage.latency_ms_max).label("latency_ms_max"),
+        )
+        .where(ModelUsage.bucket >= since, ModelUsage.bucket < until)
+        .group_by(*columns)
+        .order_by(order[sort].desc())
+        .limit(limit)
+    )
+
+    result = []
+    for row in db.session.execute(query):
+        entry = {}
+        for name in group_by:
+            value = getattr(row, name)
+            entry[name] = value.isoformat() if isinstance(value, datetime) else value
+        entry.update(
+            calls=int(row.calls),
+            errors=int(row.errors),
+            prompt_tokens=int(row.prompt_tokens),
+            completion_tokens=int(row.completion_tokens),
+            total_tokens=int(row.prompt_tokens + row.completion_tokens),
+            cost_usd=round(float(row.cost_usd), 6),
+            avg_latency_ms=round(float(row.latency_ms_total) / int(row.calls), 1),
+            max_latency_ms=round(float(row.latency_ms_max), 1),
+        )
+        result.append(entry)
+    return result
+
+
+def default_window() -> tuple[datetime, datetime]:
+    until = datetime.now(timezone.utc)
+    return until - timedelta(days=1), until
@@ -5,6 +5,7 @@ from __future__ import annotations
 from datetime import datetime, timezone, date
 from uuid import uuid4
 
+from sqlalchemy import DDL, event
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from app import db
 
@@ -118,10 +119,41 @@ class Appointment(db.Model):
     reason = db.Column(db.String(255))
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    # Indexed: incremental exports range-scan it
+    updated_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, index=True
+    )
 
     patient = db.relationship("Patient", backref="appointments")
     doctor = db.relationship("Doctor", backref="appointments")
 
+    # Slot search reads a doctor's booked ranges in time order.
+    # Overlaps are prevented by an exclusion constraint (migrations/003).
+    __table_args__ = (
+        db.Index("ix_appointments_doctor_start", "doctor_id", "start_time"),
+    )
+
+
+class DoctorWorkingHours(db.Model):
+    __tablename__ = "doctor_working_hours"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    doctor_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("doctors.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    weekday = db.Column(db.SmallInteger, nullable=False)  # 0 = Monday
+    start_time = db.Column(db.Time, nullable=False)  # local time in `timezone`
+    end_time = db.Column(db.Time, nullable=False)  # <= start_time: ends next day
+    timezone = db.Column(db.String(64), nullable=False, default="UTC")  # IANA name
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    doctor = db.relationship("Doctor", backref="working_hours")
+
 
 # ---------- Medications ----------
 
@@ -151,6 +183,9 @@ class Medication(db.Model):
     instructions = db.Column(db.Text)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    updated_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, index=True
+    )
 
     patient = db.relationship("Patient", backref="medications")
     doctor = db.relationship("Doctor", backref="prescriptions")
@@ -172,16 +207,30 @@ class MedicationEvent(db.Model):
         nullable=False,
     )
 
-    scheduled_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    # Partition key, so part of the table's primary key (see __mapper_args__)
+    scheduled_time = db.Column(db.DateTime(timezone=True), primary_key=True)
     taken_time = db.Column(db.DateTime(timezone=True))
     status = db.Column(db.String(20), nullable=False)  # scheduled/taken/skipped/missed
     notes = db.Column(db.Text)
+    updated_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, index=True
+    )
 
     # reminder_id = db.Column(db.String(255))
 
     medication = db.relationship("Medication", backref="events")
     patient = db.relationship("Patient", backref="medication_events")
 
+    # Monthly range partitions; see app/services/partitions.py
+    __table_args__ = (
+        db.Index("ix_medication_events_patient_scheduled", "patient_id", "scheduled_time"),
+        db.Index("ix_medication_events_medication_id", "medication_id"),
+        db.Index("ix_medication_events_scheduled_brin", "scheduled_time", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (scheduled_time)"},
+    )
+    # Rows are still identified by id alone
+    __mapper_args__ = {"primary_key": [id]}
+
 
 # ---------- Chat ----------
 
@@ -230,11 +279,30 @@ class ChatMessage(db.Model):
 
     content = db.Column(db.Text, nullable=False)
     extra_metadata = db.Column(JSONB)  # renamed from `metadata`
-    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    # Partition key, so part of the table's primary key (see __mapper_args__)
+    created_at = db.Column(db.DateTime(timezone=True), primary_key=True, default=utcnow)
 
     session = db.relationship("ChatSession", backref="messages")
     sender = db.relationship("User", backref="chat_messages")
 
+    # Monthly range partitions; see app/services/partitions.py
+    __table_args__ = (
+        db.Index("ix_chat_messages_session_created", "session_id", "created_at"),
+        db.Index("ix_chat_messages_created_brin", "created_at", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+# create_all: a DEFAULT partition catches rows no monthly partition covers
+# yet, so inserts work before `flask maintain-partitions` has ever run
+for _partitioned in (MedicationEvent.__table__, ChatMessage.__table__):
+    event.listen(
+        _partitioned,
+        "after_create",
+        DDL("CREATE TABLE %(table)s_default PARTITION OF %(table)s DEFAULT"),
+    )
+
 
 # ---------- Reports ----------
 
@@ -260,6 +328,194 @@ class PatientReport(db.Model):
     date = db.Column(db.Date)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    updated_at = db.Column(
+        db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow
+    )
 
     patient = db.relationship("Patient", backref="reports")
     uploader = db.relationship("User", backref="uploaded_reports")
+
+
+# ---------- Caching ----------
+
+
+class DataVersion(db.Model):
+    """
+    Change counter per (collection, scope), bumped in the same transaction
+    as the change. See app/services/data_versions.py.
+    """
+
+    __tablename__ = "data_versions"
+
+    collection = db.Column(db.String(50), primary_key=True)  # "medications", "profile", ...
+    scope = db.Column(db.String(64), primary_key=True)  # "patient:<uuid>", "doctor:<uuid>", ...
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+
+class ChangeLogEntry(db.Model):
+    """
+    One row per created/updated/deleted patient-owned entity, written in
+    the same transaction as the change. See app/services/change_log.py.
+    """
+
+    __tablename__ = "change_log"
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    patient_id = db.Column(UUID(as_uuid=True), nullable=False)  # no FK: must outlive the patient's rows
+    entity = db.Column(db.String(30), nullable=False)  # medication/appointment/report/medication_event/profile
+    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert/delete
+    # Writing transaction's id; see change_log.py for why ids alone are not enough
+    txid = db.Column(
+        db.BigInteger,
+        nullable=False,
+        server_default=db.text("(pg_current_xact_id()::text)::bigint"),
+    )
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index("ix_change_log_patient_txid", "patient_id", "txid", "id"),
+        # Retention deletes by age; rows are appended in time order
+        db.Index("ix_change_log_changed_at", "changed_at", postgresql_using="brin"),
+    )
+
+
+class ChangeLogPruned(db.Model):
+    """
+    Newest (txid, id) that retention deleted from change_log. A sync
+    token before it may have missed changes. Single row, id = 1.
+    """
+
+    __tablename__ = "change_log_pruned"
+
+    id = db.Column(db.SmallInteger, primary_key=True, default=1)
+    txid = db.Column(db.BigInteger, nullable=False)
+    entry_id = db.Column(db.BigInteger, nullable=False)
+    pruned_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    __table_args__ = (db.CheckConstraint("id = 1"),)
+
+
+# ---------- Exports ----------
+
+
+class ExportJob(db.Model):
+    """
+    One background export of a dataset to a file in EXPORT_DIR.
+    See app/services/exports.py.
+    """
+
+    __tablename__ = "export_jobs"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    requested_by = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("users.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+    # Doctor whose linked patients are exported; NULL = all patients (admin)
+    doctor_id = db.Column(UUID(as_uuid=True), nullable=True)
+
+    dataset = db.Column(db.String(30), nullable=False)  # medications/medication_events/appointments
+    format = db.Column(db.String(10), nullable=False)  # csv/parquet
+    since = db.Column(db.DateTime(timezone=True))  # updated_at >= since
+    until = db.Column(db.DateTime(timezone=True), nullable=False)  # updated_at < until
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.BigInteger)
+    file_name = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+    expires_at = db.Column(db.DateTime(timezone=True), index=True)  # job and file deleted after
+
+    __table_args__ = (
+        # Claim order for workers; done/failed rows are not in it
+        db.Index(
+            "ix_export_jobs_pending",
+            "created_at",
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+
+
+# ---------- AI jobs ----------
+
+
+class AIJob(db.Model):
+    """
+    One queued /nurse/chat or /patient/ai/ request answered with 202.
+    See app/services/ai_jobs.py.
+    """
+
+    __tablename__ = "ai_jobs"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    kind = db.Column(db.String(30), nullable=False)  # nurse_chat/patient_ai
+    # User id for /nurse/chat (only they may read it); NULL for /patient/ai/
+    owner = db.Column(db.String(64))
+    route = db.Column(db.String(100), nullable=False)  # enqueuing endpoint, for usage accounting
+    idempotency_key = db.Column(db.String(255))
+    payload_hash = db.Column(db.String(64), nullable=False)
+    payload = db.Column(JSONB, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(JSONB)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    started_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+    # Finished jobs are deleted after this; an unfinished one is kept
+    expires_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        # Claim order for workers; done/failed rows are not in it
+        db.Index(
+            "ix_ai_jobs_pending",
+            "created_at",
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+        db.Index(
+            "ux_ai_jobs_idempotency",
+            "kind",
+            db.text("COALESCE(owner, '')"),
+            "idempotency_key",
+            unique=True,
+            postgresql_where=db.text("idempotency_key IS NOT NULL"),
+        ),
+        db.Index("ix_ai_jobs_expires_at", "expires_at"),
+    )
+
+
+# ---------- Usage accounting ----------
+
+
+class ModelUsage(db.Model):
+    """
+    Per-minute totals of external AI calls for one (route, patient,
+    target, model), flushed by each worker. See app/services/usage.py.
+    """
+
+    __tablename__ = "model_usage"
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    bucket = db.Column(db.DateTime(timezone=True), nullable=False)  # start of the minute
+    route = db.Column(db.String(100), nullable=False)  # Flask endpoint or "background"
+    patient_id = db.Column(db.String(64))  # as sent in the AI payload; no FK
+    target = db.Column(db.String(30), nullable=False)  # central_backend/openrouter/tone_model
+    model = db.Column(db.String(100), nullable=False)
+    calls = db.Column(db.Integer, nullable=False)
+    errors = db.Column(db.Integer, nullable=False)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False)
+    completion_tokens = db.Column(db.BigInteger, nullable=False)
+    cost_usd = db.Column(db.Float, nullable=False)
+    latency_ms_total = db.Column(db.Float, nullable=False)
+    latency_ms_max = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_model_usage_bucket_brin", "bucket", postgresql_using="brin"),
+        db.Index("ix_model_usage_patient_bucket", "patient_id", "bucket"),
+    )
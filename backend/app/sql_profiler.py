@@ -0,0 +1,140 @@
+# app/sql_profiler.py
+
+"""
+Opt-in per-request SQL profiler (SQL_PROFILER=1).
+
+Records every statement a request executes, then adds a summary as a
+`Server-Timing` header and as one structured log line per request:
+
+    Server-Timing: db;dur=14.2;desc="9 queries", db-n1;desc="1 repeated shape"
+
+A statement "shape" is the SQL with bind parameters and IN-lists
+collapsed. The same SELECT shape running SQL_PROFILER_N1_THRESHOLD or
+more times in one request is flagged as a suspected N+1.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from collections import Counter
+from time import perf_counter
+
+from flask import Flask, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+_PARAMS = re.compile(r"%\(\w+\)s|\$\d+|\?|:\w+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("IN (?)", shape)
+    shape = _PARAMS.sub("?", shape)
+    return _LITERALS.sub("?", shape)
+
+
+class RequestProfile:
+    __slots__ = ("count", "total_s", "shapes", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.shapes: Counter = Counter()
+        self.slow: list = []
+
+    def record(self, statement: str, elapsed_s: float, slow_s: float) -> None:
+        self.count += 1
+        self.total_s += elapsed_s
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        if elapsed_s >= slow_s:
+            self.slow.append((round(elapsed_s * 1000, 2), shape[:500]))
+
+    def repeated(self, threshold: int) -> list:
+        return [
+            (shape, n)
+            for shape, n in self.shapes.most_common()
+            if n >= threshold and shape.upper().startswith("SELECT")
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get("_sql_profile") is not None:
+        conn.info.setdefault("_sql_profile_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("_sql_profile_start")
+    if not starts:
+        return
+    elapsed = perf_counter() - starts.pop()
+    profile = g.get("_sql_profile") if has_app_context() else None
+    if profile is not None:
+        profile.record(statement, elapsed, current_app.config["SQL_PROFILER_SLOW_MS"] / 1000)
+
+
+def _on_error(exception_context):
+    # after_cursor_execute never fires for a failed statement
+    conn = exception_context.connection
+    starts = conn.info.get("_sql_profile_start") if conn is not None else None
+    if starts:
+        starts.pop()
+
+
+def _start_profile():
+    g._sql_profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop("_sql_profile", None)
+    if profile is None:
+        return response
+
+    config = current_app.config
+    repeated = profile.repeated(config["SQL_PROFILER_N1_THRESHOLD"])
+    db_ms = round(profile.total_s * 1000, 2)
+
+    timing = [f'db;dur={db_ms};desc="{profile.count} queries"']
+    if repeated:
+        timing.append(f'db-n1;desc="{len(repeated)} repeated shape{"s" if len(repeated) > 1 else ""}"')
+    response.headers.add("Server-Timing", ", ".join(timing))
+
+    summary = {
+        "event": "sql_profile",
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "path": request.path,
+        "status": response.status_code,
+        "queries": profile.count,
+        "db_ms": db_ms,
+        "suspected_n_plus_one": [{"shape": s[:500], "count": n} for s, n in repeated],
+        "slow": [{"ms": ms, "shape": s} for ms, s in profile.slow],
+        "distinct_shapes": len(profile.shapes),
+    }
+    log = current_app.logger.warning if repeated or profile.slow else current_app.logger.info
+    log(json.dumps(summary))
+    return response
+
+
+def init_sql_profiler(app: Flask) -> None:
+    """
+    No-op unless SQL_PROFILER is enabled: the cursor listeners are only
+    installed (and per-request state only created) when profiling is on.
+    """
+    if not app.config.get("SQL_PROFILER"):
+        return
+
+    app.config.setdefault("SQL_PROFILER_SLOW_MS", 50.0)
+    app.config.setdefault("SQL_PROFILER_N1_THRESHOLD", 5)
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _on_error)
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
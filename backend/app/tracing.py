@@ -0,0 +1,306 @@
+# app/tracing.py
+
+"""
+OpenTelemetry tracing (TRACING=1).
+
+Spans:
+- one SERVER span per request, continuing an incoming `traceparent`
+- one CLIENT span per SQL statement (statement text only, never parameters)
+- one CLIENT span per outbound call; the central backend gets `traceparent`
+- INTERNAL spans for the patient AI pipeline stages
+
+Sampling is ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)): a request
+is sampled when its caller sampled it, otherwise with the given probability.
+Spans of unsampled requests are never recorded.
+
+Exporters (TRACING_EXPORTER):
+    otlp   OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (default http://localhost:4318)
+           needs opentelemetry-exporter-otlp-proto-http
+    file   one JSON span per line, appended to TRACING_FILE
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from flask import Flask, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+if TYPE_CHECKING:
+    from opentelemetry.sdk.trace import ReadableSpan
+    from opentelemetry.trace import Span
+
+SERVICE_NAME = "viora-backend"
+
+# Set by init_tracing; every helper below is a no-op while this is None
+_tracer = None
+_provider_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """
+    Usage:
+        with tracing.span("patient_ai.central", **{"viora.stage": "central"}):
+            ...
+
+    kind is "internal" or "client". Yields None when tracing is off.
+    """
+    if _tracer is None:
+        yield None
+        return
+
+    from opentelemetry.trace import SpanKind
+
+    with _tracer.start_as_current_span(
+        name,
+        kind=SpanKind.CLIENT if kind == "client" else SpanKind.INTERNAL,
+        attributes=attributes,
+    ) as current:
+        yield current
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """
+    Add W3C trace-context headers for the current span to `headers`.
+    """
+    headers = {} if headers is None else headers
+    if _tracer is not None:
+        from opentelemetry import propagate
+
+        propagate.inject(headers)
+    return headers
+
+
+def set_attributes(current: Optional[Span], **attributes) -> None:
+    if current is not None:
+        current.set_attributes(attributes)
+
+
+def current_context():
+    """
+    The active trace context, to hand to work that runs on another
+    thread or event loop. None when tracing is off.
+    """
+    if _tracer is None:
+        return None
+    from opentelemetry import context
+
+    return context.get_current()
+
+
+@contextmanager
+def attached(parent) -> Iterator[None]:
+    """
+    Make `parent` (from current_context) the active context in this block.
+    """
+    if parent is None:
+        yield
+        return
+    from opentelemetry import context
+
+    token = context.attach(parent)
+    try:
+        yield
+    finally:
+        context.detach(token)
+
+
+class JsonLinesSpanExporter:
+    """
+    SpanExporter that appends one JSON object per span to a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: list[ReadableSpan]):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        lines = "".join(s.to_json(indent=None) + "\n" for s in spans)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(lines)
+        except OSError as e:
+            print("trace export failed:", e)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+def _exporter(app: Flask):
+    kind = app.config["TRACING_EXPORTER"]
+    if kind == "file":
+        return JsonLinesSpanExporter(
+            app.config.get("TRACING_FILE") or os.path.join(app.instance_path, "traces.jsonl")
+        )
+    if kind == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            raise RuntimeError(
+                "TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http"
+            ) from e
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        return OTLPSpanExporter()
+    raise RuntimeError(f"Unsupported TRACING_EXPORTER: {kind}")
+
+
+def _tracer_provider(app: Flask):
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    with _provider_lock:
+        provider = trace.get_tracer_provider()
+        if isinstance(provider, TracerProvider):
+            # Another app in this process already configured it
+            return provider
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": SERVICE_NAME}),
+            sampler=ParentBased(TraceIdRatioBased(app.config["TRACING_SAMPLE_RATIO"])),
+        )
+        # Exports from a background thread, off the request path
+        provider.add_span_processor(BatchSpanProcessor(_exporter(app)))
+        trace.set_tracer_provider(provider)
+        return provider
+
+
+# --- SQL statements ---
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    from opentelemetry import trace
+    from opentelemetry.trace import SpanKind
+
+    current = None
+    if trace.get_current_span().is_recording():
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        current = _tracer.start_span(
+            f"{operation} {conn.engine.url.database or ''}".strip(),
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": conn.dialect.name,
+                "db.name": conn.engine.url.database or "",
+                "db.operation": operation,
+                # Bound parameters carry patient data and are never recorded
+                "db.statement": statement[:2000],
+                "db.executemany": bool(executemany),
+            },
+        )
+    # Pushed even when None so the after/error hooks stay balanced
+    conn.info.setdefault("_trace_spans", []).append(current)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("_trace_spans")
+    current = spans.pop() if spans else None
+    if current is not None:
+        if cursor is not None and cursor.rowcount is not None and cursor.rowcount >= 0:
+            current.set_attribute("db.rowcount", cursor.rowcount)
+        current.end()
+
+
+def _on_error(exception_context):
+    from opentelemetry.trace import Status, StatusCode
+
+    conn = exception_context.connection
+    spans = conn.info.get("_trace_spans") if conn is not None else None
+    current = spans.pop() if spans else None
+    if current is not None:
+        current.record_exception(exception_context.original_exception)
+        current.set_status(Status(StatusCode.ERROR))
+        current.end()
+
+
+# --- Requests ---
+
+
+def _start_request_span():
+    from opentelemetry import context, propagate, trace
+    from opentelemetry.trace import SpanKind
+
+    route = request.url_rule.rule if request.url_rule else None
+    current = _tracer.start_span(
+        f"{request.method} {route or 'unmatched'}",
+        context=propagate.extract(request.headers),
+        kind=SpanKind.SERVER,
+        attributes={
+            "http.request.method": request.method,
+            "http.route": route or "",
+            "url.path": request.path,
+            "user_agent.original": request.user_agent.string or "",
+            "flask.endpoint": request.endpoint or "",
+        },
+    )
+    # Async views run with a copy of this context, so their spans nest here
+    g._trace_token = context.attach(trace.set_span_in_context(current))
+    g._trace_span = current
+
+
+def _record_status(response):
+    current = g.get("_trace_span")
+    if current is not None:
+        current.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            from opentelemetry.trace import Status, StatusCode
+
+            current.set_status(Status(StatusCode.ERROR))
+    return response
+
+
+def _end_request_span(exc):
+    current = g.pop("_trace_span", None)
+    token = g.pop("_trace_token", None)
+    if current is None:
+        return
+
+    from opentelemetry import context
+    from opentelemetry.trace import Status, StatusCode
+
+    if exc is not None:
+        current.record_exception(exc)
+        current.set_status(Status(StatusCode.ERROR))
+    current.end()
+    context.detach(token)
+
+
+def init_tracing(app: Flask) -> None:
+    """
+    No-op unless TRACING is enabled. The OpenTelemetry SDK is only
+    imported (and the SQL listeners only installed) when it is.
+    """
+    global _tracer
+
+    if not app.config.get("TRACING"):
+        return
+
+    app.config.setdefault("TRACING_SAMPLE_RATIO", 0.05)
+    app.config.setdefault("TRACING_EXPORTER", "otlp")
+
+    _tracer = _tracer_provider(app).get_tracer("app")
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _on_error)
+
+    app.before_request(_start_request_span)
+    app.after_request(_record_status)
+    app.teardown_request(_end_request_span)
@@ -0,0 +1,351 @@
+# app/websocket.py
+
+"""
+WebSocket endpoint for doctor chat, served at the ASGI layer.
+
+Flask only speaks WSGI, and asgi.py runs it through a2wsgi, which cannot
+carry WebSockets. `with_websockets` therefore wraps the ASGI app:
+WebSocket connections to /ws/chat/sessions/<id> are handled here, on
+uvicorn's event loop, and everything else goes to Flask as before. The
+werkzeug dev server (run.py) serves no WebSockets; use uvicorn.
+
+    ws://host/ws/chat/sessions/<id>?token=<JWT>[&after=<ISO8601>]
+
+The JWT may also come in the Authorization header. Refused connections
+are accepted and closed at once with a code saying why: 4401 no valid
+token, 4403 doctor and patient no longer actively linked, 4404 not a
+participant of that doctor chat, 4409 chat closed. The link is checked
+again with every presence heartbeat; a connection whose link was
+deactivated meanwhile is closed with 4403.
+
+Server frames (JSON text):
+
+    {"type": "joined", "session": {...}, "presence": {user id: online}}
+    {"type": "message", "id", "session_id", "sender_type", "sender_id",
+     "content", "client_id", "created_at"}
+    {"type": "ack", "client_id", "id", "created_at"}   own message stored
+    {"type": "presence", "user_id", "status": "online" | "offline"}
+    {"type": "typing", "user_id"}
+    {"type": "closed"}                      chat closed; socket closes 1000
+    {"type": "error", "error", "client_id"?, "retry_after"?}
+    {"type": "pong"}
+
+Client frames:
+
+    {"type": "send", "content": "...", "client_id": "..."}
+    {"type": "typing"}
+    {"type": "ping"}
+
+With ?after=, the messages stored after that time (at most
+CHAT_HISTORY_LIMIT) follow "joined". The subscription starts first, so
+a message can arrive both ways; clients dedupe by id.
+
+Presence, the message rate limit and pub/sub talk to the shared store
+and Redis with blocking clients; those calls run in worker threads
+(asyncio.to_thread) so a slow store never stalls the event loop.
+
+Backpressure: every connection has an outbox filled by the chat bus and
+drained as fast as the client reads. A client that falls
+CHAT_SEND_QUEUE_SIZE frames behind, on top of what one write batch can
+deliver at once, is closed with 1013 (try again later) instead of
+buffering without bound; it reconnects with ?after= and catches up from
+the history.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+from datetime import datetime
+from time import monotonic
+from typing import Optional
+from urllib.parse import parse_qs
+from uuid import UUID
+
+import jwt
+from flask import Flask
+
+from app.async_db import async_session
+from app.services import chat
+from app.services.availability import aware
+from app.sql_models import ChatSession, User
+
+_CHAT_PATH = re.compile(r"/ws/chat/sessions/([0-9a-fA-F-]{36})/?")
+
+# Seconds a close frame may take to go out to a stuck client
+_CLOSE_TIMEOUT_SECONDS = 5
+# Typing frames relayed per connection, at most one per this many seconds
+_TYPING_INTERVAL_SECONDS = 1
+
+
+def with_websockets(flask_app: Flask, http_app):
+    """
+    ASGI app serving the chat WebSocket and passing all other traffic
+    to `http_app`.
+    """
+
+    async def app(scope, receive, send):
+        if scope["type"] != "websocket":
+            await http_app(scope, receive, send)
+            return
+        match = _CHAT_PATH.fullmatch(scope["path"])
+        if match is None:
+            await send({"type": "websocket.close", "code": 4404})
+            return
+        try:
+            session_id = UUID(match[1])
+        except ValueError:
+            await send({"type": "websocket.close", "code": 4404})
+            return
+        await _ChatSocket(flask_app, scope, receive, send, session_id).run()
+
+    return app
+
+
+def _user_id_from(scope) -> Optional[str]:
+    from app.routes.routes_auth import JWT_ALG, JWT_SECRET
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    token = (query.get("token") or [""])[0]
+    if not token:
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(b"authorization", b"").decode().replace("Bearer ", "").strip()
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG]).get("user_id")
+    except jwt.PyJWTError:
+        return None
+
+
+class _ChatSocket:
+    def __init__(self, flask_app: Flask, scope, receive, send, session_id: UUID):
+        self.flask_app = flask_app
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.session_id = session_id
+        self.user: Optional[User] = None
+        self.role: Optional[str] = None
+        self.outbox: Optional[asyncio.Queue] = None
+        # (code, reason) once the server decides to close
+        self.close_with: Optional[tuple[int, str]] = None
+        self.stop = asyncio.Event()
+        self.client_gone = False
+        self.chat_closed = False
+        self.typing_at = 0.0
+        self.acks: set = set()
+
+    async def run(self) -> None:
+        if (await self.receive())["type"] != "websocket.connect":
+            return
+        with self.flask_app.app_context():
+            session, code = await self._authorize()
+            await self._send({"type": "websocket.accept"})
+            if code:
+                await self._send({"type": "websocket.close", "code": code})
+                return
+            await self._serve(session)
+
+    async def _authorize(self) -> tuple[Optional[ChatSession], Optional[int]]:
+        user_id = _user_id_from(self.scope)
+        if not user_id:
+            return None, 4401
+        async with async_session() as db_session:
+            self.user = await db_session.get(User, user_id)
+            session = await db_session.get(ChatSession, self.session_id)
+        if self.user is None:
+            return None, 4401
+        self.role = chat.participant_role(self.user, session)
+        if self.role is None:
+            return None, 4404
+        if not await self._linked(session):
+            return None, 4403
+        if session.closed_at is not None:
+            return None, 4409
+        return session, None
+
+    async def _linked(self, session: ChatSession) -> bool:
+        async with async_session() as db_session:
+            link = (await db_session.execute(chat.active_link(session.doctor_id, session.patient_id))).first()
+        return link is not None
+
+    async def _serve(self, session: ChatSession) -> None:
+        from app.metrics import CHAT_CONNECTIONS
+
+        config = self.flask_app.config
+        loop = asyncio.get_running_loop()
+        # A write batch lands at once: its messages plus this device's acks
+        self.outbox = asyncio.Queue(maxsize=config["CHAT_SEND_QUEUE_SIZE"] + 2 * config["CHAT_WRITE_BATCH_SIZE"])
+
+        # Events published before "joined" has gone out wait here
+        held: Optional[list] = []
+
+        def hand_over(event: dict) -> None:
+            if held is None:
+                self._offer(event)
+            else:
+                held.append(event)
+
+        def deliver(event: dict) -> None:
+            # Any thread (writer, pub/sub listener): hand over to the loop
+            loop.call_soon_threadsafe(hand_over, event)
+
+        unsubscribe = chat.bus().subscribe(chat.topic(session.id), deliver)
+        CHAT_CONNECTIONS.inc()
+        try:
+            await asyncio.to_thread(chat.connected, session.id, self.user.id)
+            presence = await asyncio.to_thread(chat.presence, session)
+            self._offer({"type": "joined", "session": chat.session_dict(session), "presence": presence})
+            early, held = held, None
+            for event in early:
+                self._offer(event)
+            await self._catch_up(session)
+
+            tasks = [
+                asyncio.create_task(self._read()),
+                asyncio.create_task(self._write()),
+                asyncio.create_task(self._heartbeat(session)),
+                asyncio.create_task(self.stop.wait()),
+            ]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending | self.acks:
+                task.cancel()
+            await asyncio.gather(*pending, *self.acks, return_exceptions=True)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None and not self.client_gone:
+                    print("chat socket error:", session.id, task.exception())
+                    self.close_with = self.close_with or (1011, "server error")
+        finally:
+            unsubscribe()
+            try:
+                await asyncio.to_thread(chat.disconnected, session.id, self.user.id)
+            finally:
+                CHAT_CONNECTIONS.dec()
+            if not self.client_gone:
+                code, reason = self.close_with or (1000, "")
+                try:
+                    await asyncio.wait_for(
+                        self._send({"type": "websocket.close", "code": code, "reason": reason}),
+                        _CLOSE_TIMEOUT_SECONDS,
+                    )
+                except Exception:
+                    pass
+
+    async def _catch_up(self, session: ChatSession) -> None:
+        query = dict(parse_qs(self.scope.get("query_string", b"").decode()))
+        after = (query.get("after") or [""])[0]
+        if not after:
+            return
+        try:
+            after_time = aware(datetime.fromisoformat(after))
+        except ValueError:
+            self._offer({"type": "error", "error": "Invalid after"})
+            return
+        limit = self.flask_app.config["CHAT_HISTORY_LIMIT"]
+        async with async_session() as db_session:
+            messages = (await db_session.scalars(chat.history_query(session.id, after=after_time, limit=limit))).all()
+        for message in messages:
+            self._offer(chat.row_event(message))
+
+    def _offer(self, event: dict) -> None:
+        """
+        Queue a frame for this client; close it when the outbox is full.
+        """
+        if self.stop.is_set():
+            return
+        if event["type"] == "closed":
+            self.chat_closed = True
+        try:
+            self.outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            from app.metrics import CHAT_DISCONNECTS
+
+            CHAT_DISCONNECTS.labels("slow_consumer").inc()
+            self.close_with = (1013, "too far behind; reconnect with ?after=")
+            self.stop.set()
+
+    async def _write(self) -> None:
+        while True:
+            event = await self.outbox.get()
+            await self._send({"type": "websocket.send", "text": json.dumps(event)})
+            if event["type"] == "closed":
+                self.close_with = (1000, "chat closed")
+                return
+
+    async def _heartbeat(self, session: ChatSession) -> None:
+        interval = max(self.flask_app.config["CHAT_PRESENCE_TTL_SECONDS"] / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(chat.heartbeat, self.session_id, self.user.id)
+            if not await self._linked(session):
+                self.close_with = (4403, "no active link")
+                return
+
+    async def _read(self) -> None:
+        while True:
+            message = await self.receive()
+            if message["type"] == "websocket.disconnect":
+                self.client_gone = True
+                return
+            text = message.get("text")
+            if text is None:
+                text = (message.get("bytes") or b"").decode("utf-8", "replace")
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                self._offer({"type": "error", "error": "Frames must be JSON objects"})
+                continue
+
+            kind = frame.get("type")
+            if kind == "send":
+                await self._submit(frame)
+            elif kind == "typing":
+                if monotonic() - self.typing_at < _TYPING_INTERVAL_SECONDS:
+                    continue
+                self.typing_at = monotonic()
+                await asyncio.to_thread(
+                    chat.bus().publish,
+                    chat.topic(self.session_id),
+                    {"type": "typing", "session_id": str(self.session_id), "user_id": str(self.user.id)},
+                )
+            elif kind == "ping":
+                self._offer({"type": "pong"})
+            else:
+                self._offer({"type": "error", "error": "Unknown frame type"})
+
+    async def _submit(self, frame: dict) -> None:
+        client_id = frame.get("client_id")
+        try:
+            client_id = chat.validate_client_id(client_id)
+            content = chat.validate_content(frame.get("content"))
+        except ValueError as e:
+            self._offer({"type": "error", "error": str(e), "client_id": client_id if isinstance(client_id, str) else None})
+            return
+        if self.chat_closed:
+            self._offer({"type": "error", "error": "Chat session is closed", "client_id": client_id})
+            return
+
+        wait = await asyncio.to_thread(chat.message_wait, self.user.id)
+        if wait > 0:
+            self._offer({"type": "error", "error": "Too many messages", "client_id": client_id, "retry_after": wait})
+            return
+        try:
+            future = chat.submit(self.session_id, self.role, self.user.id, content, client_id)
+        except chat.WriterBusy as e:
+            self._offer({"type": "error", "error": str(e), "client_id": client_id})
+            return
+        task = asyncio.create_task(self._ack(future, client_id))
+        self.acks.add(task)
+        task.add_done_callback(self.acks.discard)
+
+    async def _ack(self, future, client_id: Optional[str]) -> None:
+        try:
+            event = await asyncio.wrap_future(future)
+        except RuntimeError as e:
+            self._offer({"type": "error", "error": str(e), "client_id": client_id})
+            return
+        self._offer({"type": "ack", "client_id": client_id, "id": event["id"], "created_at": event["created_at"]})
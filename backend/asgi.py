@@ -0,0 +1,47 @@
+"""
+ASGI entrypoint.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+The AI-heavy blueprints (/nurse, /patient/ai, /intake, /analyze) are async
+views: their DB queries, central backend, OpenRouter and tone model calls
+are awaited instead of blocking. Flask is still a WSGI framework, so each
+in-flight request is parked on a thread from the pool below while its
+coroutine waits on I/O; those threads are idle, so the pool can be sized
+for hundreds of concurrent AI conversations (ASGI_WSGI_THREADS).
+
+Doctor chat WebSockets (/ws/chat/sessions/<id>) never reach Flask: they
+are served on the event loop by app/websocket.py. uvicorn needs the
+`websockets` package for them.
+
+Database connections per worker process, at most:
+
+    sync pool         5 + 10 overflow (SQLAlchemy defaults), plus the
+                      same again for DATABASE_REPLICA_URL
+    async sessions    ASYNC_DB_MAX_CONNECTIONS (default 10), plus the
+                      same again for the replica
+
+Background workers (AI_JOB_WORKERS, EXPORT_WORKERS, ...) take their
+connections from the sync pool. Async views and WebSockets wait for a
+free async slot rather than opening more, so concurrent conversations
+do not multiply connections: each async session is held for a few
+queries, never across a model call or a WebSocket's lifetime. Keep
+`--workers` x the sum below the server's max_connections.
+"""
+
+import os
+
+from a2wsgi import WSGIMiddleware
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app  # noqa: E402
+from app.websocket import with_websockets  # noqa: E402
+
+flask_app = create_app()
+
+app = with_websockets(
+    flask_app,
+    WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", "256"))),
+)
@@ -0,0 +1,342 @@
+# benchmarks/fakes.py
+
+"""
+Latency-simulating stand-ins for the remote services Viora calls:
+
+- central backend:  POST /doctor/ask-nurse          (CENTRAL_BACKEND_URL)
+- OpenAI:           POST /v1/chat/completions       (TONE_AI_BASE_URL=<url>/v1)
+- OpenRouter:       POST /api/v1/chat/completions   (OPENROUTER_BASE_URL=<url>/api/v1)
+
+Each server samples its response time from a configurable distribution,
+injects errors at a configurable rate and (for the chat completion fakes)
+honours `stream: true` with server-sent events.
+
+    python -m benchmarks.fakes --central-latency lognormal:900:0.5 \\
+        --openai-latency lognormal:1200:0.4 --error-rate 0.01
+
+Latency specs:
+    const:MS                 fixed delay
+    uniform:LO_MS:HI_MS      uniform between LO and HI
+    normal:MEAN_MS:SD_MS     normal, clipped at 0
+    lognormal:MEDIAN_MS:SIGMA
+    pareto:SCALE_MS:ALPHA    heavy tail
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Turn a latency spec (see module docstring) into a sampler returning seconds.
+    """
+    kind, *raw = spec.split(":")
+    args = [float(a) for a in raw]
+
+    if kind == "const":
+        (ms,) = args
+        return lambda rng: ms / 1000
+    if kind == "uniform":
+        lo, hi = args
+        return lambda rng: rng.uniform(lo, hi) / 1000
+    if kind == "normal":
+        mean, sd = args
+        return lambda rng: max(0.0, rng.gauss(mean, sd)) / 1000
+    if kind == "lognormal":
+        median, sigma = args
+        mu = math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma) / 1000
+    if kind == "pareto":
+        scale, alpha = args
+        return lambda rng: scale * rng.paretovariate(alpha) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@dataclass
+class FakeBehaviour:
+    latency: str = "const:0"
+    error_rate: float = 0.0
+    # Share of errors that drop the connection instead of returning 5xx
+    reset_share: float = 0.2
+    # Delay between streamed chunks
+    chunk_latency: str = "const:25"
+    seed: Optional[int] = None
+    _rng: random.Random = field(init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._sample = parse_latency(self.latency)
+        self._sample_chunk = parse_latency(self.chunk_latency)
+
+    def delay(self) -> float:
+        with self._lock:
+            return self._sample(self._rng)
+
+    def chunk_delay(self) -> float:
+        with self._lock:
+            return self._sample_chunk(self._rng)
+
+    def fault(self) -> Optional[str]:
+        """
+        None, "reset" or "5xx".
+        """
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            return "reset" if self._rng.random() < self.reset_share else "5xx"
+
+
+HIGH_RISK_TERMS = ("chest pain", "shortness of breath", "fainted", "bleeding")
+
+COMPLETION_TEXT = (
+    "I understand this can feel worrying. Mild dizziness is common in the "
+    "first days of a new medication. Stand up slowly, drink water, and tell "
+    "your doctor if it continues or gets worse."
+)
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    behaviour: FakeBehaviour
+    routes: dict
+
+    def log_message(self, format, *args):  # noqa: A002 - silence per-request logs
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        handler = self.routes.get(self.path.split("?", 1)[0])
+        payload = self._read_json()
+        if handler is None:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        fault = self.behaviour.fault()
+        time.sleep(self.behaviour.delay())
+        if fault == "reset":
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault == "5xx":
+            self._send_json(503, {"error": "injected failure"})
+            return
+
+        handler(self, payload)
+
+
+def _central_reply(handler: _FakeHandler, payload: dict) -> None:
+    text = " ".join(
+        [str(payload.get("message") or "")] + [str(s) for s in payload.get("symptoms") or []]
+    ).lower()
+    high = any(term in text for term in HIGH_RISK_TERMS)
+    handler._send_json(
+        200,
+        {
+            "risk_level": "HIGH" if high else "LOW",
+            "ai_explanation": COMPLETION_TEXT,
+            "confidence": 0.8,
+            "escalation": {"requires_doctor": high, "reason": "red_flag" if high else None},
+            "safety_flags": {"red_flag": high},
+            "clinical_signals": {"normalized_symptoms": payload.get("symptoms") or []},
+            "disclaimer": "This guidance is informational and not a medical diagnosis.",
+            "usage": {"prompt_tokens": 420, "completion_tokens": 140},
+        },
+    )
+
+
+def _chat_completion_reply(handler: _FakeHandler, payload: dict) -> None:
+    model = payload.get("model") or "fake-model"
+    wants_json = bool(payload.get("response_format"))
+    content = (
+        json.dumps({"explanation": COMPLETION_TEXT, "confidence": 0.8})
+        if wants_json
+        else COMPLETION_TEXT
+    )
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    usage = {"prompt_tokens": 180, "completion_tokens": len(content.split()), "total_tokens": 0}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not payload.get("stream"):
+        handler._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+        return
+
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.send_header("Connection", "close")
+    handler.end_headers()
+    handler.close_connection = True
+
+    def event(delta: dict, finish: Optional[str] = None, extra: Optional[dict] = None):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            **(extra or {}),
+        }
+        handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        handler.wfile.flush()
+
+    # Roughly token-sized pieces
+    words = content.split(" ")
+    event({"role": "assistant", "content": ""})
+    for i in range(0, len(words), 3):
+        time.sleep(handler.behaviour.chunk_delay())
+        piece = " ".join(words[i:i + 3])
+        event({"content": piece if i == 0 else " " + piece})
+    event({}, finish="stop", extra={"usage": usage})
+    handler.wfile.write(b"data: [DONE]\n\n")
+    handler.wfile.flush()
+
+
+@dataclass
+class FakeServer:
+    name: str
+    server: ThreadingHTTPServer
+    thread: threading.Thread
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_fake(name: str, routes: dict, behaviour: FakeBehaviour,
+               host: str = "127.0.0.1", port: int = 0) -> FakeServer:
+    handler = type(
+        f"{name.title()}Handler",
+        (_FakeHandler,),
+        {"behaviour": behaviour, "routes": routes},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name=f"fake-{name}", daemon=True)
+    thread.start()
+    return FakeServer(name, server, thread)
+
+
+def start_central(behaviour: FakeBehaviour, **kwargs) -> FakeServer:
+    return start_fake("central", {"/doctor/ask-nurse": _central_reply}, behaviour, **kwargs)
+
+
+def start_openai(behaviour: FakeBehaviour, **kwargs) -> FakeServer:
+    return start_fake("openai", {"/v1/chat/completions": _chat_completion_reply}, behaviour, **kwargs)
+
+
+def start_openrouter(behaviour: FakeBehaviour, **kwargs) -> FakeServer:
+    return start_fake(
+        "openrouter", {"/api/v1/chat/completions": _chat_completion_reply}, behaviour, **kwargs
+    )
+
+
+def app_env(central: FakeServer, openai: FakeServer, openrouter: FakeServer) -> dict:
+    """
+    Environment that points a Viora process at the fakes. Rate limiting
+    is off: the load steps would otherwise measure 429s.
+    """
+    return {
+        "RATE_LIMIT": "0",
+        "CENTRAL_BACKEND_URL": central.url,
+        "TONE_AI_BASE_URL": f"{openai.url}/v1",
+        "TONE_AI_API_KEY": "fake-key",
+        "OPENROUTER_BASE_URL": f"{openrouter.url}/api/v1",
+        "OPENROUTER_API_KEY": "fake-key",
+    }
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--central-latency", default="lognormal:900:0.5")
+    parser.add_argument("--openai-latency", default="lognormal:1200:0.4")
+    parser.add_argument("--openrouter-latency", default="lognormal:1500:0.5")
+    parser.add_argument("--chunk-latency", default="uniform:10:40", help="Per streamed chunk.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Applies to every fake.")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def start_fakes_from_args(args, host: str = "127.0.0.1", ports=(0, 0, 0)) -> list[FakeServer]:
+    def behaviour(latency: str) -> FakeBehaviour:
+        return FakeBehaviour(
+            latency=latency,
+            error_rate=args.error_rate,
+            chunk_latency=args.chunk_latency,
+            seed=args.seed,
+        )
+
+    return [
+        start_central(behaviour(args.central_latency), host=host, port=ports[0]),
+        start_openai(behaviour(args.openai_latency), host=host, port=ports[1]),
+        start_openrouter(behaviour(args.openrouter_latency), host=host, port=ports[2]),
+    ]
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_fake_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", default="7001,7002,7003", help="central,openai,openrouter")
+    args = parser.parse_args(argv)
+
+    ports = tuple(int(p) for p in args.ports.split(","))
+    fakes = start_fakes_from_args(args, host=args.host, ports=ports)
+    print("# Fakes running; export these for the Viora process:")
+    for key, value in app_env(*fakes).items():
+        print(f"export {key}={value}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for fake in fakes:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
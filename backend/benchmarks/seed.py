@@ -0,0 +1,240 @@
+# benchmarks/seed.py
+
+"""
+Seed a local database with realistic per-patient volumes.
+
+Rows are written with Core executemany inserts; going through the ORM
+would make seeding slower than the benchmarks themselves.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from uuid import UUID, uuid4
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.routes.routes_auth import create_token
+from app.sql_models import (
+    Appointment,
+    Doctor,
+    DoctorPatientLink,
+    Medication,
+    MedicationEvent,
+    Patient,
+    PatientReport,
+    User,
+)
+
+BENCH_PASSWORD = "bench-password"
+
+MEDICATION_NAMES = [
+    "Atorvastatin", "Metformin", "Amlodipine", "Lisinopril", "Omeprazole",
+    "Levothyroxine", "Metoprolol", "Losartan", "Aspirin", "Clopidogrel",
+]
+REPORT_TYPES = ["Lab Report", "Discharge Summary", "ECG", "X-Ray", "Prescription"]
+
+
+@dataclass
+class SeedScale:
+    patients: int = 1000
+    doctors: int = 50
+    medications_per_patient: int = 6
+    event_days: int = 14
+    doses_per_day: int = 2
+    appointments_per_patient: int = 12
+    reports_per_patient: int = 8
+
+
+@dataclass
+class BenchFixtures:
+    """
+    Ids and tokens the benchmark cases need. `patient` / `doctor` are
+    ordinary seeded accounts, not special-cased rows.
+    """
+
+    patient_id: UUID
+    patient_email: str
+    patient_token: str
+    doctor_id: UUID
+    doctor_token: str
+    medication_ids: list[UUID] = field(default_factory=list)
+    appointment_ids: list[UUID] = field(default_factory=list)
+    report_ids: list[UUID] = field(default_factory=list)
+    today_event_ids: list[UUID] = field(default_factory=list)
+
+
+def _insert(model, rows: list[dict], batch_size: int = 5000) -> None:
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(model.__table__.insert(), rows[start:start + batch_size])
+
+
+def reset_schema() -> None:
+    db.drop_all()
+    db.create_all()
+
+
+def seed(scale: SeedScale, rng: random.Random | None = None) -> BenchFixtures:
+    rng = rng or random.Random(42)
+    now = datetime.now(timezone.utc)
+    today = date.today()
+    # One hash for everyone: scrypt per user would dominate seeding time
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    users, patients, doctors, links = [], [], [], []
+    doctor_ids = [uuid4() for _ in range(scale.doctors)]
+    patient_ids = [uuid4() for _ in range(scale.patients)]
+
+    for i, doctor_id in enumerate(doctor_ids):
+        users.append(
+            {
+                "id": doctor_id,
+                "email": f"doctor{i}@bench.viora",
+                "password_hash": password_hash,
+                "role": "doctor",
+                "name": f"Dr. Bench {i}",
+                "is_email_verified": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        doctors.append(
+            {
+                "id": doctor_id,
+                "specialization": "Cardiology",
+                "clinic_name": f"Clinic {i % 7}",
+                "experience_years": 5 + i % 20,
+            }
+        )
+
+    for i, patient_id in enumerate(patient_ids):
+        users.append(
+            {
+                "id": patient_id,
+                "email": f"patient{i}@bench.viora",
+                "password_hash": password_hash,
+                "role": "patient",
+                "name": f"Patient {i}",
+                "phone": f"+1555{i:07d}",
+                "is_email_verified": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        patients.append(
+            {
+                "id": patient_id,
+                "date_of_birth": date(1940 + i % 60, 1 + i % 12, 1 + i % 28),
+                "gender": "female" if i % 2 else "male",
+                "medical_summary": "Post-discharge follow-up",
+            }
+        )
+        links.append(
+            {
+                "id": uuid4(),
+                "doctor_id": doctor_ids[i % scale.doctors],
+                "patient_id": patient_id,
+                "status": "active",
+                "created_at": now,
+            }
+        )
+
+    medications, events, appointments, reports = [], [], [], []
+    dose_hours = [8, 20, 14, 2][: scale.doses_per_day]
+
+    for patient_id in patient_ids:
+        for m in range(scale.medications_per_patient):
+            medication_id = uuid4()
+            medications.append(
+                {
+                    "id": medication_id,
+                    "patient_id": patient_id,
+                    "prescribed_by": rng.choice(doctor_ids),
+                    "name": MEDICATION_NAMES[m % len(MEDICATION_NAMES)],
+                    "dosage": f"{rng.choice([5, 10, 20, 40])} mg",
+                    "frequency": f"{scale.doses_per_day}x daily",
+                    "route": "oral",
+                    "start_date": today - timedelta(days=scale.event_days),
+                    "instructions": "Take after food",
+                    "is_active": True,
+                    "created_at": now - timedelta(days=scale.event_days),
+                }
+            )
+            for day in range(scale.event_days):
+                event_date = today - timedelta(days=scale.event_days - 1 - day)
+                for hour in dose_hours:
+                    scheduled = datetime.combine(
+                        event_date, time(hour), tzinfo=timezone.utc
+                    )
+                    taken = day < scale.event_days - 1 and rng.random() < 0.85
+                    events.append(
+                        {
+                            "id": uuid4(),
+                            "medication_id": medication_id,
+                            "patient_id": patient_id,
+                            "scheduled_time": scheduled,
+                            "taken_time": scheduled + timedelta(minutes=12) if taken else None,
+                            "status": "taken" if taken else "scheduled",
+                        }
+                    )
+
+        for a in range(scale.appointments_per_patient):
+            start = now + timedelta(days=rng.randint(-90, 60), hours=rng.randint(0, 8))
+            appointments.append(
+                {
+                    "id": uuid4(),
+                    "patient_id": patient_id,
+                    "doctor_id": rng.choice(doctor_ids),
+                    "start_time": start,
+                    "end_time": start + timedelta(minutes=30),
+                    "status": "completed" if start < now else "scheduled",
+                    "reason": "Follow-up",
+                    "created_at": now,
+                }
+            )
+
+        for r in range(scale.reports_per_patient):
+            reports.append(
+                {
+                    "id": uuid4(),
+                    "patient_id": patient_id,
+                    "uploaded_by": patient_id,
+                    "type": REPORT_TYPES[r % len(REPORT_TYPES)],
+                    "file_url": f"/bench/uploads/{patient_id}-{r}.pdf",
+                    "date": today - timedelta(days=rng.randint(0, 365)),
+                    "created_at": now,
+                }
+            )
+
+    _insert(User, users)
+    _insert(Patient, patients)
+    _insert(Doctor, doctors)
+    _insert(DoctorPatientLink, links)
+    _insert(Medication, medications)
+    _insert(MedicationEvent, events)
+    _insert(Appointment, appointments)
+    _insert(PatientReport, reports)
+    db.session.commit()
+
+    patient_id, doctor_id = patient_ids[0], doctor_ids[0]
+    patient_user = db.session.get(User, patient_id)
+    doctor_user = db.session.get(User, doctor_id)
+    today_start = datetime.combine(today, time.min, tzinfo=timezone.utc)
+
+    return BenchFixtures(
+        patient_id=patient_id,
+        patient_email=patient_user.email,
+        patient_token=create_token(patient_user),
+        doctor_id=doctor_id,
+        doctor_token=create_token(doctor_user),
+        medication_ids=[m["id"] for m in medications if m["patient_id"] == patient_id],
+        appointment_ids=[a["id"] for a in appointments if a["patient_id"] == patient_id],
+        report_ids=[r["id"] for r in reports if r["patient_id"] == patient_id],
+        today_event_ids=[
+            e["id"] for e in events
+            if e["patient_id"] == patient_id and e["scheduled_time"] >= today_start
+        ],
+    )
@@ -0,0 +1,120 @@
+# benchmarks/stubs.py
+
+"""
+In-process stand-ins for the remote AI services, so benchmarks measure
+Viora itself and not the central backend / OpenRouter / OpenAI.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from app.services import central_client, openrouter_provider, tone_transformer
+
+STUB_CENTRAL_RESULT = {
+    "risk_level": "LOW",
+    "ai_explanation": (
+        "Mild dizziness can happen when starting a new medication. "
+        "Stand up slowly and drink water."
+    ),
+    "confidence": 0.82,
+    "escalation": {"requires_doctor": False, "reason": None},
+    "safety_flags": {},
+    "clinical_signals": {"normalized_symptoms": ["dizziness"]},
+    "counselling": None,
+    "disclaimer": "This guidance is informational and not a medical diagnosis.",
+}
+
+
+def _completion(content: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=180, completion_tokens=60),
+    )
+
+
+class StubToneClient:
+    """
+    Duck-types `OpenAI().chat.completions.create` / the AsyncOpenAI variant.
+    """
+
+    def __init__(self, latency_s: float, is_async: bool = False):
+        self.latency_s = latency_s
+        create = self._acreate if is_async else self._create
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+    def _create(self, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return _completion("I'm here with you. " + kwargs["messages"][-1]["content"][:200])
+
+    async def _acreate(self, **kwargs):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return _completion("I'm here with you. " + kwargs["messages"][-1]["content"][:200])
+
+
+def _rebind(name: str, original, replacement) -> None:
+    """
+    Routes import services by name (`from ... import call_central_backend`),
+    so patch every already-imported app module that holds the original.
+    """
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith("app") or module is None:
+            continue
+        if getattr(module, name, None) is original:
+            setattr(module, name, replacement)
+
+
+def install_ai_stubs(latency_ms: float = 0.0) -> None:
+    """
+    Replace call_central_backend (sync + async), OpenRouterProvider.analyze
+    (sync + async) and the tone clients with canned, optionally delayed,
+    responses. Call after create_app() so the route modules are imported.
+    """
+    latency_s = latency_ms / 1000.0
+
+    def call_central_backend(payload: dict) -> dict:
+        if latency_s:
+            time.sleep(latency_s)
+        return dict(STUB_CENTRAL_RESULT)
+
+    async def acall_central_backend(payload: dict) -> dict:
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        return dict(STUB_CENTRAL_RESULT)
+
+    def analyze(self, clinical_signals: dict) -> dict:
+        if latency_s:
+            time.sleep(latency_s)
+        return {"explanation": STUB_CENTRAL_RESULT["ai_explanation"], "confidence": 0.8}
+
+    async def aanalyze(self, clinical_signals: dict) -> dict:
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        return {"explanation": STUB_CENTRAL_RESULT["ai_explanation"], "confidence": 0.8}
+
+    _rebind(
+        "call_central_backend",
+        central_client.call_central_backend,
+        call_central_backend,
+    )
+    _rebind(
+        "acall_central_backend",
+        central_client.acall_central_backend,
+        acall_central_backend,
+    )
+
+    openrouter_provider.OpenRouterProvider.analyze = analyze
+    openrouter_provider.OpenRouterProvider.aanalyze = aanalyze
+
+    sync_tone = StubToneClient(latency_s)
+    tone_transformer.get_client = lambda: sync_tone
+    async_tone = StubToneClient(latency_s, is_async=True)
+    tone_transformer.get_async_client = lambda: async_tone
+    # The async path checks for a key before handing the call to the
+    # engine loop; the stub above answers instead of a real client
+    tone_transformer.TONE_AI_API_KEY = "stub"
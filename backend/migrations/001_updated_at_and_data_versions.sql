@@ -0,0 +1,31 @@
+-- 001: updated_at tracking and version stamps for conditional GETs
+-- (app/services/data_versions.py)
+
+BEGIN;
+
+ALTER TABLE medications ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+UPDATE medications SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE medications ALTER COLUMN updated_at SET NOT NULL;
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+UPDATE appointments SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE appointments ALTER COLUMN updated_at SET NOT NULL;
+
+ALTER TABLE patient_reports ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+UPDATE patient_reports SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE patient_reports ALTER COLUMN updated_at SET NOT NULL;
+
+-- medication_events has no created_at to backfill from
+ALTER TABLE medication_events ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+UPDATE medication_events SET updated_at = now() WHERE updated_at IS NULL;
+ALTER TABLE medication_events ALTER COLUMN updated_at SET NOT NULL;
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    collection  varchar(50) NOT NULL,
+    scope       varchar(64) NOT NULL,
+    version     bigint      NOT NULL DEFAULT 0,
+    updated_at  timestamptz NOT NULL,
+    PRIMARY KEY (collection, scope)
+);
+
+COMMIT;
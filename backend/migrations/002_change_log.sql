@@ -0,0 +1,19 @@
+-- 002: per-patient change log behind GET /sync (app/services/change_log.py)
+-- Needs PostgreSQL 13+ for pg_current_xact_id() / pg_current_snapshot().
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id          bigserial   PRIMARY KEY,
+    patient_id  uuid        NOT NULL,
+    entity      varchar(30) NOT NULL,
+    entity_id   uuid        NOT NULL,
+    op          varchar(10) NOT NULL,
+    txid        bigint      NOT NULL DEFAULT (pg_current_xact_id()::text)::bigint,
+    changed_at  timestamptz NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_change_log_patient_txid
+    ON change_log (patient_id, txid, id);
+
+COMMIT;
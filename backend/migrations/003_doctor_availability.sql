@@ -0,0 +1,75 @@
+-- 003: doctor working hours and double-booking protection
+-- (app/services/availability.py)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS doctor_working_hours (
+    id            uuid        PRIMARY KEY,
+    doctor_id     uuid        NOT NULL REFERENCES doctors (id) ON DELETE CASCADE,
+    weekday       smallint    NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+    start_time    time        NOT NULL,
+    end_time      time        NOT NULL,
+    timezone      varchar(64) NOT NULL DEFAULT 'UTC',
+    slot_minutes  integer     NOT NULL DEFAULT 30,
+    created_at    timestamptz NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_doctor_working_hours_doctor_id
+    ON doctor_working_hours (doctor_id);
+
+CREATE INDEX IF NOT EXISTS ix_appointments_doctor_start
+    ON appointments (doctor_id, start_time);
+
+-- New bookings always get an end_time; give legacy rows the default length
+UPDATE appointments
+   SET end_time = start_time + interval '30 minutes'
+ WHERE end_time IS NULL;
+
+-- Overlapping active appointments for one doctor are rejected by the
+-- database itself (SQLSTATE 23P01), whatever code path writes them.
+-- btree_gist provides the uuid "=" operator class for GiST.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Exclusion constraints cannot be added NOT VALID, so existing overlaps
+-- must be resolved first; the block below stops with an error naming
+-- how many there are. List them with:
+--
+--   SELECT a.doctor_id, a.id, a.start_time, a.end_time, b.id, b.start_time, b.end_time
+--     FROM appointments a
+--     JOIN appointments b
+--       ON b.doctor_id = a.doctor_id AND b.id > a.id
+--      AND tstzrange(b.start_time, b.end_time, '[)') && tstzrange(a.start_time, a.end_time, '[)')
+--    WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+--      AND a.end_time IS NOT NULL AND b.end_time IS NOT NULL;
+--
+-- then cancel or move one side of each pair and run this file again.
+DO $$
+DECLARE
+    overlap_count bigint;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'appointments_no_overlap') THEN
+        RETURN;
+    END IF;
+
+    SELECT count(*) INTO overlap_count
+      FROM appointments a
+      JOIN appointments b
+        ON b.doctor_id = a.doctor_id AND b.id > a.id
+       AND tstzrange(b.start_time, b.end_time, '[)') && tstzrange(a.start_time, a.end_time, '[)')
+     WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+       AND a.end_time IS NOT NULL AND b.end_time IS NOT NULL;
+    IF overlap_count > 0 THEN
+        RAISE EXCEPTION '% overlapping active appointment pair(s); resolve them before adding appointments_no_overlap', overlap_count
+            USING HINT = 'See the query in the comment above this block in 003_doctor_availability.sql.';
+    END IF;
+
+    ALTER TABLE appointments
+        ADD CONSTRAINT appointments_no_overlap
+        EXCLUDE USING gist (
+            doctor_id WITH =,
+            tstzrange(start_time, end_time, '[)') WITH &&
+        )
+        WHERE (status <> 'cancelled' AND end_time IS NOT NULL);
+END
+$$;
+
+COMMIT;
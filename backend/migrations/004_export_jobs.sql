@@ -0,0 +1,28 @@
+-- 004: background exports for analytics (app/services/exports.py)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id            uuid         PRIMARY KEY,
+    requested_by  uuid         REFERENCES users (id) ON DELETE SET NULL,
+    doctor_id     uuid,
+    dataset       varchar(30)  NOT NULL,
+    format        varchar(10)  NOT NULL,
+    since         timestamptz,
+    until         timestamptz  NOT NULL,
+    status        varchar(20)  NOT NULL DEFAULT 'queued',
+    rows          bigint,
+    file_name     varchar(255),
+    error         text,
+    created_at    timestamptz  NOT NULL,
+    started_at    timestamptz,
+    finished_at   timestamptz
+);
+CREATE INDEX IF NOT EXISTS ix_export_jobs_requested_by ON export_jobs (requested_by);
+
+-- Incremental exports range-scan updated_at
+CREATE INDEX IF NOT EXISTS ix_medications_updated_at ON medications (updated_at);
+CREATE INDEX IF NOT EXISTS ix_medication_events_updated_at ON medication_events (updated_at);
+CREATE INDEX IF NOT EXISTS ix_appointments_updated_at ON appointments (updated_at);
+
+COMMIT;
@@ -0,0 +1,91 @@
+-- 005: monthly range partitions for medication_events and chat_messages
+-- (app/services/partitions.py)
+--
+-- Rebuilds both tables as partitioned tables and copies the rows over.
+-- Takes an exclusive lock on both for the duration; run in a maintenance
+-- window. Afterwards run `flask maintain-partitions` daily.
+
+BEGIN;
+
+-- ---------- medication_events ----------
+
+ALTER TABLE medication_events RENAME TO medication_events_unpartitioned;
+ALTER TABLE medication_events_unpartitioned RENAME CONSTRAINT medication_events_pkey
+    TO medication_events_unpartitioned_pkey;
+DROP INDEX IF EXISTS ix_medication_events_updated_at;
+
+CREATE TABLE medication_events (
+    LIKE medication_events_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, scheduled_time),
+    FOREIGN KEY (medication_id) REFERENCES medications (id) ON DELETE CASCADE,
+    FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+) PARTITION BY RANGE (scheduled_time);
+
+CREATE TABLE medication_events_default PARTITION OF medication_events DEFAULT;
+
+CREATE INDEX ix_medication_events_patient_scheduled ON medication_events (patient_id, scheduled_time);
+CREATE INDEX ix_medication_events_medication_id ON medication_events (medication_id);
+CREATE INDEX ix_medication_events_scheduled_brin ON medication_events USING brin (scheduled_time);
+CREATE INDEX ix_medication_events_updated_at ON medication_events (updated_at);
+
+-- ---------- chat_messages ----------
+
+ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned;
+ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey
+    TO chat_messages_unpartitioned_pkey;
+
+CREATE TABLE chat_messages (
+    LIKE chat_messages_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (session_id) REFERENCES chat_sessions (id) ON DELETE CASCADE,
+    FOREIGN KEY (sender_id) REFERENCES users (id) ON DELETE SET NULL
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT;
+
+CREATE INDEX ix_chat_messages_session_created ON chat_messages (session_id, created_at);
+CREATE INDEX ix_chat_messages_created_brin ON chat_messages USING brin (created_at);
+
+-- ---------- Monthly partitions: existing data through three months ahead ----------
+
+DO $$
+DECLARE
+    spec record;
+    first_month date;
+    month date;
+BEGIN
+    FOR spec IN
+        SELECT * FROM (VALUES
+            ('medication_events', 'scheduled_time'),
+            ('chat_messages', 'created_at')
+        ) AS t (tbl, col)
+    LOOP
+        EXECUTE format('SELECT date_trunc(''month'', min(%I) AT TIME ZONE ''UTC'')::date FROM %I',
+                       spec.col, spec.tbl || '_unpartitioned')
+            INTO first_month;
+        month := least(
+            coalesce(first_month, date_trunc('month', now() AT TIME ZONE 'UTC')::date),
+            date_trunc('month', now() AT TIME ZONE 'UTC')::date
+        );
+        WHILE month <= (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                spec.tbl || '_p' || to_char(month, 'YYYY_MM'),
+                spec.tbl,
+                month::text || ' 00:00:00+00',
+                (month + interval '1 month')::date::text || ' 00:00:00+00'
+            );
+            month := (month + interval '1 month')::date;
+        END LOOP;
+    END LOOP;
+END $$;
+
+-- ---------- Copy rows over ----------
+
+INSERT INTO medication_events SELECT * FROM medication_events_unpartitioned;
+DROP TABLE medication_events_unpartitioned;
+
+INSERT INTO chat_messages SELECT * FROM chat_messages_unpartitioned;
+DROP TABLE chat_messages_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- 006: token, cost and latency accounting for AI calls (app/services/usage.py)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS model_usage (
+    id                 bigserial     PRIMARY KEY,
+    bucket             timestamptz   NOT NULL,
+    route              varchar(100)  NOT NULL,
+    patient_id         varchar(64),
+    target             varchar(30)   NOT NULL,
+    model              varchar(100)  NOT NULL,
+    calls              integer       NOT NULL,
+    errors             integer       NOT NULL,
+    prompt_tokens      bigint        NOT NULL,
+    completion_tokens  bigint        NOT NULL,
+    cost_usd           double precision NOT NULL,
+    latency_ms_total   double precision NOT NULL,
+    latency_ms_max     double precision NOT NULL
+);
+
+-- Rows arrive in bucket order, so a BRIN index stays tiny
+CREATE INDEX IF NOT EXISTS ix_model_usage_bucket_brin
+    ON model_usage USING brin (bucket);
+CREATE INDEX IF NOT EXISTS ix_model_usage_patient_bucket
+    ON model_usage (patient_id, bucket);
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- 007: queued AI requests answered with 202 (app/services/ai_jobs.py)
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ai_jobs (
+    id               uuid          PRIMARY KEY,
+    kind             varchar(30)   NOT NULL,
+    owner            varchar(64),
+    route            varchar(100)  NOT NULL,
+    idempotency_key  varchar(255),
+    payload_hash     varchar(64)   NOT NULL,
+    payload          jsonb         NOT NULL,
+    status           varchar(20)   NOT NULL DEFAULT 'queued',
+    attempts         integer       NOT NULL DEFAULT 0,
+    result           jsonb,
+    error            text,
+    created_at       timestamptz   NOT NULL,
+    started_at       timestamptz,
+    finished_at      timestamptz,
+    expires_at       timestamptz
+);
+
+-- Workers claim from the unfinished jobs only
+CREATE INDEX IF NOT EXISTS ix_ai_jobs_pending
+    ON ai_jobs (created_at) WHERE status IN ('queued', 'running');
+CREATE UNIQUE INDEX IF NOT EXISTS ux_ai_jobs_idempotency
+    ON ai_jobs (kind, COALESCE(owner, ''), idempotency_key) WHERE idempotency_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_ai_jobs_expires_at ON ai_jobs (expires_at);
+
+COMMIT;
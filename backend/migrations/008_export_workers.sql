@@ -0,0 +1,15 @@
+-- 008: exports claimed by any worker, expiring with their files
+-- (app/services/exports.py)
+
+BEGIN;
+
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+
+-- Workers claim from the unfinished jobs only
+CREATE INDEX IF NOT EXISTS ix_export_jobs_pending
+    ON export_jobs (created_at) WHERE status IN ('queued', 'running');
+
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS expires_at timestamptz;
+CREATE INDEX IF NOT EXISTS ix_export_jobs_expires_at ON export_jobs (expires_at);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- 009: change_log retention (app/services/change_log.py)
+
+BEGIN;
+
+-- Retention deletes by age; rows are appended in time order
+CREATE INDEX IF NOT EXISTS ix_change_log_changed_at
+    ON change_log USING brin (changed_at);
+
+-- Newest (txid, id) deleted by retention; older sync tokens resync in full
+CREATE TABLE IF NOT EXISTS change_log_pruned (
+    id          smallint     PRIMARY KEY CHECK (id = 1),
+    txid        bigint       NOT NULL,
+    entry_id    bigint       NOT NULL,
+    pruned_at   timestamptz  NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,55 @@
+# tests/test_triage.py
+
+from __future__ import annotations
+
+import pytest
+
+from app.services import triage
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "no chest pain",
+        "I don't have chest pain",
+        "I had a stroke of luck",
+        "I hurt myself on the door",
+        "Chest pain is gone now",
+        "never passed out",
+        "No fever, no shortness of breath",
+    ],
+)
+def test_negated_or_ambiguous_mentions_are_not_high(message):
+    assert triage.assess(message).level != "HIGH"
+
+
+@pytest.mark.parametrize(
+    "message, symptom",
+    [
+        ("I have chest pain", "chest pain"),
+        ("I can't breathe", "shortness of breath"),
+        ("I think I'm having a stroke", "stroke signs"),
+        ("I want to hurt myself", "suicidal thoughts"),
+        ("no fever, but my chest hurts", "chest pain"),
+        ("I don't have a fever. Chest pain since this morning", "chest pain"),
+    ],
+)
+def test_affirmed_red_flags_are_high(message, symptom):
+    result = triage.assess(message)
+    assert result.level == "HIGH"
+    assert symptom in result.red_flags
+
+
+def test_negation_does_not_reach_past_its_window():
+    message = "no fever for the last couple of days and chest pain"
+    assert triage.assess(message).level == "HIGH"
+
+
+def test_structured_symptoms_use_the_same_scope():
+    assert triage.assess(symptoms=["no chest pain"]).level == "LOW"
+    assert triage.assess(symptoms=["chest pain"]).level == "HIGH"
+
+
+def test_non_text_input_is_ignored():
+    assert triage.assess(5, 7).level == "LOW"
+    assert triage.assess(symptoms=[1, "fever"]).level == "MEDIUM"